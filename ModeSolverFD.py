@@ -1,6 +1,8 @@
 import numpy as np
 from scipy import sparse
 from scipy.sparse import csr_matrix
+import scipy.sparse.linalg as sla
+from solver_events import print_progress, start_phase, end_phase, emit, count_matvecs
 
 def check_errors(n, lam, dx):
     if n.shape[1] != n.shape[0]:
@@ -18,7 +20,7 @@ def MatrixToColumn(M):
     C = M.reshape(-1,1)
     return C
 
-def initialize_parameters(n, lam, dx):
+def initialize_parameters(n, lam, dx, PML_Depth=10, PML_TargetLoss=1e-5, PML_PolyDegree=3):
     eps0 = 8.85e-12
     mu0 = 4 * np.pi * 10**-7
     c = 3e8
@@ -26,16 +28,12 @@ def initialize_parameters(n, lam, dx):
     f = c / lam
     w = 2 * np.pi * f
     k0 = 2 * np.pi / lam
-    PML_Depth = 10
-    PML_TargetLoss = 1e-5
-    PML_PolyDegree = 3
     PML_SigmaMax = (PML_PolyDegree + 1) / 2 * eps0 * c / PML_Depth / dx * np.log(1 / PML_TargetLoss)
     Epsr = n**2
     Epsr = MatrixToColumn(Epsr)
     return eps0, mu0, c, Nx, f, w, k0, PML_Depth, PML_TargetLoss, PML_PolyDegree, PML_SigmaMax, Epsr
 
 def calculate_Ux_Uy_Vx_Vy(Nx):
-    print('Calculating Ux, Uy, Vx, Vy...\n') 
     I = sparse.eye(Nx * Nx)
     I = sparse.csr_matrix(I)
     idx_x = 0
@@ -95,11 +93,8 @@ def calculate_Eps_values(i, Nx, Epsr):
         Epsz_i = Epsr[i - 1]
     return Epsx_i, Epsy_i, Epsz_i
 
-def ModeSolverFD(dx, n, lam, beta, NoModes):
-    check_errors(n, lam, dx)
-    eps0, mu0, c, Nx, f, w, k0, PML_Depth, PML_TargetLoss, PML_PolyDegree, PML_SigmaMax, Epsr = initialize_parameters(n, lam, dx)
+def assemble_operators(dx, Nx, Epsr, w, eps0, PML_Depth, PML_PolyDegree, PML_SigmaMax):
     I, idx_x, idx_y, Epsx, Epsy, Epsz, Ax_idxi, Ax_idxj, Ax_vals, Ay_idxi, Ay_idxj, Ay_vals, Bx_idxi, Bx_idxj, Bx_vals, By_idxi, By_idxj, By_vals, Cx_idxi, Cx_idxj, Cx_vals, Cy_idxi, Cy_idxj, Cy_vals, Dx_idxi, Dx_idxj, Dx_vals, Dy_idxi, Dy_idxj, Dy_vals = calculate_Ux_Uy_Vx_Vy(Nx)
-  
     for i in range(1,Nx*Nx+1):
         idx_x, idx_y, West_Dist, North_Dist, East_Dist, South_Dist = calculate_index_distances(Nx, idx_x, idx_y)
         Epsx[:, i - 1], Epsy[:, i - 1], Epsz[:, i - 1] = calculate_Eps_values(i, Nx, Epsr)
@@ -271,8 +266,9 @@ def ModeSolverFD(dx, n, lam, beta, NoModes):
     By = By/dx
     Cy = Cy/dx 
     Dy = Dy/dx
-    ## Qxx, Qyy, Qxy, Qyx
-    print('Calculating Qs...\n')
+    return I, Ax, Ay, Bx, By, Cx, Cy, Dx, Dy, Epsx, Epsy, invEpsz
+
+def calculate_Qs(k0, I, Ax, Ay, Bx, By, Cx, Cy, Dx, Dy, Epsx, Epsy, invEpsz):
     Qxx = -k0**(-2)*Ax*Dy*Cx*invEpsz*By + (Epsy + k0**(-2)*Ax*Dx)*(k0**2*I+Cy*invEpsz*By)
     Qyy = -k0**(-2)*Ay*Dx*Cy*invEpsz*Bx + (Epsx + k0**(-2)*Ay*Dy)*(k0**2*I+Cx*invEpsz*Bx)
     Qxy = k0**(-2)*Ax*Dy*(k0**2*I + Cx*invEpsz*Bx) - (Epsy + k0**(-2)*Ax*Dx)*Cy*invEpsz*Bx
@@ -280,13 +276,19 @@ def ModeSolverFD(dx, n, lam, beta, NoModes):
     QxxQxy = sparse.hstack([Qxx, Qxy])
     QyxQyy = sparse.hstack([Qyx, Qyy])
     Q = sparse.vstack([QxxQxy, QyxQyy])
-    ## Diagonalisation
-    print('Taking Eigenvalues and Eigenvectors...\n')
-    import scipy.sparse.linalg as sla
-    eigvalues, eigvectors = sla.eigs(Q, k = NoModes, sigma = beta**2)
+    return Q
+
+def factorize_Q(Q, sigma):
+    lu = sla.splu((Q - sigma * sparse.eye(Q.shape[0])).tocsc())
+    OPinv = sla.LinearOperator(Q.shape, matvec=lu.solve, dtype=complex)
+    return lu, OPinv
+
+def solve_eigenmodes(Q, NoModes, sigma, OPinv=None, v0=None):
+    eigvalues, eigvectors = sla.eigs(Q, k = NoModes, sigma = sigma, OPinv = OPinv, v0 = v0)
+    return eigvalues, eigvectors
+
+def calculate_fields(eigvalues, eigvectors, Nx, NoModes, w, eps0, mu0, Ax, Ay, Bx, By, Dx, Dy, invEpsz):
     beta = np.sqrt(np.diag(eigvalues))
-    # Ex, Ey, Ez
-    print('Calculating Ex, Ey, Ez, Hx, Hy, Hz...\n')
     Ex = np.zeros((Nx*Nx, NoModes), dtype=complex)
     Ey = np.zeros((Nx*Nx, NoModes), dtype=complex)
     Ez = np.zeros((Nx*Nx, NoModes), dtype=complex)
@@ -301,7 +303,6 @@ def ModeSolverFD(dx, n, lam, beta, NoModes):
         Ex[:,i] = (1j*w*mu0*Hy[:,i] - Ax*Ez[:,i])/1j/beta[i][i]
         Hz[:,i] = -(-By*Ex[:,i] + Bx*Ey[:,i])/1j/w/mu0    
     ## Results
-    RetVal = {}
     RetVal_Ex = {}
     RetVal_Ey = {}
     RetVal_Ez = {}
@@ -323,6 +324,33 @@ def ModeSolverFD(dx, n, lam, beta, NoModes):
         RetVal_Habs[i] = np.sqrt(abs(RetVal_Hx[i])**2 + 
                                       abs(RetVal_Hy[i])**2 + 
                                       abs(RetVal_Hz[i])**2) 
+    return beta, RetVal_Ex, RetVal_Ey, RetVal_Ez, RetVal_Hx, RetVal_Hy, RetVal_Hz, RetVal_Eabs, RetVal_Habs
+
+def ModeSolverFD(dx, n, lam, beta, NoModes, PML_Depth=10, PML_TargetLoss=1e-5, PML_PolyDegree=3, v0=None, progress=print_progress):
+    solve_started = start_phase(None, 'solve')
+    check_errors(n, lam, dx)
+    eps0, mu0, c, Nx, f, w, k0, PML_Depth, PML_TargetLoss, PML_PolyDegree, PML_SigmaMax, Epsr = initialize_parameters(n, lam, dx, PML_Depth, PML_TargetLoss, PML_PolyDegree)
+    started = start_phase(progress, 'assembly', Nx=Nx)
+    I, Ax, Ay, Bx, By, Cx, Cy, Dx, Dy, Epsx, Epsy, invEpsz = assemble_operators(dx, Nx, Epsr, w, eps0, PML_Depth, PML_PolyDegree, PML_SigmaMax)
+    end_phase(progress, started, cells=Nx*Nx)
+    started = start_phase(progress, 'Q_construction')
+    Q = calculate_Qs(k0, I, Ax, Ay, Bx, By, Cx, Cy, Dx, Dy, Epsx, Epsy, invEpsz)
+    end_phase(progress, started, Q_shape=Q.shape, nnz_Q=Q.nnz)
+    ## Diagonalisation
+    started = start_phase(progress, 'factorization')
+    lu, OPinv = factorize_Q(Q, beta**2)
+    end_phase(progress, started, nnz_LU=lu.L.nnz + lu.U.nnz)
+    started = start_phase(progress, 'eigensolve', NoModes=NoModes, warm_start=v0 is not None)
+    OPinv, counter = count_matvecs(OPinv)
+    eigvalues, eigvectors = solve_eigenmodes(Q, NoModes, beta**2, OPinv, v0)
+    end_phase(progress, started, arpack_matvecs=counter['matvecs'])
+    started = start_phase(progress, 'field_reconstruction')
+    beta, RetVal_Ex, RetVal_Ey, RetVal_Ez, RetVal_Hx, RetVal_Hy, RetVal_Hz, RetVal_Eabs, RetVal_Habs = calculate_fields(eigvalues, eigvectors, Nx, NoModes, w, eps0, mu0, Ax, Ay, Bx, By, Dx, Dy, invEpsz)
+    end_phase(progress, started)
+    solve_event = end_phase(None, solve_started)
+    emit(progress, dict(solve_event, event='solve_end', Nx=Nx, NoModes=NoModes))
+    ## Results
+    RetVal = {}
     RetVal['beta'] = beta    
     RetVal['n'] = n
     RetVal['dx'] = dx
@@ -333,5 +361,7 @@ def ModeSolverFD(dx, n, lam, beta, NoModes):
     RetVal['PML_TargetLoss'] = PML_TargetLoss
     RetVal['PML_PolyDegree'] = PML_PolyDegree
     RetVal['PML_SigmaMax'] = PML_SigmaMax
+    RetVal['eigvalues'] = eigvalues
+    RetVal['eigvectors'] = eigvectors
     return RetVal, RetVal_Ex, RetVal_Ey, RetVal_Ez, \
     RetVal_Hx, RetVal_Hy, RetVal_Hz, RetVal_Eabs, RetVal_Habs
@@ -2,6 +2,29 @@
 import h5py
 import matplotlib.pyplot as plt
 import numpy as np
+from spectra_writer import read_spectra, read_saturated
+
+def load_spectra_file(filename):
+    # Wavelengths, one intensity row per spectrum and the timestamps, from either layout:
+    # a streamed SpectraWriter file (one intensities dataset) or an older file with one
+    # "Spectrum_%03d" group per spectrum, whose intensities may be a seabreeze spectrum()
+    # array with the wavelengths in row 0. Spectra flagged as saturated are left out.
+    with h5py.File(filename, "r") as file:
+        if "intensities" in file:
+            wavelengths, intensities, timestamps = read_spectra(file)
+            keep = ~read_saturated(file)
+            if not np.all(keep):
+                print(f"Skipping {np.sum(~keep)} saturated spectra in {filename}")
+            return wavelengths, intensities[keep], timestamps[keep]
+        names = sorted((name for name in file if name.startswith("Spectrum_")), key=lambda name: int(name.split("_")[1]))
+        wavelengths = file[names[0]]["wavelengths"][:]
+        rows = []
+        timestamps = []
+        for name in names:
+            intensities = file[name]["intensities"][:]
+            rows.append(intensities[1] if intensities.ndim == 2 else intensities)
+            timestamps.append(file[name]["timestamp"][()])
+    return wavelengths, np.array(rows), np.array(timestamps)
 
 def plot_spectrum(wavelengths, intensities, x_label, y_label, title, legend_label=None):
     fig, ax = plt.subplots(figsize=(8, 6), dpi=600)
@@ -46,108 +69,79 @@ def plot_normalized_transmission(filename):
                   "Normalized Transmission vs. Wavelength", "Normalized Transmission (%)")
 
 def plot_individual_spectra_normalized(filename_individual_spectra, filename_averaged_spectrum_without_fiber):
-    with h5py.File(filename_individual_spectra, "r") as file_individual:
-        num_spectra = len(file_individual.keys())
-        with h5py.File(filename_averaged_spectrum_without_fiber, "r") as file_averaged:
-            averaged_intensities = file_averaged["averaged_intensities"][:]
-        fig_wavelengths, ax_wavelengths = plt.subplots(figsize=(8, 6), dpi=600)
-        ax_wavelengths.set_xlabel("Wavelength (nm)", fontsize=14, fontweight="bold")
-        ax_wavelengths.set_ylabel("Normalized Intensity (%)", fontsize=14, fontweight="bold")
-        ax_wavelengths.set_title("Normalized Individual Spectra", fontsize=16, fontweight="bold")
-        ax_wavelengths.tick_params(axis="both", which="major", labelsize=12, direction="in")
-        ax_wavelengths.grid(color="gray", linestyle="--", linewidth=0.5)
-        fig_wavenumbers, ax_wavenumbers = plt.subplots(figsize=(8, 6), dpi=600)
-        ax_wavenumbers.set_xlabel("Wavenumber (cm$^{-1}$)", fontsize=14, fontweight="bold")
-        ax_wavenumbers.set_ylabel("Normalized Intensity (%)", fontsize=14, fontweight="bold")
-        ax_wavenumbers.set_title("Normalized Individual Spectra", fontsize=16, fontweight="bold")
-        ax_wavenumbers.tick_params(axis="both", which="major", labelsize=12, direction="in")
-        ax_wavenumbers.grid(color="gray", linestyle="--", linewidth=0.5)
-        for i in range(num_spectra):
-            group_name = f"Spectrum_{i+1:03d}"
-            group = file_individual[group_name]
-            wavelengths = group["wavelengths"][:]
-            intensities = group["intensities"][:]
-            wavenumbers = 1 / (wavelengths * 1e-2)
-            normalized_intensity = 100 * np.abs(intensities[1] - averaged_intensities) / max(np.abs(intensities[1] - averaged_intensities))
-            ax_wavelengths.plot(wavelengths, normalized_intensity, label=f"Spectrum {i+1}")
-            ax_wavenumbers.plot(wavenumbers, normalized_intensity, label=f"Spectrum {i+1}")
-        ax_wavelengths.legend(loc="upper right", fontsize=8)
-        ax_wavenumbers.legend(loc="upper right", fontsize=8)
-        plt.show()
+    wavelengths, spectra, timestamps = load_spectra_file(filename_individual_spectra)
+    with h5py.File(filename_averaged_spectrum_without_fiber, "r") as file_averaged:
+        averaged_intensities = file_averaged["averaged_intensities"][:]
+    fig_wavelengths, ax_wavelengths = plt.subplots(figsize=(8, 6), dpi=600)
+    ax_wavelengths.set_xlabel("Wavelength (nm)", fontsize=14, fontweight="bold")
+    ax_wavelengths.set_ylabel("Normalized Intensity (%)", fontsize=14, fontweight="bold")
+    ax_wavelengths.set_title("Normalized Individual Spectra", fontsize=16, fontweight="bold")
+    ax_wavelengths.tick_params(axis="both", which="major", labelsize=12, direction="in")
+    ax_wavelengths.grid(color="gray", linestyle="--", linewidth=0.5)
+    fig_wavenumbers, ax_wavenumbers = plt.subplots(figsize=(8, 6), dpi=600)
+    ax_wavenumbers.set_xlabel("Wavenumber (cm$^{-1}$)", fontsize=14, fontweight="bold")
+    ax_wavenumbers.set_ylabel("Normalized Intensity (%)", fontsize=14, fontweight="bold")
+    ax_wavenumbers.set_title("Normalized Individual Spectra", fontsize=16, fontweight="bold")
+    ax_wavenumbers.tick_params(axis="both", which="major", labelsize=12, direction="in")
+    ax_wavenumbers.grid(color="gray", linestyle="--", linewidth=0.5)
+    wavenumbers = 1 / (wavelengths * 1e-2)
+    for i, intensities in enumerate(spectra):
+        normalized_intensity = 100 * np.abs(intensities - averaged_intensities) / max(np.abs(intensities - averaged_intensities))
+        ax_wavelengths.plot(wavelengths, normalized_intensity, label=f"Spectrum {i+1}")
+        ax_wavenumbers.plot(wavenumbers, normalized_intensity, label=f"Spectrum {i+1}")
+    ax_wavelengths.legend(loc="upper right", fontsize=8)
+    ax_wavenumbers.legend(loc="upper right", fontsize=8)
+    plt.show()
 
 def extract_and_plot_effective_intensity_vs_time(filename, target_wavelength, filename_averaged_spectrum_without_fiber):
-    with h5py.File(filename, "r") as file:
-        num_spectra = len(file.keys())
-        with h5py.File(filename_averaged_spectrum_without_fiber, "r") as file_averaged:
-            averaged_intensities = file_averaged["averaged_intensities"][:]
-        extracted_intensities = []
-        timestamps = []
-        for i in range(num_spectra):
-            group_name = f"Spectrum_{i+1:03d}"
-            group = file[group_name]
-            wavelengths = group["wavelengths"][:]
-            intensities = group["intensities"][:]
-            timestamp = group["timestamp"][()]
-            wavelength_index = (np.abs(wavelengths - target_wavelength)).argmin()
-            intensity_at_wavelength = np.abs(intensities[1, wavelength_index] - averaged_intensities[wavelength_index])
-            if i > 0:
-                extracted_intensities.append(intensity_at_wavelength)
-                timestamps.append(timestamp)
-        time_elapsed_ms = [(timestamp - timestamps[0]) * 1000 for timestamp in timestamps]
-        plot_spectrum(time_elapsed_ms, extracted_intensities, "Time Elapsed (ms)",
-                      f"Effective Intensity at {target_wavelength} nm",
-                      f"Effective Intensity vs Time at {target_wavelength} nm")
+    wavelengths, spectra, timestamps = load_spectra_file(filename)
+    with h5py.File(filename_averaged_spectrum_without_fiber, "r") as file_averaged:
+        averaged_intensities = file_averaged["averaged_intensities"][:]
+    wavelength_index = (np.abs(wavelengths - target_wavelength)).argmin()
+    # The first spectrum is left out, as before
+    extracted_intensities = np.abs(spectra[1:, wavelength_index] - averaged_intensities[wavelength_index])
+    timestamps = timestamps[1:]
+    time_elapsed_ms = [(timestamp - timestamps[0]) * 1000 for timestamp in timestamps]
+    plot_spectrum(time_elapsed_ms, extracted_intensities, "Time Elapsed (ms)",
+                  f"Effective Intensity at {target_wavelength} nm",
+                  f"Effective Intensity vs Time at {target_wavelength} nm")
 
 def extract_and_plot_intensity_vs_time_range(filename, start_wavelength, end_wavelength, num_points,
                                              filename_averaged_spectrum_without_fiber):
     wavelength_range = np.linspace(start_wavelength, end_wavelength, num_points)
-    with h5py.File(filename, "r") as file:
-        num_spectra = len(file.keys())
-        with h5py.File(filename_averaged_spectrum_without_fiber, "r") as file_averaged:
-            averaged_intensities = file_averaged["averaged_intensities"][:]
-        timestamps = []
-        wavelengths = file["Spectrum_001/wavelengths"][:]
-        wavelength_indices = [np.abs(wavelengths - wavelength).argmin() for wavelength in wavelength_range]
-        extracted_effective_intensities = []
-        extracted_normalized_intensities = []
-        for i in range(num_spectra):
-            group_name = f"Spectrum_{i+1:03d}"
-            group = file[group_name]
-            intensities = group["intensities"][:]
-            timestamp = group["timestamp"][()]
-            intensities_at_range = intensities[1, wavelength_indices]
-            effective_intensities_at_range = np.abs(intensities_at_range - averaged_intensities[wavelength_indices])
-            normalized_intensity_at_range = 100 * effective_intensities_at_range / np.max(effective_intensities_at_range)
-            if i > 0:
-                extracted_effective_intensities.append(effective_intensities_at_range)
-                extracted_normalized_intensities.append(normalized_intensity_at_range)
-                timestamps.append(timestamp)
-        time_elapsed_ms = [(timestamp - timestamps[0]) * 1000 for timestamp in timestamps]
-
-        cmap = plt.get_cmap("tab10")
-        fig1, ax1 = plt.subplots(figsize=(8, 6), dpi=600)
-        ax1.set_xlabel("Time Elapsed (ms)", fontsize=14, fontweight="bold")
-        ax1.set_ylabel("Effective Intensity", fontsize=14, fontweight="bold")
-        ax1.set_title("Effective Intensity vs Time for Wavelength Range", fontsize=16, fontweight="bold")
-        ax1.tick_params(axis="both", which="major", labelsize=12, direction="in")
-        ax1.grid(color="gray", linestyle="--", linewidth=0.5)
-        for idx, wavelength in enumerate(wavelength_range):
-            ax1.plot(time_elapsed_ms, [intensity[idx] for intensity in extracted_effective_intensities],
-                     label=f"{wavelength:.1f} nm", color=cmap(idx))
-        ax1.legend(loc="upper right", fontsize=8)
-
-        fig2, ax2 = plt.subplots(figsize=(8, 6), dpi=600)
-        ax2.set_xlabel("Time Elapsed (ms)", fontsize=14, fontweight="bold")
-        ax2.set_ylabel("Normalized Intensity (%)", fontsize=14, fontweight="bold")
-        ax2.set_title("Normalized Intensity vs Time for Wavelength Range", fontsize=16, fontweight="bold")
-        ax2.tick_params(axis="both", which="major", labelsize=12, direction="in")
-        ax2.grid(color="gray", linestyle="--", linewidth=0.5)
-        for idx, wavelength in enumerate(wavelength_range):
-            ax2.plot(time_elapsed_ms, [intensity[idx] for intensity in extracted_normalized_intensities],
-                     label=f"{wavelength:.1f} nm", color=cmap(idx))
-        ax2.legend(loc="upper right", fontsize=8)
-
-        plt.show()
+    wavelengths, spectra, timestamps = load_spectra_file(filename)
+    with h5py.File(filename_averaged_spectrum_without_fiber, "r") as file_averaged:
+        averaged_intensities = file_averaged["averaged_intensities"][:]
+    wavelength_indices = [np.abs(wavelengths - wavelength).argmin() for wavelength in wavelength_range]
+    extracted_effective_intensities = np.abs(spectra[1:, wavelength_indices] - averaged_intensities[wavelength_indices])
+    extracted_normalized_intensities = 100 * extracted_effective_intensities / np.max(extracted_effective_intensities, axis=1, keepdims=True)
+    timestamps = timestamps[1:]
+    time_elapsed_ms = [(timestamp - timestamps[0]) * 1000 for timestamp in timestamps]
+
+    cmap = plt.get_cmap("tab10")
+    fig1, ax1 = plt.subplots(figsize=(8, 6), dpi=600)
+    ax1.set_xlabel("Time Elapsed (ms)", fontsize=14, fontweight="bold")
+    ax1.set_ylabel("Effective Intensity", fontsize=14, fontweight="bold")
+    ax1.set_title("Effective Intensity vs Time for Wavelength Range", fontsize=16, fontweight="bold")
+    ax1.tick_params(axis="both", which="major", labelsize=12, direction="in")
+    ax1.grid(color="gray", linestyle="--", linewidth=0.5)
+    for idx, wavelength in enumerate(wavelength_range):
+        ax1.plot(time_elapsed_ms, extracted_effective_intensities[:, idx],
+                 label=f"{wavelength:.1f} nm", color=cmap(idx))
+    ax1.legend(loc="upper right", fontsize=8)
+
+    fig2, ax2 = plt.subplots(figsize=(8, 6), dpi=600)
+    ax2.set_xlabel("Time Elapsed (ms)", fontsize=14, fontweight="bold")
+    ax2.set_ylabel("Normalized Intensity (%)", fontsize=14, fontweight="bold")
+    ax2.set_title("Normalized Intensity vs Time for Wavelength Range", fontsize=16, fontweight="bold")
+    ax2.tick_params(axis="both", which="major", labelsize=12, direction="in")
+    ax2.grid(color="gray", linestyle="--", linewidth=0.5)
+    for idx, wavelength in enumerate(wavelength_range):
+        ax2.plot(time_elapsed_ms, extracted_normalized_intensities[:, idx],
+                 label=f"{wavelength:.1f} nm", color=cmap(idx))
+    ax2.legend(loc="upper right", fontsize=8)
+
+    plt.show()
 
 def main():
     try:
@@ -4,6 +4,12 @@ import time
 import h5py
 from seabreeze.spectrometers import list_devices, Spectrometer
 import numpy as np
+from spectra_writer import SpectraWriter, read_spectra, read_saturated
+from spectra_statistics import RunningSpectrumStats, stats_from_spectra
+from acquisition_scheduler import run_schedule, schedule_summary, save_schedule
+from spectrometer_session import SpectrometerSession
+from background_library import get_or_acquire
+from auto_exposure import AutoExposure, converge_integration_time
 
 def create_directory_if_not_exists(directory_path):
     if not os.path.exists(directory_path):
@@ -24,7 +30,8 @@ def save_data_to_hdf5(file_path, data_dict):
 def initialize_data_and_spectrometer(integration_time_ms):
     data_directory = "./.h5_files"
     create_directory_if_not_exists(data_directory)
-    background_file_path = os.path.join(data_directory, f"averaged_background_spectrum_{integration_time_ms}ms.h5")
+    # Backgrounds for every device and integration time live in one library file
+    background_file_path = os.path.join(data_directory, "background_library.h5")
     spectrometer = find_and_initialize_spectrometer()
     print("Data directory and spectrometer initialized.")
     return data_directory, background_file_path, spectrometer
@@ -34,19 +41,30 @@ def find_and_initialize_spectrometer():
     if not devices:
         print("No spectrometer device found.")
         return None
-    spectrometer = Spectrometer(devices[0])
-    print(f"Spectrometer initialized: {spectrometer.model}")
+    # The session caches wavelengths and settings, so repeated calls cost no USB traffic
+    spectrometer = SpectrometerSession(Spectrometer(devices[0]))
+    print(f"Spectrometer initialized: {spectrometer.model} {spectrometer.serial_number}, {spectrometer.pixels} pixels")
     return spectrometer
 
 def get_measurement_settings():
     time_interval_seconds = 1
     number_of_spectra = 3
     integration_time_ms = 20
+    # Starting guess only: probes with the laser on replace it, and the run keeps adjusting
+    auto_exposure = True
     total_duration_seconds = number_of_spectra * (time_interval_seconds + integration_time_ms / 1000)
     time_background = total_duration_seconds
     print(f"Measurement settings: Time Interval = {time_interval_seconds} seconds, Number of Spectra = {number_of_spectra}, Integration Time = {integration_time_ms} ms")
     print(f"Total measurement duration: {total_duration_seconds:.2f} seconds")
-    return time_interval_seconds, number_of_spectra, integration_time_ms, total_duration_seconds, time_background
+    return time_interval_seconds, number_of_spectra, integration_time_ms, total_duration_seconds, time_background, auto_exposure
+
+def set_integration_time_automatically(spectrometer, integration_time_ms, time_interval_seconds):
+    input("Turn ON the laser and press Enter when ready to set the integration time...")
+    # An exposure longer than the interval would make every acquisition overrun
+    result = converge_integration_time(spectrometer, integration_time_ms, max_integration_time_ms=time_interval_seconds * 1000)
+    # Whole microseconds on a 0.1 ms grid, so filenames stay readable and the device, the
+    # background library and the files all see exactly the same integration time
+    return int(round(result['integration_time_ms'] * 10)) * 100
 
 def load_background_spectrum(file_path):
     if file_exists(file_path):
@@ -59,76 +77,95 @@ def load_background_spectrum(file_path):
         print("Background spectrum file not found.")
         return None
 
-def record_spectra_background(spectrometer, time_interval_seconds, integration_time_ms, total_duration_seconds):
+def record_spectra_background(spectrometer, time_interval_seconds, integration_time_micros, total_duration_seconds):
     spectra = []
     timestamps = []
-    integration_time_micros = integration_time_ms * 1000
     spectrometer.integration_time_micros(integration_time_micros)
-    start_time = time.time()
+    wavelengths = spectrometer.wavelengths()
     print("Recording background spectra...")
-    while (time.time() - start_time) <= total_duration_seconds:
-        spectrum_data = spectrometer.spectrum(correct_dark_counts=True)
-        wavelengths = spectrometer.wavelengths()
+    def acquire(index):
+        spectrum_data = spectrometer.intensities(correct_dark_counts=True)
         spectra.append((wavelengths, spectrum_data))
-        time.sleep(time_interval_seconds)
-        timestamps.append(time.time())
+    schedule = run_schedule(acquire, time_interval_seconds, total_duration_seconds=total_duration_seconds)
+    timestamps = list(schedule['actual'])
     print(f"Recorded {len(spectra)} background spectra.")
+    schedule_summary(schedule)
     return spectra, timestamps
 
-def record_spectra(spectrometer, time_interval_seconds, integration_time_ms, total_duration_seconds, avg_background):
+def record_spectra(spectrometer, time_interval_seconds, integration_time_micros, total_duration_seconds, avg_background, writer=None, stats=None, auto_exposure=None):
     spectra = []
     timestamps = []
-    integration_time_micros = integration_time_ms * 1000
+    saturated_count = 0
     spectrometer.integration_time_micros(integration_time_micros)
-    start_time = time.time()
+    wavelengths = spectrometer.wavelengths()
     print("Recording spectra with background subtraction...")
-    while (time.time() - start_time) <= total_duration_seconds:
-        spectrum_data = spectrometer.spectrum(correct_dark_counts=True)
-        wavelengths = spectrometer.wavelengths()
+    def acquire(index):
+        nonlocal saturated_count
+        spectrum_data = spectrometer.intensities(correct_dark_counts=True)
+        # Stamped when the read returns, at the end of the exposure (as MaskDemultiplexer expects)
+        acquired = time.time()
+        # Clipped counts do not scale with the integration time, so a saturated spectrum is
+        # flagged in the file and kept out of the averages
+        saturated = spectrometer.saturated(spectrum_data)
+        saturated_count += saturated
+        if auto_exposure is not None:
+            # Rescaled to the nominal integration time, so spectra stay comparable with each
+            # other and with the background after the controller changes the exposure
+            scale = auto_exposure.scale_to_nominal()
+            auto_exposure.update(spectrum_data, acquired)
+            spectrum_data = spectrum_data * scale
         spectrum_data = spectrum_data - avg_background
-        spectra.append((wavelengths, spectrum_data))
-        time.sleep(time_interval_seconds)
-        timestamps.append(time.time())
-    print(f"Recorded {len(spectra)} spectra with background subtraction.")
+        if stats is not None and not saturated:
+            stats.update(spectrum_data)
+        if writer is not None:
+            # Streamed to disk as it arrives; the writer holds the wavelengths once
+            writer.append(spectrum_data, acquired, saturated)
+        elif not saturated:
+            spectra.append((wavelengths, spectrum_data))
+            timestamps.append(acquired)
+    # Acquisitions fire on a fixed grid of deadlines, so integration and USB time no
+    # longer add to every period
+    schedule = run_schedule(acquire, time_interval_seconds, total_duration_seconds=total_duration_seconds)
+    if writer is not None:
+        save_schedule(writer.group, schedule)
+        if auto_exposure is not None:
+            auto_exposure.save_changes(writer.group)
+    print(f"Recorded {len(writer) if writer is not None else len(spectra)} spectra with background subtraction.")
+    if saturated_count:
+        print(f"{saturated_count} saturated spectra {'flagged' if writer is not None else 'dropped'} and left out of the averages")
+    schedule_summary(schedule)
     return spectra, timestamps
 
 def calculate_average_spectra(spectra_list):
-    num_spectra = len(spectra_list)
-    if num_spectra == 0:
+    stats = stats_from_spectra(spectra_list)
+    if stats is None:
         return None
-    sum_intensities = [0] * len(spectra_list[0][1])
-    for wavelengths, intensities in spectra_list:
-        for i, intensity in enumerate(intensities):
-            sum_intensities[i] += intensity
-    avg_intensities = [intensity_sum / num_spectra for intensity_sum in sum_intensities]
-    print(f"Calculated average intensities from {num_spectra} spectra.")
-    return avg_intensities
-
-def check_and_handle_background_spectrum(background_file_path, spectrometer, time_interval_seconds, integration_time_ms, time_background):
-    if not file_exists(background_file_path):
+    print(f"Calculated average intensities from {stats.count} spectra.")
+    return stats.mean
+
+def check_and_handle_background_spectrum(background_file_path, spectrometer, time_interval_seconds, integration_time_micros, time_background, temperature_c=None):
+    def acquire_background():
         input("Make sure the laser is OFF and press Enter when ready to read the background...")
-        background_spectra, background_timestamps = record_spectra_background(spectrometer, time_interval_seconds, integration_time_ms, time_background)
-        avg_background = calculate_average_spectra([spectrum[1] for spectrum in background_spectra])
-        save_data_to_hdf5(background_file_path, {"wavelengths": spectrometer.wavelengths(), "intensities": avg_background})
-        print("Background reading complete. Saved background spectrum.")
+        background_spectra, background_timestamps = record_spectra_background(spectrometer, time_interval_seconds, integration_time_micros, time_background)
+        print("Background reading complete.")
         input("Turn ON the laser and press Enter when ready to start live view...")
-        background_wavelengths = spectrometer.wavelengths()
-    else:
-        print("Using the existing background spectrum.")
-        background_wavelengths, avg_background = load_background_spectrum(background_file_path)
+        return stats_from_spectra(background_spectra)
+    background_wavelengths, avg_background = get_or_acquire(spectrometer, integration_time_micros, acquire_background,
+                                                            temperature_c=temperature_c, library_path=background_file_path)
     return background_wavelengths, avg_background
 
-def record_or_load_spectrum_without_fiber(spectrometer, data_directory, time_interval_seconds, integration_time_ms, time_background, avg_background):
+def record_or_load_spectrum_without_fiber(spectrometer, data_directory, time_interval_seconds, integration_time_micros, time_background, avg_background):
     avg_spectrum_without_fiber = None
+    integration_time_ms = integration_time_micros / 1000
     try:
         spectrum_without_fiber_filename, spectrum_without_fiber_averaged_filename = generate_filenames_without_fiber(data_directory, integration_time_ms)
         if not file_exists(spectrum_without_fiber_averaged_filename):
-            spectrum_without_fiber, spectrum_without_fiber_timestamps = record_spectra(spectrometer, time_interval_seconds, integration_time_ms, time_background, avg_background)
+            spectrum_without_fiber, spectrum_without_fiber_timestamps = record_spectra(spectrometer, time_interval_seconds, integration_time_micros, time_background, avg_background)
             avg_spectrum_without_fiber = calculate_average_spectra([spectrum[1] for spectrum in spectrum_without_fiber])
             save_data_to_hdf5(spectrum_without_fiber_averaged_filename, {"wavelengths": spectrometer.wavelengths(), "averaged_intensities": avg_spectrum_without_fiber})
-            print(f"Spectrum without fiber recorded and saved with Integration Time={integration_time_ms} ms")
+            print(f"Spectrum without fiber recorded and saved with Integration Time={integration_time_ms:g} ms")
         else:
-            print(f"Using the existing spectrum without fiber (Integration Time={integration_time_ms} ms)")
+            print(f"Using the existing spectrum without fiber (Integration Time={integration_time_ms:g} ms)")
         input("Replace the fiber, unblock the laser beam, and press Enter when ready to continue with fiber spectra...")
     except Exception as e:
         print("An error occurred:", str(e))
@@ -136,20 +173,20 @@ def record_or_load_spectrum_without_fiber(spectrometer, data_directory, time_int
 
 def generate_filenames_with_fiber(data_directory, integration_time_ms, count=0):
     current_date = time.strftime('%Y-%m-%d')
-    base_filename = os.path.join(data_directory, f"{current_date}_spectrum_with_fiber_{integration_time_ms}ms")
-    averaged_filename = os.path.join(data_directory, f"{current_date}_averaged_spectrum_with_fiber_{integration_time_ms}ms")
+    base_filename = os.path.join(data_directory, f"{current_date}_spectrum_with_fiber_{integration_time_ms:g}ms")
+    averaged_filename = os.path.join(data_directory, f"{current_date}_averaged_spectrum_with_fiber_{integration_time_ms:g}ms")
     while file_exists(f"{averaged_filename}.h5"):
         count += 1
-        base_filename = os.path.join(data_directory, f"{current_date}_spectrum_with_fiber_{integration_time_ms}ms_({count})")
-        averaged_filename = os.path.join(data_directory, f"{current_date}_averaged_spectrum_with_fiber_{integration_time_ms}ms_({count})")
+        base_filename = os.path.join(data_directory, f"{current_date}_spectrum_with_fiber_{integration_time_ms:g}ms_({count})")
+        averaged_filename = os.path.join(data_directory, f"{current_date}_averaged_spectrum_with_fiber_{integration_time_ms:g}ms_({count})")
     base_filename += ".h5"
     averaged_filename += ".h5"
     print(f"Generated filenames with fiber: {base_filename}, {averaged_filename}")
     return base_filename, averaged_filename
 
 def generate_filenames_without_fiber(data_directory, integration_time_ms):
-    filename = os.path.join(data_directory, f"spectrum_without_fiber_{integration_time_ms}ms.h5")
-    averaged_filename = os.path.join(data_directory, f"averaged_spectrum_without_fiber_{integration_time_ms}ms.h5")
+    filename = os.path.join(data_directory, f"spectrum_without_fiber_{integration_time_ms:g}ms.h5")
+    averaged_filename = os.path.join(data_directory, f"averaged_spectrum_without_fiber_{integration_time_ms:g}ms.h5")
     print(f"Generated filenames without fiber: {filename}, {averaged_filename}")
     return filename, averaged_filename
 
@@ -173,6 +210,17 @@ def process_and_save_data(data_directory, spectra, timestamps, integration_time_
     print("Averaged spectrum with fiber saved to", averaged_filename)
     print("All {} spectra with fiber saved to {}".format(len(spectra), filename))
 
+def process_and_save_streamed_data(filename, averaged_filename, stats=None):
+    if stats is None:
+        wavelengths, intensities, timestamps = read_spectra(filename)
+        stats = stats_from_spectra(intensities[~read_saturated(filename)])
+    else:
+        # Accumulated during the run, so the spectra are not read back
+        wavelengths = read_spectra(filename, 0, 0)[0]
+    save_data_to_hdf5(averaged_filename, {"wavelengths": wavelengths, **stats.to_dict()})
+    print("Averaged spectrum with fiber saved to", averaged_filename)
+    print("All {} spectra with fiber saved to {}".format(stats.count, filename))
+
 def close_spectrometer(spectrometer):
     if spectrometer:
         spectrometer.close()
@@ -215,23 +263,33 @@ def calculate_and_save_effective_fiber_transmission(effective_fiber_spectrum_fil
 def main():
     try:
         print("Initializing data directory and spectrometer...")
-        time_interval_seconds, number_of_spectra, integration_time_ms, total_duration_seconds, time_background = get_measurement_settings()
+        time_interval_seconds, number_of_spectra, integration_time_ms, total_duration_seconds, time_background, auto_exposure = get_measurement_settings()
         data_directory, background_file_path, spectrometer = initialize_data_and_spectrometer(integration_time_ms)
+        integration_time_micros = int(round(integration_time_ms * 1000))
+        if auto_exposure:
+            integration_time_micros = set_integration_time_automatically(spectrometer, integration_time_ms, time_interval_seconds)
+            integration_time_ms = integration_time_micros / 1000
+            total_duration_seconds = number_of_spectra * (time_interval_seconds + integration_time_ms / 1000)
+            time_background = total_duration_seconds
 
         print("Checking and handling background spectrum...")
-        background_wavelengths, avg_background = check_and_handle_background_spectrum(background_file_path, spectrometer, time_interval_seconds, integration_time_ms, time_background)
+        background_wavelengths, avg_background = check_and_handle_background_spectrum(background_file_path, spectrometer, time_interval_seconds, integration_time_micros, time_background)
 
         print("Recording or loading spectrum without fiber...")
-        wavelengths, avg_spectrum_without_fiber = record_or_load_spectrum_without_fiber(spectrometer, data_directory, time_interval_seconds, integration_time_ms, time_background, avg_background)
+        wavelengths, avg_spectrum_without_fiber = record_or_load_spectrum_without_fiber(spectrometer, data_directory, time_interval_seconds, integration_time_micros, time_background, avg_background)
 
         spectrum_with_fiber_filename, spectrum_with_fiber_averaged_filename = generate_filenames_with_fiber(data_directory, integration_time_ms)
         spectrum_without_fiber_filename, spectrum_without_fiber_averaged_filename = generate_filenames_without_fiber(data_directory, integration_time_ms)
 
         print("Start recording spectra...")
-        spectra, timestamps = record_spectra(spectrometer, time_interval_seconds, integration_time_ms, total_duration_seconds, avg_background)
+        stats = RunningSpectrumStats()
+        exposure_controller = AutoExposure(spectrometer, integration_time_ms, max_integration_time_ms=time_interval_seconds * 1000) if auto_exposure else None
+        with SpectraWriter(spectrum_with_fiber_filename, spectrometer.wavelengths(), attributes={"integration_time_ms": integration_time_ms}) as writer:
+            spectra, timestamps = record_spectra(spectrometer, time_interval_seconds, integration_time_micros, total_duration_seconds, avg_background, writer, stats, exposure_controller)
+        print(f"Median single-spectrum SNR: {stats.summary()['median_snr']:.1f}")
 
         print("Processing and saving data...")
-        process_and_save_data(data_directory, spectra, timestamps, integration_time_ms)
+        process_and_save_streamed_data(spectrum_with_fiber_filename, spectrum_with_fiber_averaged_filename, stats)
         
         print("Calculating and saving effective fiber spectrum...")
         effective_fiber_spectrum_filename = calculate_and_save_effective_fiber_spectrum(spectrum_with_fiber_averaged_filename, spectrum_without_fiber_averaged_filename)
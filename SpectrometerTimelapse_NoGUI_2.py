@@ -4,6 +4,7 @@ import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 from seabreeze.spectrometers import list_devices, Spectrometer
+from spectra_statistics import stats_from_spectra
 
 def create_directory_if_not_exists(directory_path):
     if not os.path.exists(directory_path):
@@ -123,15 +124,12 @@ def close_spectrometer(spectrometer):
         print("Spectrometer closed.")
 
 def calculate_average_spectrum(spectra_list):
-    num_spectra = len(spectra_list)
-    if num_spectra == 0:
+    stats = stats_from_spectra(spectra_list)
+    if stats is None:
         return None
-    sum_intensities = np.zeros_like(spectra_list[0][1])
-    for wavelengths, intensities in spectra_list:
-        sum_intensities += intensities
-    avg_spectrum = sum_intensities / num_spectra
-    print(f"Calculated average spectrum from {num_spectra} spectra.")
-    return avg_spectrum
+    print(f"Calculated average spectrum from {stats.count} spectra.")
+    # The spectra are spectrum() arrays, so the average keeps their layout with the wavelengths in row 0
+    return np.vstack([spectra_list[0][0], stats.mean])
 
 def main():
     try:
@@ -4,6 +4,7 @@ import h5py
 import numpy as np
 import matplotlib.pyplot as plt
 from seabreeze.spectrometers import list_devices, Spectrometer
+from spectra_statistics import stats_from_spectra
 import serial
 import threading
 import concurrent.futures
@@ -207,15 +208,12 @@ def record_spectra(spectrometer, spectra_time_interval_seconds, spectra_number_o
     return spectra, timestamps
 
 def calculate_average_spectrum(spectra_list):
-    num_spectra = len(spectra_list)
-    if num_spectra == 0:
+    stats = stats_from_spectra(spectra_list)
+    if stats is None:
         return None
-    sum_intensities = np.zeros_like(spectra_list[0][1])
-    for wavelengths, intensities in spectra_list:
-        sum_intensities += intensities
-    avg_spectrum = sum_intensities / num_spectra
-    print(f"Calculated average spectrum from {num_spectra} spectra.")
-    return avg_spectrum
+    print(f"Calculated average spectrum from {stats.count} spectra.")
+    # The spectra are spectrum() arrays, so the average keeps their layout with the wavelengths in row 0
+    return np.vstack([spectra_list[0][0], stats.mean])
 
 def save_all_spectra(filename, wavelengths, spectra, timestamps):
     data_dict = {
@@ -0,0 +1,215 @@
+import csv
+import os
+import platform
+import shutil
+import time
+import h5py
+import numpy as np
+from acquisition_pipeline import AcquisitionPipeline, background_stage
+from benchmark_common import git_commit
+from spectra_statistics import RunningSpectrumStats, statistics_stage
+from spectra_writer import SpectraWriter
+from spectrometer_session import SpectrometerSession, open_session
+from spectrometer_simulator import SimulatedSpectrometer
+
+RESULTS_PATH = os.path.join(".", "benchmarks", "acquisition_results.csv")
+SCRATCH_DIRECTORY = os.path.join(".", "benchmarks", "scratch")
+SIMULATE = True
+RUN_SECONDS = 2.0
+INTEGRATION_TIMES_MS = (1, 3, 10)
+STORAGE_BACKENDS = ('none', 'memory', 'legacy_groups', 'spectra_writer')
+COMPRESSIONS = (None, 'lzf', 'gzip')
+# 'threaded' runs the pipeline with on_full='block'; 'threaded_overwrite' lets lagging
+# stages drop spectra instead and is reported as a separate case
+PIPELINE_MODES = ('inline', 'threaded', 'threaded_overwrite')
+REGRESSION_THRESHOLD = 0.2
+RESULT_FIELDS = ['run_id', 'commit', 'host', 'device', 'integration_time_ms', 'storage', 'compression', 'mode',
+                 'spectra', 'seconds', 'spectra_per_second', 'jitter_p50_ms', 'jitter_p99_ms', 'cpu_load',
+                 'dropped_reads', 'dropped_spectra', 'reader_wait_seconds']
+
+def benchmark_cases(integration_times_ms=INTEGRATION_TIMES_MS, storage_backends=STORAGE_BACKENDS,
+                    compressions=COMPRESSIONS, pipeline_modes=PIPELINE_MODES):
+    # Compression only means something for the chunked writer
+    cases = []
+    for integration_time_ms in integration_times_ms:
+        for storage in storage_backends:
+            for compression in (compressions if storage == 'spectra_writer' else (None,)):
+                for mode in pipeline_modes:
+                    cases.append((integration_time_ms, storage, compression, mode))
+    return cases
+
+def open_storage(storage, compression, wavelengths, path):
+    # Returns store(spectra, timestamps) for a block of rows and a close()
+    if storage == 'none':
+        return lambda spectra, timestamps: None, lambda: None
+    if storage == 'memory':
+        rows = []
+        return lambda spectra, timestamps: rows.extend(np.array(spectra)), lambda: None
+    if storage == 'legacy_groups':
+        # What save_data_to_files does, one group per spectrum, but written as spectra arrive
+        file = h5py.File(path, "w")
+        counter = [0]
+        def store(spectra, timestamps):
+            for intensities, timestamp in zip(spectra, timestamps):
+                counter[0] += 1
+                group = file.create_group(f"Spectrum_{counter[0]:03d}")
+                group.create_dataset("wavelengths", data=wavelengths)
+                group.create_dataset("intensities", data=intensities)
+                group.create_dataset("timestamp", data=timestamp)
+        return store, file.close
+    if storage == 'spectra_writer':
+        writer = SpectraWriter(path, wavelengths, compression=compression,
+                               compression_opts=4 if compression == 'gzip' else None)
+        def store(spectra, timestamps):
+            # append() buffers rows into whole chunks whatever block size arrives; the rows are
+            # copied because pipeline batches are views of ring slots that get refilled
+            for intensities, timestamp in zip(spectra, timestamps):
+                writer.append(intensities.copy(), timestamp)
+        return store, writer.close
+    raise ValueError(f"Unknown storage backend '{storage}'")
+
+def timing_summary(timestamps):
+    # Jitter is the spread of read-to-read intervals around their median; a gap of k
+    # median intervals means k - 1 reads the device could have delivered were missed.
+    intervals = np.diff(np.asarray(timestamps))
+    if len(intervals) == 0:
+        return np.nan, np.nan, 0
+    median = np.median(intervals)
+    deviation_ms = np.abs(intervals - median) * 1000
+    missed = int(np.sum(np.maximum(np.rint(intervals / median) - 1, 0))) if median > 0 else 0
+    return float(np.percentile(deviation_ms, 50)), float(np.percentile(deviation_ms, 99)), missed
+
+def run_inline(spectrometer, background, stats, store, run_seconds):
+    timestamps = []
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < run_seconds:
+        timestamp = time.time()
+        intensities = spectrometer.intensities() - background
+        stats.update(intensities)
+        store(intensities[np.newaxis], [timestamp])
+        timestamps.append(timestamp)
+    return timestamps, 0, 0.0
+
+def run_threaded(spectrometer, background, stats, store, run_seconds, on_full='block'):
+    pipeline = AcquisitionPipeline(spectrometer.read_into, spectrometer.pixels, on_full=on_full)
+    timestamps = []
+    pipeline.add_stage("background", background_stage(background))
+    pipeline.add_stage("timing", lambda spectra, stamps, first_index: timestamps.extend(stamps), after="background")
+    pipeline.add_stage("statistics", statistics_stage(stats), after="background")
+    pipeline.add_stage("storage", lambda spectra, stamps, first_index: store(spectra, stamps), after="background")
+    report = pipeline.start(total_duration_seconds=run_seconds).join()
+    dropped = max(stage['dropped'] for stage in report['stages'].values())
+    return timestamps, dropped, report['reader_wait_seconds']
+
+def run_case(spectrometer, case, background, run_seconds=RUN_SECONDS, scratch_directory=SCRATCH_DIRECTORY):
+    integration_time_ms, storage, compression, mode = case
+    spectrometer.integration_time_ms(integration_time_ms)
+    path = os.path.join(scratch_directory, f"{storage}_{compression}_{mode}.h5")
+    store, close = open_storage(storage, compression, spectrometer.wavelengths(), path)
+    stats = RunningSpectrumStats(spectrometer.pixels)
+    # Warm up the device and the allocator before timing
+    spectrometer.intensities()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        if mode == 'inline':
+            timestamps, pipeline_dropped, reader_wait_seconds = run_inline(spectrometer, background, stats, store, run_seconds)
+        else:
+            on_full = 'overwrite' if mode == 'threaded_overwrite' else 'block'
+            timestamps, pipeline_dropped, reader_wait_seconds = run_threaded(spectrometer, background, stats, store, run_seconds, on_full)
+    finally:
+        close()
+    seconds = time.perf_counter() - wall_start
+    cpu_load = (time.process_time() - cpu_start) / seconds
+    jitter_p50_ms, jitter_p99_ms, missed = timing_summary(timestamps)
+    return {
+        'device': f"{spectrometer.model} {spectrometer.serial_number}",
+        'integration_time_ms': integration_time_ms,
+        'storage': storage,
+        'compression': compression or 'none',
+        'mode': mode,
+        'spectra': stats.count,
+        'seconds': seconds,
+        'spectra_per_second': stats.count / seconds,
+        'jitter_p50_ms': jitter_p50_ms,
+        'jitter_p99_ms': jitter_p99_ms,
+        'cpu_load': cpu_load,
+        'dropped_reads': missed,
+        'dropped_spectra': pipeline_dropped,
+        'reader_wait_seconds': reader_wait_seconds,
+    }
+
+def run_benchmarks(spectrometer, cases=None, run_seconds=RUN_SECONDS, scratch_directory=SCRATCH_DIRECTORY):
+    cases = benchmark_cases() if cases is None else cases
+    run_info = {'run_id': time.strftime("%Y-%m-%d %H:%M:%S"), 'commit': git_commit(), 'host': platform.node()}
+    os.makedirs(scratch_directory, exist_ok=True)
+    records = []
+    try:
+        for case in cases:
+            spectrometer.integration_time_ms(case[0])
+            background = np.mean([spectrometer.intensities() for _ in range(10)], axis=0)
+            print("Benchmarking {} ms / {} / {} / {}...".format(case[0], case[1], case[2] or 'none', case[3]))
+            record = run_case(spectrometer, case, background, run_seconds, scratch_directory)
+            record.update(run_info)
+            records.append(record)
+            print(f"  {record['spectra_per_second']:.0f} spectra/s, jitter p99 {record['jitter_p99_ms']:.2f} ms, "
+                  f"CPU {record['cpu_load']:.0%}, {record['dropped_reads']} reads missed, {record['dropped_spectra']} spectra dropped")
+    finally:
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+    return records
+
+def load_results(results_path=RESULTS_PATH):
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path, newline="") as file:
+        return list(csv.DictReader(file))
+
+def append_results(records, results_path=RESULTS_PATH):
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    new_file = not os.path.exists(results_path)
+    with open(results_path, "a", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+        for record in records:
+            writer.writerow({field: record[field] for field in RESULT_FIELDS})
+    print(f"Appended {len(records)} results to {results_path}")
+
+def case_key(record):
+    return (record['device'], str(record['integration_time_ms']), record['storage'], record['compression'], record['mode'])
+
+def compare_to_results(records, results, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    print(f"\n{'case':<48}{'baseline /s':>12}{'now /s':>10}{'change':>9}")
+    for record in records:
+        earlier = [float(row['spectra_per_second']) for row in results if case_key(row) == case_key(record)]
+        case_name = "{} ms / {} / {} / {}".format(*case_key(record)[1:])
+        if not earlier:
+            print(f"{case_name:<48}no earlier runs")
+            continue
+        baseline = float(np.median(earlier))
+        change = record['spectra_per_second'] / baseline - 1 if baseline > 0 else 0.0
+        flag = ""
+        if change < -threshold:
+            flag = "  <-- regression"
+            regressions.append((case_name, baseline, record['spectra_per_second']))
+        print(f"{case_name:<48}{baseline:>12.0f}{record['spectra_per_second']:>10.0f}{change:>+9.0%}{flag}")
+    print(f"\n{len(regressions)} regression(s) above {threshold:.0%}.")
+    return regressions
+
+def main():
+    spectrometer = None if SIMULATE else open_session()
+    if spectrometer is None:
+        if not SIMULATE:
+            print("Benchmarking the simulator instead.")
+        spectrometer = SpectrometerSession(SimulatedSpectrometer(seed=0))
+    try:
+        results = load_results()
+        records = run_benchmarks(spectrometer)
+        append_results(records)
+        compare_to_results(records, results)
+    finally:
+        spectrometer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import time
+import threading
+import numpy as np
+from acquisition_scheduler import run_schedule
+
+RING_CAPACITY = 1024
+MAX_BATCH = 256
+
+class AcquisitionPipeline:
+    # One thread only reads spectra into a preallocated ring buffer; each consumer stage
+    # runs on its own thread with its own read cursor. A stage registered with after=
+    # sees a slot only once the upstream stage has finished with it, so in-place stages
+    # (e.g. background subtraction) can feed storage and statistics without copies.
+    # When the slowest stage is a full ring behind, on_full='block' makes the reader wait
+    # and on_full='overwrite' keeps reading and the lagging stages skip ahead and count drops.
+    # Either way a slot is never refilled while a stage is working on it: in overwrite mode
+    # the reader waits for that one batch to finish. Timestamps are time.time() when the
+    # read returned, i.e. at the end of the exposure plus the transfer.
+    def __init__(self, acquire_into, number_of_pixels, capacity=RING_CAPACITY, dtype=np.float64, on_full='block'):
+        if on_full not in ('block', 'overwrite'):
+            raise ValueError(f"Unknown on_full policy '{on_full}', expected 'block' or 'overwrite'")
+        self.acquire_into = acquire_into
+        self.capacity = capacity
+        self.on_full = on_full
+        self.spectra = np.zeros((capacity, number_of_pixels), dtype=dtype)
+        self.timestamps = np.zeros(capacity)
+        self.written = 0
+        self.finished = False
+        self.error = None
+        self.stages = []
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.reader_wait_seconds = 0.0
+        self.threads = []
+
+    def add_stage(self, name, process, after=None, max_batch=MAX_BATCH, latest_only=False):
+        # process(spectra, timestamps, first_index) gets views into the ring, at most max_batch rows.
+        # latest_only stages (live previews) jump straight to the newest spectrum.
+        upstream = None
+        if after is not None:
+            upstream = next(stage for stage in self.stages if stage['name'] == after)
+        stage = {'name': name, 'process': process, 'upstream': upstream, 'max_batch': max_batch, 'latest_only': latest_only,
+                 'cursor': 0, 'in_use': None, 'processed': 0, 'dropped': 0, 'max_lag': 0, 'busy_seconds': 0.0, 'done': False}
+        self.stages.append(stage)
+        return stage
+
+    def slowest_cursor(self):
+        return min((stage['cursor'] for stage in self.stages), default=self.written)
+
+    def in_use(self, index):
+        return any(stage['in_use'] is not None and stage['in_use'][0] <= index < stage['in_use'][1] for stage in self.stages)
+
+    def read_one(self):
+        with self.condition:
+            waited = time.perf_counter()
+            if self.on_full == 'block':
+                while self.written - self.slowest_cursor() >= self.capacity and self.error is None:
+                    self.condition.wait(0.1)
+            else:
+                # The slot about to be refilled held spectrum written - capacity
+                while self.in_use(self.written - self.capacity) and self.error is None:
+                    self.condition.wait(0.1)
+            self.reader_wait_seconds += time.perf_counter() - waited
+            if self.error is not None:
+                self.stop_event.set()
+                return
+        slot = self.written % self.capacity
+        self.acquire_into(self.spectra[slot])
+        self.timestamps[slot] = time.time()
+        with self.condition:
+            self.written += 1
+            self.condition.notify_all()
+
+    def run_reader(self, number_of_spectra, total_duration_seconds, interval_seconds):
+        try:
+            if interval_seconds:
+                run_schedule(lambda index: self.read_one(), interval_seconds, number_of_spectra, total_duration_seconds,
+                             verbose=False, should_stop=self.stop_event.is_set)
+            else:
+                start = time.perf_counter()
+                while not self.stop_event.is_set():
+                    if number_of_spectra is not None and self.written >= number_of_spectra:
+                        break
+                    if total_duration_seconds is not None and time.perf_counter() - start > total_duration_seconds:
+                        break
+                    self.read_one()
+        except Exception as error:
+            self.error = error
+        finally:
+            with self.condition:
+                self.reader_seconds = time.perf_counter() - self.start_time
+                self.finished = True
+                self.condition.notify_all()
+
+    def run_stage(self, stage):
+        try:
+            while True:
+                with self.condition:
+                    while True:
+                        limit = self.written if stage['upstream'] is None else stage['upstream']['cursor']
+                        upstream_done = self.finished if stage['upstream'] is None else stage['upstream']['done']
+                        if limit > stage['cursor'] or upstream_done or self.error is not None:
+                            break
+                        self.condition.wait(0.1)
+                    if self.error is not None or (limit == stage['cursor'] and upstream_done):
+                        break
+                    stage['max_lag'] = max(stage['max_lag'], self.written - stage['cursor'])
+                    # In overwrite mode the reader may already be refilling the oldest slot
+                    lapped = self.written - self.capacity + (1 if self.on_full == 'overwrite' else 0)
+                    oldest = min(max(lapped, limit - 1) if stage['latest_only'] else lapped, limit)
+                    if stage['cursor'] < oldest:
+                        # Overwritten before this stage got to it, or skipped by a preview
+                        stage['dropped'] += oldest - stage['cursor']
+                        stage['cursor'] = oldest
+                    first = stage['cursor']
+                    # Contiguous run of slots, split where the ring wraps around
+                    slot = first % self.capacity
+                    count = min(limit - first, stage['max_batch'], self.capacity - slot)
+                    if count == 0:
+                        continue
+                    stage['in_use'] = (first, first + count)
+                started = time.perf_counter()
+                stage['process'](self.spectra[slot:slot + count], self.timestamps[slot:slot + count], first)
+                stage['busy_seconds'] += time.perf_counter() - started
+                with self.condition:
+                    stage['processed'] += count
+                    stage['cursor'] = first + count
+                    stage['in_use'] = None
+                    self.condition.notify_all()
+        except Exception as error:
+            self.error = error
+        finally:
+            with self.condition:
+                stage['in_use'] = None
+                stage['done'] = True
+                self.condition.notify_all()
+
+    def start(self, number_of_spectra=None, total_duration_seconds=None, interval_seconds=None):
+        self.start_time = time.perf_counter()
+        self.threads = [threading.Thread(target=self.run_stage, args=(stage,), name=stage['name'], daemon=True) for stage in self.stages]
+        self.threads.append(threading.Thread(target=self.run_reader, args=(number_of_spectra, total_duration_seconds, interval_seconds),
+                                             name="reader", daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        return self.join()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.report()
+
+    def report(self):
+        # Throughput over the reading only; stages may still drain the ring afterwards
+        elapsed = self.reader_seconds if self.finished else time.perf_counter() - self.start_time
+        return {
+            'acquired': self.written,
+            'elapsed_seconds': elapsed,
+            'spectra_per_second': self.written / elapsed if elapsed > 0 else np.nan,
+            'reader_wait_seconds': self.reader_wait_seconds,
+            'stages': {stage['name']: {key: stage[key] for key in ('processed', 'dropped', 'max_lag', 'busy_seconds')}
+                       for stage in self.stages},
+        }
+
+def print_report(report):
+    print(f"Acquired {report['acquired']} spectra in {report['elapsed_seconds']:.2f} s "
+          f"({report['spectra_per_second']:.0f} spectra/s), reader blocked {report['reader_wait_seconds']:.2f} s")
+    for name, stage in report['stages'].items():
+        print(f"  {name}: {stage['processed']} processed, {stage['dropped']} dropped, "
+              f"max lag {stage['max_lag']}, busy {stage['busy_seconds']:.2f} s")
+
+def spectrometer_reader(spectrometer, correct_dark_counts=True):
+    # acquire_into for a SpectrometerSession, or a bare seabreeze Spectrometer;
+    # intensities() skips re-reading the wavelengths
+    if hasattr(spectrometer, "read_into"):
+        return spectrometer.read_into
+    def acquire_into(buffer):
+        buffer[:] = spectrometer.intensities(correct_dark_counts=correct_dark_counts)
+    return acquire_into
+
+def background_stage(background):
+    background = np.asarray(background)
+    def process(spectra, timestamps, first_index):
+        spectra -= background
+    return process
+
+def writer_stage(writer):
+    def process(spectra, timestamps, first_index):
+        writer.append_many(spectra, timestamps)
+    return process
+
+def main():
+    number_of_pixels = 2048
+    rng = np.random.default_rng(0)
+    background = rng.normal(1000, 5, number_of_pixels)
+    def acquire_into(buffer):
+        # Stand-in for a 3 ms integration
+        time.sleep(0.003)
+        buffer[:] = background + rng.normal(0, 20, number_of_pixels)
+    totals = np.zeros(number_of_pixels)
+    def accumulate(spectra, timestamps, first_index):
+        totals[:] += spectra.sum(axis=0)
+    def preview(spectra, timestamps, first_index):
+        # Slow consumer: a live plot redrawing every batch
+        time.sleep(0.05)
+    pipeline = AcquisitionPipeline(acquire_into, number_of_pixels, on_full='overwrite', capacity=256)
+    pipeline.add_stage("background", background_stage(background))
+    pipeline.add_stage("statistics", accumulate, after="background")
+    pipeline.add_stage("preview", preview, after="background", latest_only=True)
+    report = pipeline.start(total_duration_seconds=2).join()
+    print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import time
+import numpy as np
+
+SLEEP_MARGIN_SECONDS = 0.002
+
+def wait_until(deadline, sleep_margin_seconds=SLEEP_MARGIN_SECONDS):
+    # Sleep most of the way, then spin the last couple of ms: sleep() alone overshoots by
+    # the OS timer resolution (about 15 ms on Windows).
+    remaining = deadline - time.perf_counter()
+    if remaining > sleep_margin_seconds:
+        time.sleep(remaining - sleep_margin_seconds)
+    while time.perf_counter() < deadline:
+        pass
+
+def run_schedule(acquire, interval_seconds, number_of_acquisitions=None, total_duration_seconds=None,
+                 start_delay_seconds=0.0, on_overrun='skip', sleep_margin_seconds=SLEEP_MARGIN_SECONDS, verbose=True,
+                 should_stop=None, start_time=None):
+    # Acquisition k is due at start + k*interval on the monotonic clock, so lateness never
+    # accumulates. An acquisition that runs past the next deadline is an overrun: 'skip'
+    # drops the slots already missed and resumes on the grid, 'catch_up' fires them at once.
+    if number_of_acquisitions is None and total_duration_seconds is None and should_stop is None:
+        raise ValueError("Give number_of_acquisitions, total_duration_seconds or should_stop")
+    if on_overrun not in ('skip', 'catch_up'):
+        raise ValueError(f"Unknown overrun policy '{on_overrun}', expected 'skip' or 'catch_up'")
+    # perf_counter has no epoch; this offset turns its readings into time.time() stamps.
+    # Schedules sharing a start_time (a perf_counter reading) fire on the same grid.
+    epoch_offset = time.time() - time.perf_counter()
+    start = (time.perf_counter() if start_time is None else start_time) + start_delay_seconds
+    slots, planned, actual, finished, overruns = [], [], [], [], []
+    skipped = 0
+    slot = 0
+    while True:
+        deadline = start + slot * interval_seconds
+        if number_of_acquisitions is not None and len(slots) >= number_of_acquisitions:
+            break
+        if total_duration_seconds is not None and slot * interval_seconds > total_duration_seconds:
+            break
+        wait_until(deadline, sleep_margin_seconds)
+        if should_stop is not None and should_stop():
+            break
+        started = time.perf_counter()
+        acquire(len(slots))
+        ended = time.perf_counter()
+        slots.append(slot)
+        planned.append(deadline)
+        actual.append(started)
+        finished.append(ended)
+        next_slot = slot + 1
+        overrun = ended > start + next_slot * interval_seconds
+        overruns.append(overrun)
+        if overrun and on_overrun == 'skip':
+            missed = int((ended - start) // interval_seconds) - slot
+            skipped += missed
+            next_slot = slot + 1 + missed
+            if verbose:
+                print(f"Overrun: acquisition {len(slots)} took {(ended - started)*1000:.1f} ms "
+                      f"(interval {interval_seconds*1000:.1f} ms), skipped {missed} slot(s)")
+        elif overrun and verbose:
+            print(f"Overrun: acquisition {len(slots)} took {(ended - started)*1000:.1f} ms, catching up")
+        slot = next_slot
+    planned = np.array(planned)
+    actual = np.array(actual)
+    return {
+        'interval_seconds': interval_seconds,
+        'slot': np.array(slots, dtype=int),
+        'planned': planned + epoch_offset,
+        'actual': actual + epoch_offset,
+        'finished': np.array(finished) + epoch_offset,
+        'lateness': actual - planned,
+        'overrun': np.array(overruns, dtype=bool),
+        'skipped_slots': skipped,
+        'on_overrun': on_overrun,
+    }
+
+def schedule_summary(schedule):
+    lateness_ms = schedule['lateness'] * 1000
+    durations_ms = (schedule['finished'] - schedule['actual']) * 1000
+    summary = {
+        'acquisitions': len(lateness_ms),
+        'lateness_median_ms': float(np.median(lateness_ms)) if len(lateness_ms) else np.nan,
+        'lateness_p99_ms': float(np.percentile(lateness_ms, 99)) if len(lateness_ms) else np.nan,
+        'lateness_max_ms': float(np.max(lateness_ms)) if len(lateness_ms) else np.nan,
+        'duration_median_ms': float(np.median(durations_ms)) if len(durations_ms) else np.nan,
+        'overruns': int(np.sum(schedule['overrun'])),
+        'skipped_slots': schedule['skipped_slots'],
+    }
+    print(f"{summary['acquisitions']} acquisitions every {schedule['interval_seconds']*1000:.1f} ms: "
+          f"start lateness median {summary['lateness_median_ms']:.3f} ms, p99 {summary['lateness_p99_ms']:.3f} ms, "
+          f"max {summary['lateness_max_ms']:.3f} ms; {summary['overruns']} overrun(s), {summary['skipped_slots']} slot(s) skipped")
+    return summary
+
+def save_schedule(group, schedule):
+    # Planned and actual times next to the spectra, e.g. in a SpectraWriter's group
+    schedule_group = group.require_group("schedule")
+    for key in ('slot', 'planned', 'actual', 'finished', 'overrun'):
+        if key in schedule_group:
+            del schedule_group[key]
+        schedule_group.create_dataset(key, data=schedule[key])
+    schedule_group.attrs['interval_seconds'] = schedule['interval_seconds']
+    schedule_group.attrs['skipped_slots'] = schedule['skipped_slots']
+    schedule_group.attrs['on_overrun'] = schedule['on_overrun']
@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+import h5py
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from arrow import lambda_antires, refractiveindices_solvents, MAX_RESONANCE_ORDER
+from material_dispersion import MATERIAL_IDS, load_material, refractive_index
+
+MAPS_PATH = os.path.join(".", "plots", "arrow_maps.h5")
+WALL_THICKNESSES_NM = np.linspace(100, 1000, 1801)
+GLASSES = ['Silica', 'SF6', 1.45, 1.50, 1.55]
+SOLVENTS = ['Air', 'Water', 'Methanol', 'Isopropanol', 'Glycerol', 'mixture']
+
+def index_function(material):
+    # Materials are given by name (database or arrow.py solvent) or as a constant index,
+    # and resolved inside each worker so nothing unpicklable crosses the process boundary.
+    if isinstance(material, str):
+        if material in refractiveindices_solvents:
+            return refractiveindices_solvents[material]
+        return lambda wavelength_nm: refractive_index(material, wavelength_nm)
+    return lambda wavelength_nm: np.full(np.shape(wavelength_nm), float(material))
+
+def compute_map(glass, solvent, d_nm, m):
+    n_glass = index_function(glass)
+    n_solvent = index_function(solvent)
+    antiresonances_nm = lambda_antires(d_nm, n_glass, n_solvent, m[:, np.newaxis])
+    resonances_nm = lambda_antires(d_nm, n_glass, n_solvent, m[:, np.newaxis] + 0.5)
+    return antiresonances_nm.astype(np.float32), resonances_nm.astype(np.float32)
+
+def material_label(material):
+    return material if isinstance(material, str) else f"n={material:g}"
+
+def generate_maps(glasses=GLASSES, solvents=SOLVENTS, d_nm=WALL_THICKNESSES_NM, max_order=MAX_RESONANCE_ORDER,
+                  maps_path=MAPS_PATH, max_workers=None):
+    m = np.arange(0, max_order + 1)
+    # Fill the material cache once here, so the workers only read it
+    for material in list(glasses) + list(solvents):
+        if isinstance(material, str) and material in MATERIAL_IDS:
+            load_material(material)
+    if 'mixture' in solvents:
+        load_material('Glycerol')
+        load_material('Water')
+    shape = (len(glasses), len(solvents), len(m), len(d_nm))
+    os.makedirs(os.path.dirname(maps_path), exist_ok=True)
+    # spawn, and the pool before the output file: forked workers would inherit the open
+    # HDF5 handle and library state
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool, \
+         h5py.File(maps_path, "w") as file:
+        file.create_dataset("wall_thickness_nm", data=d_nm)
+        file.create_dataset("order", data=m)
+        file.create_dataset("glass", data=[material_label(glass) for glass in glasses])
+        file.create_dataset("solvent", data=[material_label(solvent) for solvent in solvents])
+        chunks = (1, 1, len(m), len(d_nm))
+        antiresonances = file.create_dataset("antiresonance_nm", shape, dtype=np.float32, chunks=chunks, compression="gzip", shuffle=True, fillvalue=np.nan)
+        resonances = file.create_dataset("resonance_nm", shape, dtype=np.float32, chunks=chunks, compression="gzip", shuffle=True, fillvalue=np.nan)
+        futures = {}
+        for i, glass in enumerate(glasses):
+            for j, solvent in enumerate(solvents):
+                futures[(i, j)] = pool.submit(compute_map, glass, solvent, d_nm, m)
+        for (i, j), future in futures.items():
+            antiresonances[i, j], resonances[i, j] = future.result()
+            print(f"Map {material_label(glasses[i])} / {material_label(solvents[j])} done")
+    print(f"Wrote {len(futures)} maps of {len(m)} orders x {len(d_nm)} wall thicknesses to {maps_path}")
+    return maps_path
+
+def load_map(glass, solvent, maps_path=MAPS_PATH):
+    with h5py.File(maps_path, "r") as file:
+        glasses = [name.decode() for name in file["glass"][()]]
+        solvents = [name.decode() for name in file["solvent"][()]]
+        i = glasses.index(material_label(glass))
+        j = solvents.index(material_label(solvent))
+        return file["wall_thickness_nm"][()], file["order"][()], file["antiresonance_nm"][i, j], file["resonance_nm"][i, j]
+
+def render_map(glass, solvent, output_path=None, maps_path=MAPS_PATH, expected_d_nm=None, wavelength_of_interest_nm=None):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    d_nm, m, antiresonances_nm, resonances_nm = load_map(glass, solvent, maps_path)
+    fig = Figure(figsize=(14, 8))
+    FigureCanvasAgg(fig)
+    ax1 = fig.add_subplot(1, 1, 1)
+    for order in m:
+        line = ax1.plot(d_nm, antiresonances_nm[order], label=f"m = {order}, AR", linestyle='--', linewidth=4.0)[0]
+        ax1.plot(d_nm, resonances_nm[order], label=f"m = {order+1}, R", linestyle='-', linewidth=4.0, color=line.get_color())
+    if expected_d_nm is not None:
+        ax1.axvspan(*expected_d_nm, alpha=0.5, color='grey')
+    if wavelength_of_interest_nm is not None:
+        ax1.axhspan(*wavelength_of_interest_nm, alpha=0.5, color='green')
+    ax1.set_xlabel('Wall thickness d / nm')
+    ax1.set_ylabel('m-th (anti-) resonance / nm')
+    ax1.set_title(f"Antiresonant guidance chart: {material_label(glass)} walls filled with {material_label(solvent)}")
+    fig.tight_layout()
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(maps_path), f"arrow_{material_label(glass)}_{material_label(solvent)}.png")
+    fig.savefig(output_path, dpi=600)
+    print(f"Saved {output_path}")
+    return output_path
+
+def main():
+    generate_maps()
+    render_map('Silica', 'Water', expected_d_nm=(180, 220))
+
+if __name__ == "__main__":
+    main()
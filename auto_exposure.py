@@ -0,0 +1,163 @@
+import time
+import numpy as np
+
+# Peak counts as a fraction of full scale: aim for the target, leave the integration time
+# alone anywhere inside the band, and treat anything at the saturation fraction as clipped
+TARGET_FRACTION = 0.75
+LOW_FRACTION = 0.55
+HIGH_FRACTION = 0.90
+SATURATION_FRACTION = 0.98
+MAX_PROBES = 12
+# A single step never scales the integration time by more than this
+MAX_STEP = 10.0
+HOLD_SPECTRA = 5
+
+def peak_counts(intensities, window=None):
+    intensities = np.asarray(intensities)
+    return float(np.max(intensities if window is None else intensities[window]))
+
+def next_integration_time(integration_time_micros, peak, max_intensity, limits, target_fraction=TARGET_FRACTION,
+                          saturation_fraction=SATURATION_FRACTION, max_step=MAX_STEP):
+    # Dark-corrected counts grow linearly with integration time, so one step lands on the
+    # target unless the peak was clipped; a clipped peak says only that the signal is too
+    # bright by some unknown amount, so the time is halved and measured again
+    if peak >= saturation_fraction * max_intensity:
+        step = 0.5
+    elif peak <= 0:
+        step = max_step
+    else:
+        step = np.clip(target_fraction * max_intensity / peak, 1 / max_step, max_step)
+    minimum, maximum = limits
+    return int(np.clip(round(integration_time_micros * step), minimum, maximum))
+
+def converge_integration_time(session, initial_integration_time_ms=None, target_fraction=TARGET_FRACTION,
+                              low_fraction=LOW_FRACTION, high_fraction=HIGH_FRACTION, max_probes=MAX_PROBES,
+                              max_integration_time_ms=None, window=None):
+    # Probe acquisitions until the peak sits inside the band. Starting short keeps the
+    # probes fast: a dim signal is then found in a few x10 steps rather than waiting out
+    # long saturated exposures.
+    minimum, maximum = session.integration_time_micros_limits
+    if max_integration_time_ms is not None:
+        maximum = min(maximum, int(max_integration_time_ms * 1000))
+    if initial_integration_time_ms is None:
+        integration_time_micros = max(minimum, 1000)
+    else:
+        integration_time_micros = int(np.clip(initial_integration_time_ms * 1000, minimum, maximum))
+    probes = []
+    converged = False
+    for probe in range(max_probes):
+        session.integration_time_micros(integration_time_micros)
+        # The first read after a change can still hold a spectrum integrated at the old time
+        session.intensities()
+        peak = peak_counts(session.intensities(), window)
+        fraction = peak / session.max_intensity
+        probes.append((integration_time_micros / 1000, fraction))
+        saturated = fraction >= SATURATION_FRACTION
+        if low_fraction <= fraction <= high_fraction and not saturated:
+            converged = True
+            break
+        proposed = next_integration_time(integration_time_micros, peak, session.max_intensity, (minimum, maximum), target_fraction)
+        if proposed == integration_time_micros:
+            # Pinned at a limit: too dim at the longest allowed time or too bright at the shortest
+            break
+        integration_time_micros = proposed
+    integration_time_ms = integration_time_micros / 1000
+    if converged:
+        print(f"Integration time {integration_time_ms:g} ms puts the peak at {fraction:.0%} of full scale ({len(probes)} probes)")
+    else:
+        print(f"Auto-exposure did not converge after {len(probes)} probes: peak at {fraction:.0%} of full scale "
+              f"with {integration_time_ms:g} ms")
+    return {
+        'integration_time_ms': integration_time_ms,
+        'peak_fraction': fraction,
+        'converged': converged,
+        'probes': probes,
+    }
+
+class AutoExposure:
+    # Keeps the exposure right during a run. Decisions use the median peak of the last
+    # hold_spectra spectra, and the integration time changes only when that leaves the band
+    # (or a spectrum clips), so noise and a slowly drifting source do not make it hunt.
+    def __init__(self, session, integration_time_ms, target_fraction=TARGET_FRACTION, low_fraction=LOW_FRACTION,
+                 high_fraction=HIGH_FRACTION, hold_spectra=HOLD_SPECTRA, max_integration_time_ms=None, window=None):
+        self.session = session
+        self.target_fraction = target_fraction
+        self.low_fraction = low_fraction
+        self.high_fraction = high_fraction
+        self.hold_spectra = hold_spectra
+        self.window = window
+        minimum, maximum = session.integration_time_micros_limits
+        if max_integration_time_ms is not None:
+            maximum = min(maximum, int(max_integration_time_ms * 1000))
+        self.limits = (minimum, maximum)
+        self.nominal_integration_time_micros = int(round(integration_time_ms * 1000))
+        self.integration_time_micros = self.nominal_integration_time_micros
+        session.integration_time_micros(self.integration_time_micros)
+        self.recent_peaks = []
+        self.spectra_seen = 0
+        self.changes = []
+
+    @property
+    def integration_time_ms(self):
+        return self.integration_time_micros / 1000
+
+    def scale_to_nominal(self):
+        # Factor taking counts at the current integration time to the run's nominal one
+        return self.nominal_integration_time_micros / self.integration_time_micros
+
+    def update(self, intensities, timestamp=None):
+        # Call with every raw spectrum (before background subtraction); returns True when
+        # the integration time was changed for the next acquisition
+        self.spectra_seen += 1
+        peak = peak_counts(intensities, self.window)
+        saturated = peak >= SATURATION_FRACTION * self.session.max_intensity
+        self.recent_peaks = (self.recent_peaks + [peak])[-self.hold_spectra:]
+        if len(self.recent_peaks) < self.hold_spectra and not saturated:
+            return False
+        typical_peak = float(np.median(self.recent_peaks))
+        if not saturated and self.low_fraction <= typical_peak / self.session.max_intensity <= self.high_fraction:
+            return False
+        proposed = next_integration_time(self.integration_time_micros, peak if saturated else typical_peak,
+                                         self.session.max_intensity, self.limits, self.target_fraction)
+        if proposed == self.integration_time_micros:
+            return False
+        self.changes.append((time.time() if timestamp is None else timestamp, self.spectra_seen,
+                             self.integration_time_micros / 1000, proposed / 1000, peak / self.session.max_intensity))
+        print(f"Auto-exposure: {self.integration_time_micros / 1000:g} -> {proposed / 1000:g} ms "
+              f"(peak {peak / self.session.max_intensity:.0%} of full scale{', saturated' if saturated else ''})")
+        self.integration_time_micros = proposed
+        self.session.integration_time_micros(proposed)
+        # Peaks measured at the old integration time no longer apply
+        self.recent_peaks = []
+        return True
+
+    def save_changes(self, group):
+        # One row per change next to the spectra, e.g. in a SpectraWriter's group
+        changes = np.array(self.changes, dtype=np.float64).reshape(-1, 5)
+        if "exposure_changes" in group:
+            del group["exposure_changes"]
+        dataset = group.create_dataset("exposure_changes", data=changes)
+        dataset.attrs["columns"] = "timestamp, spectrum_number, old_integration_time_ms, new_integration_time_ms, peak_fraction"
+        group.attrs["nominal_integration_time_ms"] = self.nominal_integration_time_micros / 1000
+        group.attrs["final_integration_time_ms"] = self.integration_time_ms
+        group.attrs["auto_exposure_target_fraction"] = self.target_fraction
+        group.attrs["auto_exposure_band"] = np.array([self.low_fraction, self.high_fraction])
+
+def main():
+    from spectrometer_session import SpectrometerSession
+    from spectrometer_simulator import SimulatedSpectrometer
+    device = SimulatedSpectrometer(seed=0)
+    session = SpectrometerSession(device)
+    for initial_integration_time_ms in (None, 200):
+        result = converge_integration_time(session, initial_integration_time_ms)
+        print(f"  probes: {', '.join(f'{ms:g} ms -> {fraction:.0%}' for ms, fraction in result['probes'])}")
+    controller = AutoExposure(session, result['integration_time_ms'])
+    # The source fades to a third of its power halfway through, then recovers
+    bright = device.signal_rate.copy()
+    for index in range(120):
+        device.signal_rate = bright / 3 if 40 <= index < 80 else bright
+        controller.update(session.intensities())
+    print(f"{len(controller.changes)} integration time changes, now {controller.integration_time_ms:g} ms")
+
+if __name__ == "__main__":
+    main()
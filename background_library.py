@@ -0,0 +1,127 @@
+import os
+import time
+import h5py
+import numpy as np
+
+LIBRARY_PATH = os.path.join(".", ".h5_files", "background_library.h5")
+MAX_AGE_HOURS = 24.0
+TEMPERATURE_TOLERANCE_C = 1.0
+
+loaded_backgrounds = {}
+
+def entry_group_name(serial_number, integration_time_micros, scans_to_average=1):
+    # One group per device and setting; each holds the backgrounds recorded for it over time
+    return f"{serial_number}/{int(integration_time_micros)}us_x{int(scans_to_average)}"
+
+def is_usable(attributes, temperature_c, max_age_hours, temperature_tolerance_c, now):
+    age_hours = (now - attributes["acquired"]) / 3600
+    if max_age_hours is not None and age_hours > max_age_hours:
+        return False, f"{age_hours:.1f} h old (limit {max_age_hours:g} h)"
+    if temperature_c is not None:
+        recorded_c = attributes.get("temperature_c", np.nan)
+        if not abs(recorded_c - temperature_c) <= temperature_tolerance_c:
+            return False, f"recorded at {recorded_c:.1f} C, now {temperature_c:.1f} C"
+    return True, f"{age_hours:.1f} h old"
+
+def find_background(serial_number, integration_time_micros, scans_to_average=1, temperature_c=None,
+                    max_age_hours=MAX_AGE_HOURS, temperature_tolerance_c=TEMPERATURE_TOLERANCE_C, library_path=LIBRARY_PATH):
+    # Newest matching background that is still fresh, or None
+    name = entry_group_name(serial_number, integration_time_micros, scans_to_average)
+    if not os.path.exists(library_path):
+        return None
+    now = time.time()
+    with h5py.File(library_path, "r") as library:
+        if name not in library:
+            return None
+        entries = sorted(library[name].keys(), reverse=True)
+        for entry in entries:
+            attributes = dict(library[name][entry].attrs)
+            usable, reason = is_usable(attributes, temperature_c, max_age_hours, temperature_tolerance_c, now)
+            if not usable:
+                print(f"Background {name}/{entry} is stale: {reason}")
+                continue
+            key = (library_path, name, entry)
+            if key not in loaded_backgrounds:
+                group = library[name][entry]
+                loaded_backgrounds[key] = {dataset: group[dataset][()] for dataset in group}
+                loaded_backgrounds[key]["attributes"] = attributes
+            print(f"Using background {name}/{entry} ({reason})")
+            return loaded_backgrounds[key]
+    return None
+
+def store_background(serial_number, integration_time_micros, wavelengths, intensities, scans_to_average=1,
+                     temperature_c=None, std_intensities=None, number_of_spectra=None, library_path=LIBRARY_PATH):
+    name = entry_group_name(serial_number, integration_time_micros, scans_to_average)
+    acquired = time.time()
+    entry = time.strftime("%Y%m%d_%H%M%S", time.localtime(acquired))
+    os.makedirs(os.path.dirname(library_path) or ".", exist_ok=True)
+    with h5py.File(library_path, "a") as library:
+        group = library.require_group(name)
+        suffix = 1
+        while entry in group:
+            suffix += 1
+            entry = f"{time.strftime('%Y%m%d_%H%M%S', time.localtime(acquired))}_{suffix}"
+        group = group.create_group(entry)
+        group.create_dataset("wavelengths", data=np.asarray(wavelengths))
+        group.create_dataset("intensities", data=np.asarray(intensities))
+        if std_intensities is not None:
+            group.create_dataset("std_intensities", data=np.asarray(std_intensities))
+        group.attrs["serial_number"] = serial_number
+        group.attrs["integration_time_micros"] = int(integration_time_micros)
+        group.attrs["scans_to_average"] = int(scans_to_average)
+        group.attrs["acquired"] = acquired
+        group.attrs["acquired_text"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(acquired))
+        if temperature_c is not None:
+            group.attrs["temperature_c"] = temperature_c
+        if number_of_spectra is not None:
+            group.attrs["number_of_spectra"] = number_of_spectra
+    print(f"Stored background {name}/{entry} in {library_path}")
+    return f"{name}/{entry}"
+
+def get_or_acquire(spectrometer, integration_time_micros, acquire, scans_to_average=1, temperature_c=None,
+                   max_age_hours=MAX_AGE_HOURS, temperature_tolerance_c=TEMPERATURE_TOLERANCE_C, library_path=LIBRARY_PATH):
+    # acquire() records a new dark reference and returns a RunningSpectrumStats or plain intensities;
+    # it is only called when the library has nothing fresh for these settings.
+    background = find_background(spectrometer.serial_number, integration_time_micros, scans_to_average, temperature_c,
+                                 max_age_hours, temperature_tolerance_c, library_path)
+    if background is not None:
+        return background["wavelengths"], background["intensities"]
+    print(f"No usable background for {spectrometer.serial_number} at {integration_time_micros} us x{scans_to_average}, acquiring one")
+    result = acquire()
+    if hasattr(result, "mean"):
+        intensities, std_intensities, number_of_spectra = result.mean, result.std, result.count
+    else:
+        intensities, std_intensities, number_of_spectra = np.asarray(result), None, None
+    store_background(spectrometer.serial_number, integration_time_micros, spectrometer.wavelengths(), intensities,
+                     scans_to_average, temperature_c, std_intensities, number_of_spectra, library_path)
+    return np.asarray(spectrometer.wavelengths()), intensities
+
+def list_backgrounds(library_path=LIBRARY_PATH):
+    rows = []
+    if not os.path.exists(library_path):
+        return rows
+    def collect(name, item):
+        if isinstance(item, h5py.Group) and "intensities" in item:
+            rows.append((name, dict(item.attrs)))
+    with h5py.File(library_path, "r") as library:
+        library.visititems(collect)
+    for name, attributes in rows:
+        temperature = attributes.get("temperature_c")
+        print(f"{name}: {attributes['acquired_text']}" + (f", {temperature:.1f} C" if temperature is not None else ""))
+    return rows
+
+def prune_backgrounds(max_age_hours=7 * 24.0, library_path=LIBRARY_PATH):
+    # Old references are deleted (the file keeps its size until h5repack)
+    now = time.time()
+    removed = []
+    with h5py.File(library_path, "a") as library:
+        stale = []
+        def collect(name, item):
+            if isinstance(item, h5py.Group) and "acquired" in item.attrs and (now - item.attrs["acquired"]) / 3600 > max_age_hours:
+                stale.append(name)
+        library.visititems(collect)
+        for name in stale:
+            del library[name]
+            removed.append(name)
+    print(f"Removed {len(removed)} backgrounds older than {max_age_hours:g} h")
+    return removed
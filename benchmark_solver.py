@@ -0,0 +1,133 @@
+import json
+import multiprocessing
+import os
+import platform
+import time
+import numpy as np
+import scipy
+from ModeSolverFD import initialize_parameters, assemble_operators, calculate_Qs, factorize_Q, solve_eigenmodes, calculate_fields
+from fdfd_geometries import GEOMETRIES, um
+from resource_planner import HISTORY_PATH, load_history
+from solver_events import peak_rss_mb, count_matvecs
+from benchmark_common import git_commit
+
+LAM = 0.65 * um
+NO_MODES = 2
+NX_VALUES = (40, 60, 80)
+HALF_WIDTHS = {'ring': 6 * um, 'arpcf': 81 * um, 'double_clad': 26 * um}
+BENCHMARK_CASES = [
+    ('ring', 'ModeSolverFD'),
+    ('arpcf', 'ModeSolverFD'),
+    ('double_clad', 'ModeSolverFD'),
+    ('ring', 'fdfd'),
+]
+REGRESSION_THRESHOLD = 0.2
+MIN_PHASE_SECONDS = 0.01
+
+def timed_phase(record, phase, function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    record['phases'][phase] = time.perf_counter() - start_time
+    record['phase_peak_rss_mb'][phase] = peak_rss_mb()
+    return result
+
+def run_mode_solver_case(record, geometry, Nx, NoModes):
+    build_index = GEOMETRIES[geometry][0]
+    x = np.linspace(-HALF_WIDTHS[geometry], HALF_WIDTHS[geometry], Nx)
+    x_mesh, y_mesh = np.meshgrid(x, x)
+    n = build_index(x_mesh, y_mesh)
+    dx = x[1] - x[0]
+    eps0, mu0, c, Nx, f, w, k0, PML_Depth, PML_TargetLoss, PML_PolyDegree, PML_SigmaMax, Epsr = initialize_parameters(n, LAM, dx)
+    I, Ax, Ay, Bx, By, Cx, Cy, Dx, Dy, Epsx, Epsy, invEpsz = timed_phase(record, 'assembly', assemble_operators, dx, Nx, Epsr, w, eps0, PML_Depth, PML_PolyDegree, PML_SigmaMax)
+    Q = timed_phase(record, 'Q_construction', calculate_Qs, k0, I, Ax, Ay, Bx, By, Cx, Cy, Dx, Dy, Epsx, Epsy, invEpsz)
+    lu, OPinv = timed_phase(record, 'factorization', factorize_Q, Q, k0**2)
+    OPinv, counter = count_matvecs(OPinv)
+    eigvalues, eigvectors = timed_phase(record, 'eigensolve', solve_eigenmodes, Q, NoModes, k0**2, OPinv)
+    timed_phase(record, 'field_reconstruction', calculate_fields, eigvalues, eigvectors, Nx, NoModes, w, eps0, mu0, Ax, Ay, Bx, By, Dx, Dy, invEpsz)
+    record['nnz_Q'] = int(Q.nnz)
+    record['nnz_LU'] = int(lu.L.nnz + lu.U.nnz)
+    record['arpack_matvecs'] = counter['matvecs']
+
+def run_fdfd_case(record, Nx):
+    import ahmad_FDFD_THESIS as thesis
+    waveguide, dx, dy, x, y = thesis.define_waveguide(Nx, Nx)
+    # fdfd() builds and solves in one pass, so only the total is available
+    timed_phase(record, 'assembly_and_eigensolve', thesis.fdfd, waveguide, dx, dy, thesis.wavelength)
+    record['NoModes'] = thesis.n_modes
+
+def run_case(case):
+    geometry, backend, Nx, NoModes = case
+    record = {'geometry': geometry, 'backend': backend, 'Nx': Nx, 'NoModes': NoModes, 'phases': {}, 'phase_peak_rss_mb': {}}
+    if backend == 'ModeSolverFD':
+        run_mode_solver_case(record, geometry, Nx, NoModes)
+    else:
+        run_fdfd_case(record, Nx)
+    record['wall_s'] = sum(record['phases'].values())
+    record['peak_rss_mb'] = peak_rss_mb()
+    return record
+
+def run_benchmarks(cases=BENCHMARK_CASES, Nx_values=NX_VALUES, NoModes=NO_MODES):
+    run_info = {
+        'run_id': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'commit': git_commit(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+    }
+    records = []
+    # A fresh process per case so the peak RSS belongs to that case alone
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for geometry, backend in cases:
+            for Nx in Nx_values:
+                print(f"Benchmarking {backend} on '{geometry}' at Nx = {Nx}...")
+                record = pool.apply(run_case, ((geometry, backend, Nx, NoModes),))
+                record.update(run_info)
+                records.append(record)
+                print(f"  {record['wall_s']:.2f} s, peak RSS {record['peak_rss_mb']:.0f} MB")
+    return records
+
+def append_history(records, history_path=HISTORY_PATH):
+    os.makedirs(os.path.dirname(history_path), exist_ok=True)
+    with open(history_path, "a") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+    print(f"Appended {len(records)} records to {history_path}")
+
+def case_key(record):
+    return (record['geometry'], record['backend'], record['Nx'], record['NoModes'])
+
+def compare_to_history(records, history, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    print(f"\n{'case':<38}{'phase':<26}{'baseline s':>12}{'now s':>10}{'change':>9}")
+    for record in records:
+        earlier = [entry for entry in history if case_key(entry) == case_key(record) and entry['run_id'] != record['run_id']]
+        case_name = "{} / {} / Nx={} / k={}".format(*case_key(record))
+        if not earlier:
+            print(f"{case_name:<38}no earlier runs")
+            continue
+        measurements = dict(record['phases'], peak_rss_mb=record['peak_rss_mb'])
+        for phase, value in measurements.items():
+            baseline_values = [entry['phases'].get(phase) if phase != 'peak_rss_mb' else entry.get('peak_rss_mb') for entry in earlier]
+            baseline_values = [entry for entry in baseline_values if entry is not None]
+            if not baseline_values or value is None:
+                continue
+            baseline = float(np.median(baseline_values))
+            change = value / baseline - 1 if baseline > 0 else 0.0
+            flag = ""
+            if change > threshold and (phase == 'peak_rss_mb' or baseline >= MIN_PHASE_SECONDS):
+                flag = "  <-- regression"
+                regressions.append((case_name, phase, baseline, value))
+            print(f"{case_name:<38}{phase:<26}{baseline:>12.3f}{value:>10.3f}{change:>+9.0%}{flag}")
+    print(f"\n{len(regressions)} regression(s) above {threshold:.0%}.")
+    return regressions
+
+def main():
+    history = load_history()
+    records = run_benchmarks()
+    append_history(records)
+    compare_to_history(records, history)
+
+if __name__ == "__main__":
+    main()
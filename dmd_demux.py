@@ -0,0 +1,113 @@
+import numpy as np
+from spectra_statistics import RunningSpectrumStats
+
+# switching.py holds each mask for display_period = 0.018 s plus about 2 ms of I2C write
+DISPLAY_PERIOD_SECONDS = 0.020
+NUMBER_OF_SWITCHES = 10
+DISCARDED = -1
+
+def switching_timeline(start_time, number_of_switches=NUMBER_OF_SWITCHES, display_period_seconds=DISPLAY_PERIOD_SECONDS, masks=(0, 1)):
+    # The sequence mask_switching_loop() shows: counter 0..number_of_switches, even counters
+    # on the first mask, odd on the second, each held for one display period
+    counters = np.arange(number_of_switches + 1)
+    switch_times = start_time + counters * display_period_seconds
+    states = np.asarray(masks)[counters % len(masks)]
+    return switch_times, states, switch_times[-1] + display_period_seconds
+
+class MaskDemultiplexer:
+    # Sorts spectra into the DMD mask that was on during their exposure, keeping running
+    # statistics per mask. An exposure that overlaps a switch (or the guard time after one,
+    # while the mirrors settle) mixes two masks and is discarded. Timestamps mark the end of
+    # the exposure by default: AcquisitionPipeline, acquire_burst, acquire_synchronized and
+    # the timelapse record_spectra all stamp a spectrum when its read returns.
+    def __init__(self, switch_times, states, integration_time_seconds, end_time=None, guard_seconds=0.0,
+                 timestamp_position='end', ewm_alpha=None):
+        if timestamp_position not in ('start', 'middle', 'end'):
+            raise ValueError(f"Unknown timestamp position '{timestamp_position}', expected 'start', 'middle' or 'end'")
+        self.switch_times = np.asarray(switch_times, dtype=float)
+        self.states = np.asarray(states)
+        self.end_time = end_time
+        self.integration_time_seconds = integration_time_seconds
+        self.guard_seconds = guard_seconds
+        self.timestamp_position = timestamp_position
+        self.ewm_alpha = ewm_alpha
+        self.stats = {int(state): RunningSpectrumStats(ewm_alpha=ewm_alpha) for state in np.unique(self.states)}
+        self.discarded = 0
+
+    def add_switches(self, switch_times, states, end_time=None):
+        # Live timelines: append switches as the DMD controller reports them
+        self.switch_times = np.concatenate([self.switch_times, switch_times])
+        self.states = np.concatenate([self.states, states])
+        self.end_time = end_time
+        for state in np.unique(states):
+            self.stats.setdefault(int(state), RunningSpectrumStats(ewm_alpha=self.ewm_alpha))
+
+    def exposure_windows(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=float)
+        if self.timestamp_position == 'end':
+            return timestamps - self.integration_time_seconds, timestamps
+        if self.timestamp_position == 'start':
+            return timestamps, timestamps + self.integration_time_seconds
+        return timestamps - self.integration_time_seconds / 2, timestamps + self.integration_time_seconds / 2
+
+    def classify(self, timestamps):
+        starts, ends = self.exposure_windows(timestamps)
+        # Index of the last switch at or before each instant
+        first = np.searchsorted(self.switch_times, starts - self.guard_seconds, side='right') - 1
+        last = np.searchsorted(self.switch_times, ends, side='right') - 1
+        valid = (first >= 0) & (first == last)
+        if self.end_time is not None:
+            valid &= ends <= self.end_time
+        result = np.full(len(starts), DISCARDED, dtype=np.int64)
+        result[valid] = self.states[first[valid]]
+        return result
+
+    def process(self, spectra, timestamps, first_index=0):
+        # Same signature as an AcquisitionPipeline stage
+        spectra = np.asarray(spectra)
+        states = self.classify(timestamps)
+        for state, stats in self.stats.items():
+            selected = states == state
+            if np.any(selected):
+                stats.update_many(spectra[selected])
+        self.discarded += int(np.sum(states == DISCARDED))
+        return states
+
+    def averages(self):
+        return {state: stats.mean for state, stats in self.stats.items()}
+
+    def counts(self):
+        counts = {state: stats.count for state, stats in self.stats.items()}
+        counts['discarded'] = self.discarded
+        return counts
+
+def demultiplex_file(path, switch_times, states, integration_time_seconds, **options):
+    # Offline pass over a SpectraWriter file, block by block
+    from spectra_writer import read_spectra
+    demultiplexer = MaskDemultiplexer(switch_times, states, integration_time_seconds, **options)
+    wavelengths, intensities, timestamps = read_spectra(path)
+    for start in range(0, len(timestamps), 1024):
+        demultiplexer.process(intensities[start:start + 1024], timestamps[start:start + 1024])
+    return wavelengths, demultiplexer
+
+def main():
+    rng = np.random.default_rng(0)
+    integration_time_seconds = 0.003
+    switch_times, states, end_time = switching_timeline(1000.0, number_of_switches=200)
+    mask_spectra = {0: np.full(512, 1000.0), 1: np.full(512, 1500.0)}
+    # Free-running reads every 3.4 ms, unrelated to the DMD clock
+    timestamps = np.arange(1000.0 + integration_time_seconds, end_time, 0.0034)
+    demultiplexer = MaskDemultiplexer(switch_times, states, integration_time_seconds, end_time=end_time, guard_seconds=0.0005)
+    # Exposures across a switch see a mixture of both masks
+    instants = timestamps[:, np.newaxis] - integration_time_seconds * np.linspace(0, 1, 16)
+    shown = states[np.searchsorted(switch_times, instants, side='right') - 1]
+    fraction_on_1 = np.mean(shown == 1, axis=1)[:, np.newaxis]
+    spectra = (1 - fraction_on_1) * mask_spectra[0] + fraction_on_1 * mask_spectra[1] + rng.normal(0, 20, (len(timestamps), 512))
+    for start in range(0, len(timestamps), 64):
+        demultiplexer.process(spectra[start:start + 64], timestamps[start:start + 64])
+    print(demultiplexer.counts())
+    for state, average in demultiplexer.averages().items():
+        print(f"Mask {state}: mean {np.mean(average):.1f} counts")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import itertools
+import numpy as np
+from ModeSolverFD import ModeSolverFD
+from fdfd_geometries import GEOMETRIES, um
+
+def loss_dB_per_cm(beta):
+    return 20 / np.log(10) * np.abs(np.imag(beta)) / 100
+
+def domain_grid(r_outer, padding, PML_Depth, dx):
+    half_width = r_outer + padding + PML_Depth * dx
+    Nx = int(np.ceil(2 * half_width / dx)) + 1
+    x = (np.arange(Nx) - (Nx - 1) / 2) * dx
+    return x, Nx
+
+def probe_solve(build_index, r_outer, lam, dx, padding, PML_Depth, PML_TargetLoss, PML_PolyDegree, NoModes, neff_guess=1.0):
+    x, Nx = domain_grid(r_outer, padding, PML_Depth, dx)
+    x_mesh, y_mesh = np.meshgrid(x, x)
+    n = build_index(x_mesh, y_mesh)
+    k0 = 2 * np.pi / lam
+    RetVal = ModeSolverFD(dx, n, lam, neff_guess * k0, NoModes, PML_Depth, PML_TargetLoss, PML_PolyDegree)[0]
+    beta = np.diag(RetVal['beta'])
+    beta = beta[np.argsort(-np.real(beta))]
+    return {'Nx': Nx, 'neff': beta / k0, 'loss_dB_per_cm': loss_dB_per_cm(beta)}
+
+def within_tolerance(probe, reference, loss_tolerance, neff_tolerance):
+    loss_error = np.abs(probe['loss_dB_per_cm'] - reference['loss_dB_per_cm']) / np.maximum(reference['loss_dB_per_cm'], 1e-12)
+    neff_error = np.abs(np.real(probe['neff'] - reference['neff']))
+    return np.all(loss_error <= loss_tolerance) and np.all(neff_error <= neff_tolerance)
+
+def optimize_domain(build_index, r_outer, lam, NoModes=2, lam_dx_ratio=10, neff_guess=1.0,
+                    paddings_in_lam=(0.5, 1, 2, 3, 5), PML_Depths=(5, 8, 10, 15),
+                    PML_TargetLosses=(1e-3, 1e-5, 1e-8), PML_PolyDegrees=(2, 3, 4),
+                    loss_tolerance=0.05, neff_tolerance=1e-4, max_probes=25, reference_profile=None):
+    dx = lam / lam_dx_ratio
+    # The reference is the strictest point of the grid: most padding, deepest PML, lowest
+    # target loss and highest grading degree, unless a profile is given explicitly
+    if reference_profile is None:
+        reference_profile = (min(PML_TargetLosses), max(PML_PolyDegrees))
+    reference_settings = (max(paddings_in_lam) * lam, max(PML_Depths), *reference_profile)
+    print(f"Reference probe: padding = {reference_settings[0]/um:.2f} um, PML_Depth = {reference_settings[1]}, "
+          f"target loss {reference_settings[2]:g}, degree {reference_settings[3]}")
+    reference = probe_solve(build_index, r_outer, lam, dx, *reference_settings, NoModes, neff_guess)
+    reference_candidates, profile_candidates = [], []
+    for padding_in_lam, PML_Depth, PML_TargetLoss, PML_PolyDegree in itertools.product(paddings_in_lam, PML_Depths, PML_TargetLosses, PML_PolyDegrees):
+        settings = (padding_in_lam * lam, PML_Depth, PML_TargetLoss, PML_PolyDegree)
+        if settings == reference_settings:
+            continue
+        Nx = domain_grid(r_outer, settings[0], PML_Depth, dx)[1]
+        if (PML_TargetLoss, PML_PolyDegree) == tuple(reference_profile):
+            reference_candidates.append((Nx, settings))
+        else:
+            profile_candidates.append((Nx, settings))
+    chosen_settings, chosen = reference_settings, reference
+    probe_count = 0
+    # Shrink the domain with the reference PML profile first, then see whether a
+    # different profile lets an even smaller grid pass.
+    for candidates in (sorted(reference_candidates), sorted(profile_candidates)):
+        for Nx, settings in candidates:
+            if probe_count >= max_probes or Nx >= chosen['Nx']:
+                break
+            probe = probe_solve(build_index, r_outer, lam, dx, *settings, NoModes, neff_guess)
+            probe_count += 1
+            print(f"Probe {probe_count}: Nx = {Nx}, padding = {settings[0]/um:.2f} um, PML = {settings[1:]}, loss = {probe['loss_dB_per_cm']} dB/cm")
+            if within_tolerance(probe, reference, loss_tolerance, neff_tolerance):
+                chosen_settings, chosen = settings, probe
+                break
+    if chosen is reference:
+        print("No cheaper domain found within the probe budget, keeping the reference domain.")
+    padding, PML_Depth, PML_TargetLoss, PML_PolyDegree = chosen_settings
+    choice = {
+        'r_outer': r_outer,
+        'lam': lam,
+        'padding': padding,
+        'PML_Thickness': PML_Depth * dx,
+        'PML_TargetLoss': PML_TargetLoss,
+        'PML_PolyDegree': PML_PolyDegree,
+        'probe_Nx': chosen['Nx'],
+        'reference_Nx': reference['Nx'],
+        'neff': chosen['neff'],
+        'loss_dB_per_cm': chosen['loss_dB_per_cm'],
+    }
+    print(f"Chosen domain: half width = {(r_outer + padding + choice['PML_Thickness'])/um:.2f} um, "
+          f"PML {PML_Depth} cells, target loss {PML_TargetLoss:g}, degree {PML_PolyDegree} "
+          f"({chosen['Nx']**2} unknowns per field vs {reference['Nx']**2})")
+    return choice
+
+def apply_domain(choice, dx):
+    PML_Depth = int(np.ceil(choice['PML_Thickness'] / dx))
+    x, Nx = domain_grid(choice['r_outer'], choice['padding'], PML_Depth, dx)
+    PML_settings = {'PML_Depth': PML_Depth, 'PML_TargetLoss': choice['PML_TargetLoss'], 'PML_PolyDegree': choice['PML_PolyDegree']}
+    return x, Nx, PML_settings
+
+def main():
+    build_index, r_outer = GEOMETRIES['ring']
+    lam = 0.55 * um
+    choice = optimize_domain(build_index, r_outer, lam, NoModes=2, lam_dx_ratio=10)
+    x, Nx, PML_settings = apply_domain(choice, lam / 20)
+    print(f"Production grid at lam/dx = 20: Nx = {Nx}, {PML_settings}")
+
+if __name__ == "__main__":
+    main()
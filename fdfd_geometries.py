@@ -0,0 +1,73 @@
+import numpy as np
+
+um = 1e-6
+
+RING_OUTER_RADIUS = 5.1 * um
+ARPCF_OUTER_RADIUS = 57.5 * um
+DOUBLE_CLAD_OUTER_RADIUS = 26 * um
+
+def ring_index(x_mesh, y_mesh, core_inner_radius=5.0 * um, core_outer_radius=5.1 * um, core_index=1.0, cladding_index=1.45):
+    n = np.ones_like(x_mesh) * core_index
+    r_mesh = np.sqrt(x_mesh**2 + y_mesh**2)
+    n[(r_mesh >= core_inner_radius) & (r_mesh <= core_outer_radius)] = cladding_index
+    return n
+
+def rotated_strut(x_mesh, y_mesh, cx, cy, angle, u_min, u_max, v_min, v_max):
+    u = cx + (x_mesh - cx) * np.cos(angle) - (y_mesh - cy) * np.sin(angle)
+    v = cy + (x_mesh - cx) * np.sin(angle) + (y_mesh - cy) * np.cos(angle)
+    return (u > u_min) & (u < u_max) & (v > v_min) & (v < v_max)
+
+def arpcf_index(x_mesh, y_mesh, n_silica=1.45654, n_core=1.0, r_core=56.3 * um):
+    # Strut layout of the ARPCF in FDFD_Ralf.py
+    r_mesh = np.sqrt(x_mesh**2 + y_mesh**2)
+    n = np.ones_like(x_mesh) * n_silica
+    n[r_mesh < r_core] = n_core
+    n[(x_mesh > -12.5*um) & (x_mesh < 12.5*um) & (y_mesh > 21*um) & (y_mesh < 22.3*um)] = n_silica
+    n[(x_mesh > -12.5*um) & (x_mesh < 12.5*um) & (y_mesh > -22.3*um) & (y_mesh < -21*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, 18.25*um, 11.05*um, np.pi/3, 5.6*um, 30.9*um, 10.4*um, 11.7*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, 18.25*um, -11.05*um, -np.pi/3, 5.6*um, 30.9*um, -11.7*um, -10.4*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, -18.25*um, 11.05*um, -np.pi/3, -30.9*um, -5.6*um, 10.4*um, 11.7*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, -18.25*um, -11.05*um, np.pi/3, -30.9*um, -5.6*um, -11.7*um, -10.4*um)] = n_silica
+    n[(x_mesh > 23.9*um) & (x_mesh < 57.5*um) & (y_mesh > -0.5*um) & (y_mesh < 0.5*um)] = n_silica
+    n[(x_mesh > -57.5*um) & (x_mesh < -23.9*um) & (y_mesh > -0.5*um) & (y_mesh < 0.5*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, 20.2*um, 35.6*um, -np.pi/3, 3.4*um, 37*um, 35.1*um, 36.1*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, -20.2*um, 35.6*um, np.pi/3, -37*um, -3.4*um, 35.1*um, 36.1*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, 20.2*um, -35.6*um, np.pi/3, 3.4*um, 37*um, -36.1*um, -35.1*um)] = n_silica
+    n[rotated_strut(x_mesh, y_mesh, -20.2*um, -35.6*um, -np.pi/3, -37*um, -3.4*um, -36.1*um, -35.1*um)] = n_silica
+    return n
+
+# (center, major axis, minor axis, angle in degrees) of the glass capillaries in double_clad.py;
+# the air holes are the same ellipses with both axes 0.4 um smaller.
+DOUBLE_CLAD_ELLIPSES = [
+    ((-19.35 * um, 4.72 * um), 11.28 * um, 10.28 * um, 166.29),
+    ((-10.30 * um, 17.82 * um), 9.85 * um, 9.82 * um, 120.03),
+    ((4.80 * um, 19.92 * um), 10.42 * um, 9.49 * um, 76.45),
+    ((17.46 * um, 10.08 * um), 10.70 * um, 9.91 * um, 30.00),
+    ((19.58 * um, -4.59 * um), 10.80 * um, 10.09 * um, -13.19),
+    ((10.15 * um, -17.15 * um), 11.20 * um, 10.09 * um, -59.38),
+    ((-4.73 * um, -19.40 * um), 11.36 * um, 9.97 * um, -103.70),
+    ((-16.85 * um, -11.15 * um), 10.70 * um, 10.60 * um, -147.51),
+]
+
+def ellipse_mask(x_mesh, y_mesh, center, major_axis, minor_axis, angle_deg):
+    angle = np.deg2rad(angle_deg)
+    x_rotated = (x_mesh - center[0]) * np.cos(angle) + (y_mesh - center[1]) * np.sin(angle)
+    y_rotated = (y_mesh - center[1]) * np.cos(angle) - (x_mesh - center[0]) * np.sin(angle)
+    return (x_rotated / (major_axis / 2)) ** 2 + (y_rotated / (minor_axis / 2)) ** 2 < 1
+
+def double_clad_index(x_mesh, y_mesh, n_silica=1.45, n_air=1.0, r_core=25.5 * um, r_clad=34.0 * um, wall=0.4 * um):
+    r_mesh = np.sqrt(x_mesh**2 + y_mesh**2)
+    n = np.ones_like(x_mesh) * n_silica
+    n[r_mesh < r_core] = n_air
+    n[r_mesh > r_core + r_clad] = n_air
+    for center, major_axis, minor_axis, angle in DOUBLE_CLAD_ELLIPSES:
+        n[ellipse_mask(x_mesh, y_mesh, center, major_axis, minor_axis, angle)] = n_silica
+    for center, major_axis, minor_axis, angle in DOUBLE_CLAD_ELLIPSES:
+        n[ellipse_mask(x_mesh, y_mesh, center, major_axis - wall, minor_axis - wall, angle)] = n_air
+    return n
+
+GEOMETRIES = {
+    'ring': (ring_index, RING_OUTER_RADIUS),
+    'arpcf': (arpcf_index, ARPCF_OUTER_RADIUS),
+    'double_clad': (double_clad_index, DOUBLE_CLAD_OUTER_RADIUS),
+}
@@ -0,0 +1,190 @@
+import numpy as np
+from dmd_demux import DISCARDED
+
+def square_reference(states, on_state=1):
+    # +1 while the modulating mask is on, -1 otherwise; spectra discarded by the
+    # demultiplexer (straddling a switch) get NaN and are left out
+    states = np.asarray(states)
+    reference = np.where(states == on_state, 1.0, -1.0)
+    reference[states == DISCARDED] = np.nan
+    return reference
+
+def sinusoidal_references(timestamps, frequency_hz, phase=0.0, start_time=None):
+    # Phase measured from start_time, or the first timestamp; streamed blocks need a fixed start_time
+    timestamps = np.asarray(timestamps)
+    argument = 2 * np.pi * frequency_hz * (timestamps - (timestamps[0] if start_time is None else start_time)) + phase
+    return np.cos(argument), np.sin(argument)
+
+def fit_references(normal_matrix, projections, residual_sum_of_squares, count):
+    # Amplitudes and standard errors from the normal equations of the mean-removed
+    # references: (A^T A) c = A^T X, errors from the diagonal of (A^T A)^-1. One degree of
+    # freedom goes to the mean and one to each reference.
+    covariance = np.linalg.inv(normal_matrix)
+    amplitudes = covariance @ projections
+    residual = np.maximum(residual_sum_of_squares - np.sum(amplitudes * projections, axis=0), 0)
+    degrees_of_freedom = max(count - 1 - len(normal_matrix), 1)
+    errors = np.sqrt(np.outer(np.diag(covariance), residual / degrees_of_freedom))
+    return amplitudes, errors
+
+def demodulate(spectra, reference, quadrature=None):
+    # Least-squares amplitudes of the reference (and quadrature) in every pixel at once,
+    # fitted jointly so the two do not leak into each other when they are not exactly
+    # orthogonal: a non-integer number of periods, uneven timestamps or dropped frames.
+    # For a +-1 square reference I is half the on/off difference.
+    spectra = np.asarray(spectra, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    keep = np.isfinite(reference)
+    spectra, reference = spectra[keep], reference[keep]
+    references = [reference]
+    if quadrature is not None:
+        references.append(np.asarray(quadrature, dtype=np.float64)[keep])
+    centred = spectra - spectra.mean(axis=0)
+    design = np.column_stack([signal - signal.mean() for signal in references])
+    amplitudes, errors = fit_references(design.T @ design, design.T @ centred,
+                                        np.einsum('ij,ij->j', centred, centred), len(reference))
+    results = {'count': len(reference)}
+    for index, name in enumerate(('in_phase', 'quadrature')[:len(references)]):
+        results[name] = amplitudes[index]
+        results[f'{name}_error'] = errors[index]
+    if quadrature is not None:
+        results['amplitude'] = np.hypot(results['in_phase'], results['quadrature'])
+        results['phase'] = np.arctan2(results['quadrature'], results['in_phase'])
+    return results
+
+def demodulate_fft(spectra, sample_rate_hz, frequency_hz, noise_bins=8):
+    # Uniformly sampled series: one real FFT down the time axis for all pixels, read at the
+    # modulation bin; neighbouring bins away from it give the noise floor per pixel
+    spectra = np.asarray(spectra, dtype=np.float64)
+    count = len(spectra)
+    spectrum = np.fft.rfft(spectra - spectra.mean(axis=0), axis=0)
+    frequencies = np.fft.rfftfreq(count, 1 / sample_rate_hz)
+    bin_index = int(np.argmin(np.abs(frequencies - frequency_hz)))
+    in_phase = 2 * np.real(spectrum[bin_index]) / count
+    quadrature = -2 * np.imag(spectrum[bin_index]) / count
+    neighbours = [index for offset in range(2, noise_bins + 2) for index in (bin_index - offset, bin_index + offset)
+                  if 0 < index < len(frequencies)]
+    noise = 2 * np.sqrt(np.mean(np.abs(spectrum[neighbours])**2, axis=0)) / count if neighbours else np.full(spectra.shape[1], np.nan)
+    amplitude = np.hypot(in_phase, quadrature)
+    return {
+        'count': count,
+        'frequency_hz': frequencies[bin_index],
+        'in_phase': in_phase,
+        'quadrature': quadrature,
+        'amplitude': amplitude,
+        'phase': np.arctan2(quadrature, in_phase),
+        'noise': noise,
+        'snr': amplitude / noise,
+    }
+
+class StreamingLockIn:
+    # demodulate() on a growing series: running sums of r, q, r^2, q^2, r*q, x, x^2, r*x
+    # and q*x per pixel give the same amplitudes and errors at any time without keeping
+    # the spectra. The quadrature reference is optional, but then needed on every update.
+    def __init__(self, number_of_pixels):
+        self.shift = None
+        self.count = 0
+        self.has_quadrature = None
+        self.sum_r = 0.0
+        self.sum_q = 0.0
+        self.sum_rr = 0.0
+        self.sum_qq = 0.0
+        self.sum_rq = 0.0
+        self.sum_x = np.zeros(number_of_pixels)
+        self.sum_xx = np.zeros(number_of_pixels)
+        self.sum_rx = np.zeros(number_of_pixels)
+        self.sum_qx = np.zeros(number_of_pixels)
+
+    def update(self, spectra, reference, quadrature=None):
+        if self.has_quadrature is None:
+            self.has_quadrature = quadrature is not None
+        elif self.has_quadrature != (quadrature is not None):
+            raise ValueError("Pass a quadrature reference with every update or with none")
+        spectra = np.asarray(spectra, dtype=np.float64)
+        reference = np.asarray(reference, dtype=np.float64)
+        quadrature = np.zeros_like(reference) if quadrature is None else np.asarray(quadrature, dtype=np.float64)
+        keep = np.isfinite(reference)
+        if not np.all(keep):
+            spectra, reference, quadrature = spectra[keep], reference[keep], quadrature[keep]
+        if len(reference) == 0:
+            return
+        if self.shift is None:
+            # Sums around the first spectrum, so x^2 sums do not cancel catastrophically
+            self.shift = spectra[0].copy()
+        spectra = spectra - self.shift
+        self.count += len(reference)
+        self.sum_r += reference.sum()
+        self.sum_q += quadrature.sum()
+        self.sum_rr += reference @ reference
+        self.sum_qq += quadrature @ quadrature
+        self.sum_rq += reference @ quadrature
+        self.sum_x += spectra.sum(axis=0)
+        self.sum_xx += np.einsum('ij,ij->j', spectra, spectra)
+        self.sum_rx += reference @ spectra
+        self.sum_qx += quadrature @ spectra
+
+    def stage(self, reference_function):
+        # AcquisitionPipeline stage; reference_function maps timestamps to reference values,
+        # e.g. lambda t: square_reference(demultiplexer.classify(t)), or to an (in-phase,
+        # quadrature) pair such as lambda t: sinusoidal_references(t, frequency_hz, start_time=start)
+        def process(spectra, timestamps, first_index):
+            references = reference_function(timestamps)
+            if isinstance(references, tuple):
+                self.update(spectra, *references)
+            else:
+                self.update(spectra, references)
+        return process
+
+    def result(self):
+        references = 2 if self.has_quadrature else 1
+        if self.count < references + 2:
+            return None
+        # Sums about the means, as demodulate() sees the mean-removed series
+        count = self.count
+        normal_matrix = np.array([[self.sum_rr - self.sum_r**2 / count, self.sum_rq - self.sum_r * self.sum_q / count],
+                                  [self.sum_rq - self.sum_r * self.sum_q / count, self.sum_qq - self.sum_q**2 / count]])
+        projections = np.array([self.sum_rx - self.sum_r * self.sum_x / count, self.sum_qx - self.sum_q * self.sum_x / count])
+        amplitudes, errors = fit_references(normal_matrix[:references, :references], projections[:references],
+                                            self.sum_xx - self.sum_x**2 / count, count)
+        results = {
+            'count': count,
+            'in_phase': amplitudes[0],
+            'in_phase_error': errors[0],
+            'mean': self.sum_x / count + self.shift,
+        }
+        if self.has_quadrature:
+            results['quadrature'] = amplitudes[1]
+            results['quadrature_error'] = errors[1]
+            results['amplitude'] = np.hypot(amplitudes[0], amplitudes[1])
+            results['phase'] = np.arctan2(amplitudes[1], amplitudes[0])
+            # Error of the magnitude, propagated from both components
+            amplitude_error = np.hypot(amplitudes[0] * errors[0], amplitudes[1] * errors[1]) / results['amplitude']
+            results['snr'] = results['amplitude'] / amplitude_error
+        else:
+            results['snr'] = np.abs(amplitudes[0]) / errors[0]
+        return results
+
+def main():
+    from dmd_demux import MaskDemultiplexer, switching_timeline
+    rng = np.random.default_rng(0)
+    integration_time_seconds = 0.003
+    switch_times, states, end_time = switching_timeline(0.0, number_of_switches=3000)
+    timestamps = np.arange(integration_time_seconds, end_time, 0.0034)
+    wavelengths = np.linspace(400, 900, 1024)
+    # A 0.5 % fluorescence change at 650 nm on a 20000-count background
+    change = 100 * np.exp(-0.5 * ((wavelengths - 650) / 15)**2)
+    demultiplexer = MaskDemultiplexer(switch_times, states, integration_time_seconds, end_time=end_time)
+    shown = demultiplexer.classify(timestamps)
+    spectra = 20000 + np.where(shown[:, np.newaxis] == 1, change, 0) + rng.normal(0, 150, (len(timestamps), len(wavelengths)))
+    lockin = StreamingLockIn(len(wavelengths))
+    for start in range(0, len(timestamps), 256):
+        block = slice(start, start + 256)
+        lockin.update(spectra[block], square_reference(demultiplexer.classify(timestamps[block])))
+    result = lockin.result()
+    peak = np.argmax(change)
+    print(f"{result['count']} spectra: on/off change at 650 nm {2 * result['in_phase'][peak]:.1f} counts "
+          f"(true {change[peak]:.1f}), SNR {result['snr'][peak]:.0f}")
+    batch = demodulate(spectra, square_reference(shown))
+    print(f"Batch demodulation agrees: {np.allclose(batch['in_phase'], result['in_phase'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import numpy as np
+
+DATABASE_PATH = 'C:\\Users\\DELL\\Documents\\optofluidics-master\\optofluidics-master\\Python\\ARROW model\\refractive.db'
+CACHE_DIRECTORY = os.path.join(".", "material_cache")
+SAMPLE_WAVELENGTHS_NM = np.arange(200.0, 2000.5, 0.5)
+
+# refractiveindex.info page ids used by arrow.py
+MATERIAL_IDS = {
+    'Water': 2707,
+    'Silica': 409,
+    'Methanol': 722,
+    'Isopropanol': 731,
+    'Air': 2513,
+    'Glycerol': 747,
+    'SF6': 983,
+}
+
+loaded_materials = {}
+
+def open_database(dbpath=DATABASE_PATH):
+    from refractivesqlite import dboperations as DB
+    print('\nLoading refractiveindex.info database')
+    return DB.Database(dbpath)
+
+def sample_material(material, wavelengths_nm):
+    # The one pass of scalar lookups; tabulated data and dispersion formulas alike
+    # are sampled densely enough that linear interpolation reproduces them.
+    # refractivesqlite raises a bare Exception outside a page's range, indistinguishable
+    # from real failures, so only wavelengths inside the range (in um) are looked up and
+    # any error there propagates instead of being cached as missing data.
+    n = np.full(len(wavelengths_nm), np.nan)
+    k = np.full(len(wavelengths_nm), np.nan)
+    pageinfo = material.pageinfo
+    if not pageinfo['hasrefractive']:
+        return n, k
+    for i, wavelength_nm in enumerate(wavelengths_nm):
+        if not pageinfo['rangeMin'] <= wavelength_nm / 1000 <= pageinfo['rangeMax']:
+            continue
+        n[i] = material.get_refractiveindex(wavelength_nm)
+        if pageinfo['hasextinction']:
+            k[i] = material.get_extinctioncoefficient(wavelength_nm)
+    if np.all(np.isnan(k)):
+        # No extinction data for this page: treat as lossless where n exists
+        k[~np.isnan(n)] = 0.0
+    return n, k
+
+def load_material(name_or_id, database=None, cache_directory=CACHE_DIRECTORY, wavelengths_nm=SAMPLE_WAVELENGTHS_NM):
+    material_id = MATERIAL_IDS.get(name_or_id, name_or_id)
+    wavelengths_nm = np.asarray(wavelengths_nm, dtype=float)
+    # Memoized per cache and sampling grid, so another grid is not served the first one's samples
+    step_nm = wavelengths_nm[1] - wavelengths_nm[0] if len(wavelengths_nm) > 1 else 0.0
+    key = (material_id, cache_directory, (wavelengths_nm[0], wavelengths_nm[-1], step_nm, len(wavelengths_nm)))
+    if key in loaded_materials:
+        return loaded_materials[key]
+    cache_path = os.path.join(cache_directory, f"material_{material_id}.npz")
+    data = None
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached['wavelengths_nm'], wavelengths_nm):
+                data = {name: cached[name] for name in cached.files}
+    if data is None:
+        if database is None:
+            database = open_database()
+        n, k = sample_material(database.get_material(material_id), wavelengths_nm)
+        if np.all(np.isnan(n)):
+            raise ValueError(f"Material {material_id} has no refractive index data between "
+                             f"{wavelengths_nm[0]:.0f} and {wavelengths_nm[-1]:.0f} nm")
+        data = {'wavelengths_nm': np.asarray(wavelengths_nm, dtype=float), 'n': n, 'k': k}
+        os.makedirs(cache_directory, exist_ok=True)
+        np.savez_compressed(cache_path, **data)
+        valid_wavelengths_nm = data['wavelengths_nm'][~np.isnan(n)]
+        print(f"Cached material {material_id} ({len(valid_wavelengths_nm)} samples, "
+              f"{valid_wavelengths_nm[0]:.0f}-{valid_wavelengths_nm[-1]:.0f} nm) to {cache_path}")
+    loaded_materials[key] = data
+    return data
+
+def interpolate(data, values, wavelength_nm):
+    # Samples outside the material's data are NaN, and interp carries them into any
+    # interval that touches one, so out-of-range wavelengths come back as NaN.
+    result = np.interp(wavelength_nm, data['wavelengths_nm'], values, left=np.nan, right=np.nan)
+    return result if np.ndim(result) else float(result)
+
+def refractive_index(name_or_id, wavelength_nm, **load_options):
+    data = load_material(name_or_id, **load_options)
+    return interpolate(data, data['n'], wavelength_nm)
+
+def extinction_coefficient(name_or_id, wavelength_nm, **load_options):
+    data = load_material(name_or_id, **load_options)
+    return interpolate(data, data['k'], wavelength_nm)
+
+def complex_index(name_or_id, wavelength_nm, **load_options):
+    return refractive_index(name_or_id, wavelength_nm, **load_options) + 1j * extinction_coefficient(name_or_id, wavelength_nm, **load_options)
+
+def mixture_index(fractions, wavelength_nm, **load_options):
+    # Volume-fraction weighted index, as for the glycerol/water mixture in arrow.py
+    return sum(fraction * refractive_index(name, wavelength_nm, **load_options) for name, fraction in fractions.items())
+
+def main():
+    wavelengths_nm = np.linspace(400, 1000, 7)
+    for name in MATERIAL_IDS:
+        print(name, np.round(refractive_index(name, wavelengths_nm), 5))
+
+if __name__ == "__main__":
+    main()
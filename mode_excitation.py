@@ -0,0 +1,195 @@
+import time
+import numpy as np
+from scipy import fft, sparse
+from fdfd_geometries import ring_index, um
+from slits_dmd import generate_ring_pattern
+from ModeSolverFD import ModeSolverFD
+
+DMD_SHAPE = (360, 640)
+MICROMIRROR_PITCH = 7.56 * um
+
+def mask_amplitude(masks):
+    # uint8 masks are the 0/255 images written by slits_dmd.py; bool and float masks are 0..1
+    masks = np.asarray(masks)
+    if masks.dtype == np.uint8:
+        return masks.astype(np.float32) / 255
+    return masks.astype(np.float32)
+
+def axis_weights(source, target):
+    position = (target - source[0]) / (source[1] - source[0])
+    lower = np.floor(position).astype(int)
+    valid = (lower >= 0) & (lower + 1 < len(source))
+    lower = np.clip(lower, 0, len(source) - 2)
+    return lower, position - lower, valid
+
+def resampling_matrix(source_x, source_y, target_x, target_y):
+    # Bilinear interpolation from a regular (row = y) source grid onto the target grid,
+    # as a sparse matrix acting on row-major flattened fields.
+    ix, fx, vx = axis_weights(source_x, target_x)
+    iy, fy, vy = axis_weights(source_y, target_y)
+    target_rows = np.arange(len(target_y) * len(target_x)).reshape(len(target_y), len(target_x))
+    rows, columns, weights = [], [], []
+    for dy, wy in ((0, 1 - fy), (1, fy)):
+        for dx, wx in ((0, 1 - fx), (1, fx)):
+            weight = wy[:, np.newaxis] * wx[np.newaxis, :] * (vy[:, np.newaxis] & vx[np.newaxis, :])
+            rows.append(target_rows.ravel())
+            columns.append(((iy + dy)[:, np.newaxis] * len(source_x) + (ix + dx)[np.newaxis, :]).ravel())
+            weights.append(weight.ravel())
+    return sparse.csr_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns))),
+                             shape=(len(target_y) * len(target_x), len(source_y) * len(source_x)))
+
+def modes_from_solver(RetVal, RetVal_Ex, RetVal_Ey, polarization='x'):
+    # Launched light is linearly polarised, so the overlap is with one transverse E component;
+    # modes are normalised to unit transverse power on the solver grid.
+    dA = RetVal['dx']**2
+    components = RetVal_Ex if polarization == 'x' else RetVal_Ey
+    modes = []
+    for i in range(len(components)):
+        power = np.sum(np.abs(RetVal_Ex[i])**2 + np.abs(RetVal_Ey[i])**2) * dA
+        modes.append(components[i] / np.sqrt(power))
+    return np.array(modes)
+
+def build_excitation_model(x, modes, model='fourier', lam=0.65 * um, focal_length=10e-3, magnification=0.01,
+                           pupil_na=None, padding=2, illumination=None, pitch=MICROMIRROR_PITCH, dmd_shape=DMD_SHAPE):
+    Ny, Nx = dmd_shape
+    fft_shape = (padding * Ny, padding * Nx)
+    Py, Px = fft_shape
+    n_x = np.arange(Px) - Px // 2
+    n_y = np.arange(Py) - Py // 2
+    if model == 'fourier':
+        # Single lens, fibre facet in the back focal plane: E(u) = pitch^2/(i lam f) * DFT
+        facet_x = n_x * lam * focal_length / (Px * pitch)
+        facet_y = n_y * lam * focal_length / (Py * pitch)
+        scale = pitch**2 / (1j * lam * focal_length)
+        resampling = resampling_matrix(facet_x, facet_y, x, x)
+        pupil = None
+    elif model == '4f':
+        # Imaging onto the facet with magnification M and an optional NA-limited pupil;
+        # the image is inverted, so fibre point x' samples the DMD at -x'/M.
+        facet_x = n_x * magnification * pitch
+        facet_y = n_y * magnification * pitch
+        scale = 1 / magnification
+        resampling = resampling_matrix(facet_x, facet_y, -x, -x)
+        pupil = None
+        if pupil_na is not None:
+            fx = fft.fftfreq(Px, d=pitch)
+            fy = fft.fftfreq(Py, d=pitch)
+            pupil = (fx[np.newaxis, :]**2 + fy[:, np.newaxis]**2 <= (pupil_na / lam)**2).astype(np.float32)
+    else:
+        raise ValueError(f"Unknown excitation model '{model}', expected 'fourier' or '4f'")
+    if illumination is None:
+        illumination = np.ones(dmd_shape, dtype=np.float32)
+    excitation = {
+        'model': model, 'x': x, 'lam': lam, 'focal_length': focal_length, 'magnification': magnification,
+        'pupil_na': pupil_na, 'pitch': pitch, 'dmd_shape': dmd_shape, 'fft_shape': fft_shape,
+        'facet_x': facet_x, 'facet_y': facet_y, 'scale': scale, 'pupil': pupil,
+        'illumination': np.asarray(illumination, dtype=np.float32), 'resampling': resampling,
+    }
+    dA = (x[1] - x[0])**2
+    modes = np.asarray(modes)
+    excitation['modes'] = modes.reshape(len(modes), -1)
+    # c_k = sum(conj(e_k) R P m) dA = m . (P^T R^T conj(e_k)) dA, so each mode is propagated
+    # back to the DMD once and every later score is a single matrix product.
+    facet_modes = (resampling.T @ (np.conj(excitation['modes']).T * dA)).T.reshape((len(modes),) + fft_shape)
+    patterns = transpose_propagate(excitation, facet_modes) * excitation['illumination']
+    patterns = patterns.reshape(len(modes), -1)
+    illumination_power = (excitation['illumination']**2).ravel() * pitch**2
+    # Real parts, imaginary parts and the input power weights side by side, so one
+    # pass over a batch of masks gives coefficients and normalisation together
+    excitation['weights'] = np.ascontiguousarray(np.vstack([np.real(patterns), np.imag(patterns), illumination_power]).T, dtype=np.float32)
+    return excitation
+
+def pad_centered(fields, fft_shape):
+    Ny, Nx = fields.shape[-2:]
+    Py, Px = fft_shape
+    padded = np.zeros(fields.shape[:-2] + fft_shape, dtype=np.complex64)
+    y0, x0 = Py // 2 - Ny // 2, Px // 2 - Nx // 2
+    padded[..., y0:y0 + Ny, x0:x0 + Nx] = fields
+    return padded
+
+def crop_centered(fields, dmd_shape):
+    Ny, Nx = dmd_shape
+    Py, Px = fields.shape[-2:]
+    y0, x0 = Py // 2 - Ny // 2, Px // 2 - Nx // 2
+    return fields[..., y0:y0 + Ny, x0:x0 + Nx]
+
+def apply_optics(excitation, padded):
+    axes = (-2, -1)
+    if excitation['model'] == 'fourier':
+        return fft.fftshift(fft.fft2(fft.ifftshift(padded, axes=axes), axes=axes, workers=-1), axes=axes)
+    spectrum = fft.fft2(fft.ifftshift(padded, axes=axes), axes=axes, workers=-1)
+    if excitation['pupil'] is not None:
+        spectrum *= excitation['pupil']
+    return fft.fftshift(fft.ifft2(spectrum, axes=axes, workers=-1), axes=axes)
+
+def transpose_propagate(excitation, facet_fields):
+    # DFT matrices are symmetric and the shifts are inverse permutations of each other,
+    # so the transpose of each model is the same chain of FFTs run on the facet grid.
+    axes = (-2, -1)
+    shifted = fft.ifftshift(facet_fields, axes=axes)
+    if excitation['model'] == 'fourier':
+        back = fft.fft2(shifted, axes=axes, workers=-1)
+    else:
+        back = fft.ifft2(shifted, axes=axes, workers=-1)
+        if excitation['pupil'] is not None:
+            back *= excitation['pupil']
+        back = fft.fft2(back, axes=axes, workers=-1)
+    return excitation['scale'] * crop_centered(fft.fftshift(back, axes=axes), excitation['dmd_shape'])
+
+def propagate_masks(excitation, masks):
+    fields = mask_amplitude(masks) * excitation['illumination']
+    return excitation['scale'] * apply_optics(excitation, pad_centered(fields, excitation['fft_shape']))
+
+def facet_fields(excitation, masks):
+    facet = propagate_masks(excitation, masks)
+    facet = facet.reshape(facet.shape[:-2] + (-1,))
+    Nx = len(excitation['x'])
+    return (excitation['resampling'] @ facet.T).T.reshape(facet.shape[:-1] + (Nx, Nx))
+
+def overlap_coefficients(excitation, masks, batch_size=8):
+    # Full propagation, batched through the FFTs; score_masks gives the same numbers faster
+    masks = np.asarray(masks).reshape((-1,) + excitation['dmd_shape'])
+    dA = (excitation['x'][1] - excitation['x'][0])**2
+    coefficients = []
+    for start in range(0, len(masks), batch_size):
+        fibre = facet_fields(excitation, masks[start:start + batch_size]).reshape(-1, excitation['modes'].shape[1])
+        coefficients.append(fibre @ np.conj(excitation['modes']).T * dA)
+    return np.concatenate(coefficients)
+
+def score_masks(excitation, masks, batch_size=256):
+    masks = np.asarray(masks).reshape((-1,) + excitation['dmd_shape'])
+    binary = masks.dtype in (np.uint8, np.bool_)
+    K = excitation['modes'].shape[0]
+    coefficients = np.empty((len(masks), K), dtype=complex)
+    efficiencies = np.empty((len(masks), K))
+    for start in range(0, len(masks), batch_size):
+        amplitude = mask_amplitude(masks[start:start + batch_size]).reshape(-1, excitation['weights'].shape[0])
+        products = amplitude @ excitation['weights']
+        batch = products[:, :K] + 1j * products[:, K:2 * K]
+        # For on/off mirrors amplitude**2 == amplitude, so the power column already holds the input power
+        input_power = products[:, 2 * K] if binary else (amplitude**2) @ excitation['weights'][:, 2 * K]
+        coefficients[start:start + batch_size] = batch
+        # Fraction of the light leaving the DMD that couples into each mode
+        efficiencies[start:start + batch_size] = np.abs(batch)**2 / np.maximum(input_power, 1e-300)[:, np.newaxis]
+    return coefficients, efficiencies
+
+def main():
+    lam = 0.65 * um
+    x = np.linspace(-8 * um, 8 * um, 60)
+    x_mesh, y_mesh = np.meshgrid(x, x)
+    RetVal, RetVal_Ex, RetVal_Ey, RetVal_Ez, RetVal_Hx, RetVal_Hy, \
+    RetVal_Hz, RetVal_Eabs, RetVal_Habs = ModeSolverFD(x[1] - x[0], ring_index(x_mesh, y_mesh), lam, 2 * np.pi / lam, 4, progress=None)
+    modes = modes_from_solver(RetVal, RetVal_Ex, RetVal_Ey)
+    excitation = build_excitation_model(x, modes, 'fourier', lam, focal_length=40e-3)
+    candidates = [(inner, outer) for outer in range(4, 180, 4) for inner in range(0, outer, 4)]
+    masks = np.array([generate_ring_pattern(DMD_SHAPE, inner, outer) for inner, outer in candidates])
+    start_time = time.perf_counter()
+    coefficients, efficiencies = score_masks(excitation, masks)
+    elapsed = time.perf_counter() - start_time
+    print(f"Scored {len(masks)} masks against {len(modes)} modes in {elapsed:.2f} s ({len(masks)/elapsed:.0f} masks/s)")
+    for mode in range(len(modes)):
+        best = np.argmax(efficiencies[:, mode])
+        print(f"Mode {mode}: best ring {candidates[best]} px, coupling efficiency {efficiencies[best, mode]:.3%}")
+
+if __name__ == "__main__":
+    main()
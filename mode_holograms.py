@@ -0,0 +1,126 @@
+import os
+import time
+import numpy as np
+from matplotlib import pyplot as plt
+from scipy.spatial import cKDTree
+from fdfd_geometries import ring_index, um
+from mode_excitation import DMD_SHAPE, MICROMIRROR_PITCH, resampling_matrix
+from ModeSolverFD import ModeSolverFD
+
+LEE_PERIOD_PX = 8
+LEE_ANGLE = np.pi / 4
+SUPERPIXEL_SIZE = 4
+LOOKUP_RESOLUTION = 257
+
+def field_resampler(x, magnification=0.01, shape=DMD_SHAPE, pitch=MICROMIRROR_PITCH, block=1):
+    # The DMD is imaged onto the facet inverted and scaled by the magnification, so DMD
+    # pixel (or superpixel) centre xi shows the fibre field at -M*xi.
+    rows, columns = shape[0] // block, shape[1] // block
+    dmd_x = (np.arange(columns) - (columns - 1) / 2) * block * pitch
+    dmd_y = (np.arange(rows) - (rows - 1) / 2) * block * pitch
+    return resampling_matrix(x, x, -magnification * dmd_x, -magnification * dmd_y), (rows, columns)
+
+def resample_fields(resampler, fields):
+    resampling, shape = resampler
+    fields = np.asarray(fields)
+    flat = fields.reshape(-1, fields.shape[-2] * fields.shape[-1])
+    return (resampling @ flat.T).T.reshape(fields.shape[:-2] + shape)
+
+def lee_carrier(shape=DMD_SHAPE, period_px=LEE_PERIOD_PX, angle=LEE_ANGLE):
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    return (2 * np.pi / period_px * (x * np.cos(angle) + y * np.sin(angle))).astype(np.float32)
+
+def lee_hologram(fields, carrier):
+    # Lee's binary amplitude hologram: the first diffraction order of the carrier grating
+    # carries A*exp(i*phi) when the local duty cycle is arcsin(A)/pi.
+    fields = np.asarray(fields)
+    amplitude = np.abs(fields)
+    amplitude = amplitude / np.maximum(amplitude.max(axis=(-2, -1), keepdims=True), 1e-300)
+    duty = np.arcsin(amplitude) / np.pi
+    masks = np.cos(carrier - np.angle(fields)) > np.cos(np.pi * duty)
+    return masks.astype(np.uint8) * 255
+
+def superpixel_table(size=SUPERPIXEL_SIZE, lookup_resolution=LOOKUP_RESOLUTION):
+    # Goorden et al. superpixels: behind an off-axis spatial filter, pixel (i, j) of a
+    # size x size block contributes the phase 2*pi*(j + size*i)/size^2.
+    pixels = size * size
+    if pixels > 16:
+        raise ValueError("Superpixels larger than 4x4 need more than 2^16 patterns")
+    phases = np.exp(2j * np.pi * np.arange(pixels) / pixels)
+    patterns = ((np.arange(2**pixels)[:, np.newaxis] >> np.arange(pixels)) & 1).astype(bool)
+    fields = patterns @ phases / pixels
+    # Targets are scaled into the largest disc every direction can reach: the furthest
+    # pattern along a direction switches on exactly the pixels that point along it.
+    angles = np.linspace(0, 2 * np.pi, 360, endpoint=False)
+    reach = np.sum(np.maximum(np.real(phases[:, np.newaxis] * np.exp(-1j * angles)), 0), axis=0) / pixels
+    radius = 0.95 * np.min(reach)
+    grid = np.linspace(-radius, radius, lookup_resolution)
+    target_re, target_im = np.meshgrid(grid, grid)
+    tree = cKDTree(np.column_stack([np.real(fields), np.imag(fields)]))
+    nearest = tree.query(np.column_stack([target_re.ravel(), target_im.ravel()]))[1]
+    return {
+        'size': size,
+        'radius': radius,
+        'grid': grid,
+        'lookup': nearest.reshape(lookup_resolution, lookup_resolution),
+        'patterns': (patterns.reshape(-1, size, size) * 255).astype(np.uint8),
+        'fields': fields,
+    }
+
+def superpixel_hologram(fields, table):
+    fields = np.asarray(fields)
+    fields = fields / np.maximum(np.abs(fields).max(axis=(-2, -1), keepdims=True), 1e-300) * table['radius']
+    step = table['grid'][1] - table['grid'][0]
+    last = len(table['grid']) - 1
+    column = np.clip(np.rint((np.real(fields) + table['radius']) / step), 0, last).astype(int)
+    row = np.clip(np.rint((np.imag(fields) + table['radius']) / step), 0, last).astype(int)
+    blocks = table['patterns'][table['lookup'][row, column]]
+    # (..., rows, columns, size, size) -> (..., rows*size, columns*size)
+    blocks = np.swapaxes(blocks, -3, -2)
+    return blocks.reshape(blocks.shape[:-4] + (blocks.shape[-4] * table['size'], blocks.shape[-2] * table['size']))
+
+def mode_holograms(x, fields, method='lee', magnification=0.01, carrier=None, table=None, resampler=None):
+    if method == 'lee':
+        if resampler is None:
+            resampler = field_resampler(x, magnification)
+        if carrier is None:
+            carrier = lee_carrier()
+        return lee_hologram(resample_fields(resampler, fields), carrier)
+    if method == 'superpixel':
+        if table is None:
+            table = superpixel_table()
+        if resampler is None:
+            resampler = field_resampler(x, magnification, block=table['size'])
+        return superpixel_hologram(resample_fields(resampler, fields), table)
+    raise ValueError(f"Unknown hologram method '{method}', expected 'lee' or 'superpixel'")
+
+def save_mask(file_path, mask):
+    # Exact 640 x 360 pixel PNG for display_images.py, one image pixel per micromirror
+    plt.imsave(file_path, mask, cmap='gray', vmin=0, vmax=255)
+
+def main():
+    lam = 0.65 * um
+    x = np.linspace(-8 * um, 8 * um, 60)
+    x_mesh, y_mesh = np.meshgrid(x, x)
+    RetVal, RetVal_Ex, RetVal_Ey, RetVal_Ez, RetVal_Hx, RetVal_Hy, \
+    RetVal_Hz, RetVal_Eabs, RetVal_Habs = ModeSolverFD(x[1] - x[0], ring_index(x_mesh, y_mesh), lam, 2 * np.pi / lam, 4, progress=None)
+    fields = np.array([RetVal_Ex[i] for i in range(len(RetVal_Ex))])
+    folder_name = 'mask_outputs'
+    os.makedirs(folder_name, exist_ok=True)
+    for method in ('lee', 'superpixel'):
+        resampler = field_resampler(x, 0.01, block=SUPERPIXEL_SIZE if method == 'superpixel' else 1)
+        table = superpixel_table() if method == 'superpixel' else None
+        carrier = lee_carrier()
+        start_time = time.perf_counter()
+        frames = 0
+        while time.perf_counter() - start_time < 1:
+            masks = mode_holograms(x, fields, method, carrier=carrier, table=table, resampler=resampler)
+            frames += len(masks)
+        elapsed = time.perf_counter() - start_time
+        print(f"{method}: {frames / elapsed:.0f} masks/s")
+        for i, mask in enumerate(masks):
+            save_mask(os.path.join(folder_name, f'{method}_hologram_mode_{i}.png'), mask)
+    print(f"\nFiles saved in folder '{folder_name}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from fdfd_geometries import ring_index, um
+from ModeSolverFD import ModeSolverFD
+
+PREVIEW_PIXELS = 256
+PREVIEW_DPI = 100
+PUBLICATION_LEVELS = 100
+PUBLICATION_DPI = 600
+
+# Figures are built on the Agg canvas directly, never through pyplot, so nothing
+# here opens a window or blocks on plt.show().
+
+def downsample(field, max_pixels=PREVIEW_PIXELS):
+    step = max(1, int(np.ceil(max(field.shape) / max_pixels)))
+    return field[::step, ::step], step
+
+def neff_title(beta, k0):
+    return 'Effective Index: {:.6g}{:+.6g}j'.format(np.real(beta) / k0, np.imag(beta) / k0)
+
+def label_axes(fig, fillplot, image, label, title):
+    fig.colorbar(image).set_label(label=label, labelpad=12, fontsize=14, weight='bold')
+    fillplot.set_aspect('equal')
+    if title is not None:
+        fillplot.set_title(title, pad=20, fontsize=14, fontweight="bold")
+    fillplot.set_xlabel('\u03bcm', fontsize=14, fontweight="bold")
+    fillplot.set_ylabel('\u03bcm', fontsize=14, fontweight="bold")
+
+def render_preview(x, field, path, label='E_abs', title=None, max_pixels=PREVIEW_PIXELS, dpi=PREVIEW_DPI):
+    field, step = downsample(np.asarray(field), max_pixels)
+    fig = Figure(figsize=(8, 6), dpi=dpi)
+    FigureCanvasAgg(fig)
+    fillplot = fig.add_subplot(1, 1, 1)
+    extent = (x[0] / um, x[-1] / um, x[0] / um, x[-1] / um)
+    image = fillplot.imshow(field, origin='lower', extent=extent, interpolation='nearest')
+    label_axes(fig, fillplot, image, label, title)
+    fig.savefig(path)
+    return path
+
+def render_publication(x, field, path, label='E_abs', title=None, levels=PUBLICATION_LEVELS, dpi=PUBLICATION_DPI):
+    fig = Figure(figsize=(8, 6), dpi=dpi)
+    FigureCanvasAgg(fig)
+    fillplot = fig.add_subplot(1, 1, 1)
+    contourf_ = fillplot.contourf(x / um, x / um, field, levels)
+    label_axes(fig, fillplot, contourf_, label, title)
+    fig.savefig(path)
+    return path
+
+def publication_pool(max_workers=2):
+    # spawn keeps the workers free of the solver's memory and of any GUI backend the parent picked
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def render_modes(x, RetVal, RetVal_Eabs, output_directory, name="mode", pool=None, publication=True):
+    os.makedirs(output_directory, exist_ok=True)
+    betas = np.diag(RetVal['beta'])
+    previews, exports = [], []
+    for i in range(len(betas)):
+        title = neff_title(betas[i], RetVal['k0'])
+        base_path = os.path.join(output_directory, f"{name}_{i}")
+        previews.append(render_preview(x, RetVal_Eabs[i], base_path + "_preview.png", 'E_abs', title))
+        if publication and pool is not None:
+            exports.append(pool.submit(render_publication, x, RetVal_Eabs[i], base_path + ".png", 'E_abs', title))
+    print(f"Wrote {len(previews)} previews to {output_directory}, {len(exports)} exports queued")
+    return previews, exports
+
+def render_index(x, n, output_directory, name="index", pool=None):
+    os.makedirs(output_directory, exist_ok=True)
+    preview = render_preview(x, n, os.path.join(output_directory, f"{name}_preview.png"), 'Refractive Index')
+    export = None
+    if pool is not None:
+        export = pool.submit(render_publication, x, n, os.path.join(output_directory, f"{name}.png"), 'Refractive Index', None, PUBLICATION_LEVELS, 640)
+    return preview, export
+
+def main():
+    lam = 0.65 * um
+    x = np.linspace(-6 * um, 6 * um, 60)
+    x_mesh, y_mesh = np.meshgrid(x, x)
+    n = ring_index(x_mesh, y_mesh)
+    with publication_pool() as pool:
+        index_preview, index_export = render_index(x, n, "./figures", pool=pool)
+        RetVal, RetVal_Ex, RetVal_Ey, RetVal_Ez, RetVal_Hx, RetVal_Hy, \
+        RetVal_Hz, RetVal_Eabs, RetVal_Habs = ModeSolverFD(x[1] - x[0], n, lam, 2 * np.pi / lam, 2)
+        previews, exports = render_modes(x, RetVal, RetVal_Eabs, "./figures", "ring", pool)
+        # The pool drains on exit; a pipeline would carry on instead of waiting here
+        for export in exports + [index_export]:
+            print("Exported", export.result())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import threading
+import time
+import h5py
+import numpy as np
+from acquisition_scheduler import run_schedule
+from spectra_writer import SpectraWriter, read_spectra
+from spectrometer_session import SpectrometerSession
+
+def open_sessions(serial_numbers=None, **session_options):
+    # Every connected spectrometer, or the listed ones in that order (e.g. reference, sample)
+    from seabreeze.spectrometers import list_devices, Spectrometer
+    if serial_numbers is None:
+        spectrometers = [Spectrometer(device) for device in list_devices()]
+    else:
+        spectrometers = [Spectrometer.from_serial_number(serial_number) for serial_number in serial_numbers]
+    sessions = [SpectrometerSession(spectrometer, **session_options) for spectrometer in spectrometers]
+    for session in sessions:
+        print(f"Spectrometer session opened: {session.model} {session.serial_number}, {session.pixels} pixels")
+    return sessions
+
+def acquire_synchronized(sessions, output_path, integration_times_ms, names=None, number_of_spectra=None,
+                         total_duration_seconds=None, interval_seconds=None, attributes=None):
+    # One reader thread per device, all stamping perf_counter() against the same epoch
+    # offset, so timestamps from different devices compare directly. With an interval the
+    # readers share one deadline grid; without one each device runs at its own top speed.
+    if number_of_spectra is None and total_duration_seconds is None:
+        raise ValueError("Give number_of_spectra or total_duration_seconds")
+    if np.ndim(integration_times_ms) == 0:
+        integration_times_ms = [integration_times_ms] * len(sessions)
+    names = [session.serial_number for session in sessions] if names is None else names
+    for session, integration_time_ms in zip(sessions, integration_times_ms):
+        session.integration_time_ms(integration_time_ms)
+    epoch_offset = time.time() - time.perf_counter()
+    barrier = threading.Barrier(len(sessions) + 1)
+    errors = {}
+    counts = {}
+
+    def reader(name, session, writer, shared_start):
+        def read(index):
+            intensities = session.intensities()
+            # Stamped when the read returns, at the end of the exposure, like the pipeline and timelapse files
+            writer.append(intensities, time.perf_counter() + epoch_offset)
+        try:
+            barrier.wait()
+            if interval_seconds:
+                run_schedule(read, interval_seconds, number_of_spectra, total_duration_seconds, verbose=False,
+                             start_time=shared_start[0])
+            else:
+                index = 0
+                while True:
+                    if number_of_spectra is not None and index >= number_of_spectra:
+                        break
+                    if total_duration_seconds is not None and time.perf_counter() - shared_start[0] > total_duration_seconds:
+                        break
+                    read(index)
+                    index += 1
+            counts[name] = len(writer)
+        except Exception as error:
+            errors[name] = error
+
+    with h5py.File(output_path, "a") as file:
+        file.attrs["epoch_offset"] = epoch_offset
+        for key, value in (attributes or {}).items():
+            file.attrs[key] = value
+        writers = []
+        for name, session, integration_time_ms in zip(names, sessions, integration_times_ms):
+            writers.append(SpectraWriter(file.require_group(name), session.wavelengths(), attributes={
+                "serial_number": session.serial_number, "model": session.model,
+                "integration_time_ms": integration_time_ms, "timestamp": "when the read returned (end of the exposure), time.time() seconds"}))
+        shared_start = [None]
+        threads = [threading.Thread(target=reader, args=(name, session, writer, shared_start), name=name, daemon=True)
+                   for name, session, writer in zip(names, sessions, writers)]
+        for thread in threads:
+            thread.start()
+        # Everyone is ready before the common start time is fixed
+        shared_start[0] = time.perf_counter() + 0.01
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        for writer in writers:
+            writer.close()
+    if errors:
+        name, error = next(iter(errors.items()))
+        raise RuntimeError(f"Acquisition on {name} failed: {error}") from error
+    for name in names:
+        print(f"{name}: {counts[name]} spectra")
+    print(f"Saved synchronized spectra from {len(sessions)} spectrometers to {output_path}")
+    return output_path
+
+def align_timestamps(reference_timestamps, timestamps, tolerance_seconds=None):
+    # Nearest reference spectrum for each spectrum; pairs further apart than the tolerance are dropped
+    reference_timestamps = np.asarray(reference_timestamps)
+    timestamps = np.asarray(timestamps)
+    right = np.clip(np.searchsorted(reference_timestamps, timestamps), 1, max(len(reference_timestamps) - 1, 1))
+    left = right - 1
+    right = np.minimum(right, len(reference_timestamps) - 1)
+    nearest = np.where(np.abs(reference_timestamps[left] - timestamps) <= np.abs(reference_timestamps[right] - timestamps), left, right)
+    offsets = reference_timestamps[nearest] - timestamps
+    keep = np.ones(len(timestamps), dtype=bool) if tolerance_seconds is None else np.abs(offsets) <= tolerance_seconds
+    return np.flatnonzero(keep), nearest[keep], offsets[keep]
+
+def referenced_transmission(path, reference_name, sample_name, tolerance_seconds=None):
+    # Sample / reference for time-matched pairs, with the reference resampled onto the
+    # sample's wavelength calibration (the two devices are never calibrated identically)
+    with h5py.File(path, "r") as file:
+        reference_wavelengths, reference_intensities, reference_timestamps = read_spectra(file[reference_name])
+        wavelengths, intensities, timestamps = read_spectra(file[sample_name])
+    sample_index, reference_index, offsets = align_timestamps(reference_timestamps, timestamps, tolerance_seconds)
+    resampled = np.array([np.interp(wavelengths, reference_wavelengths, reference_intensities[i]) for i in reference_index])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        transmission = intensities[sample_index] / resampled
+    return wavelengths, transmission, timestamps[sample_index], offsets
+
+def main():
+    from spectrometer_simulator import SimulatedSpectrometer
+    sessions = [SpectrometerSession(SimulatedSpectrometer(serial_number="REF00001", seed=1)),
+                SpectrometerSession(SimulatedSpectrometer(serial_number="SMP00002", dips=[(600.0, 30.0, 0.6)],
+                                                          wavelength_coefficients=(341.0, 0.3795, -1.57e-5, -2.1e-9), seed=2))]
+    output_path = "multi_spectrometer_demo.h5"
+    acquire_synchronized(sessions, output_path, [10, 10], names=["reference", "sample"], total_duration_seconds=2, interval_seconds=0.05)
+    wavelengths, transmission, timestamps, offsets = referenced_transmission(output_path, "reference", "sample")
+    print(f"{len(timestamps)} referenced spectra, reference offset up to {np.max(np.abs(offsets)) * 1000:.2f} ms, "
+          f"transmission at 600 nm {np.nanmedian(transmission[:, np.argmin(np.abs(wavelengths - 600))]):.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+
+HISTORY_PATH = os.path.join(".", "benchmarks", "solver_history.jsonl")
+
+# Defaults fitted to ModeSolverFD runs on the ring geometry (Nx = 40..160, scipy SuperLU);
+# calibrate_model() rescales them from the benchmark history when it exists.
+DEFAULT_MODEL = {
+    'ModeSolverFD': {
+        'unknowns_per_cell': 2,
+        'nnz_Q_per_unknown': 16.3,
+        'lu_coefficient': 6.75,
+        'lu_exponent': 1.39,
+        'assembly_s_per_cell': 6e-5,
+        'factorization_coefficient': 6.7e-8,
+        'factorization_exponent': 1.7,
+        'eigensolve_s_per_lu_entry': 1.7e-7,
+        'bytes_per_lu_entry': 25,
+        'base_rss_mb': 120,
+        'memory_scale': 1.0,
+        'time_scale': 1.0,
+    },
+    'fdfd': {
+        'unknowns_per_cell': 1,
+        'nnz_Q_per_unknown': 5,
+        'lu_coefficient': 3.0,
+        'lu_exponent': 1.39,
+        'assembly_s_per_cell': 3e-5,
+        'factorization_coefficient': 6.7e-8,
+        'factorization_exponent': 1.7,
+        'eigensolve_s_per_lu_entry': 1.7e-7,
+        'bytes_per_lu_entry': 25,
+        'base_rss_mb': 120,
+        'memory_scale': 1.0,
+        'time_scale': 1.0,
+    },
+}
+
+def estimate_resources(Nx, NoModes, backend='ModeSolverFD', model=None):
+    if model is None:
+        model = DEFAULT_MODEL
+    if backend not in model:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {list(model)}")
+    p = model[backend]
+    cells = Nx * Nx
+    unknowns = p['unknowns_per_cell'] * cells
+    nnz_Q = p['nnz_Q_per_unknown'] * unknowns
+    nnz_LU = p['lu_coefficient'] * unknowns ** p['lu_exponent']
+    ncv = max(2 * NoModes + 1, 20)
+    assembly_s = p['assembly_s_per_cell'] * cells
+    factorization_s = p['factorization_coefficient'] * unknowns ** p['factorization_exponent']
+    eigensolve_s = p['eigensolve_s_per_lu_entry'] * nnz_LU * ncv / 20
+    # LU factors and Q dominate; ARPACK keeps ncv Krylov vectors and the six field
+    # components are held twice (columns and the per-mode Nx x Nx dictionaries).
+    lu_bytes = p['bytes_per_lu_entry'] * nnz_LU
+    q_bytes = 20 * nnz_Q
+    arpack_bytes = 16 * ncv * unknowns
+    field_bytes = 2 * 6 * 16 * NoModes * cells
+    peak_rss_mb = p['base_rss_mb'] + p['memory_scale'] * (lu_bytes + q_bytes + arpack_bytes + field_bytes) / 2**20
+    wall_s = p['time_scale'] * (assembly_s + factorization_s + eigensolve_s)
+    return {
+        'backend': backend,
+        'Nx': Nx,
+        'NoModes': NoModes,
+        'unknowns': int(unknowns),
+        'nnz_Q': int(nnz_Q),
+        'nnz_LU': int(nnz_LU),
+        'peak_rss_mb': peak_rss_mb,
+        'wall_s': wall_s,
+        'assembly_s': p['time_scale'] * assembly_s,
+        'factorization_s': p['time_scale'] * factorization_s,
+        'eigensolve_s': p['time_scale'] * eigensolve_s,
+    }
+
+def load_history(history_path=HISTORY_PATH):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+calibrated_models = {}
+
+def calibrate_model(history_path=HISTORY_PATH, model=None):
+    # Sweeps plan every point: the default model is refitted only when the history file
+    # has changed since the last call
+    key = None
+    if model is None:
+        model = DEFAULT_MODEL
+        mtime = os.path.getmtime(history_path) if os.path.exists(history_path) else None
+        key = (os.path.abspath(history_path), mtime)
+        if key in calibrated_models:
+            return calibrated_models[key]
+    model = {backend: dict(params) for backend, params in model.items()}
+    records = load_history(history_path)
+    for backend, params in model.items():
+        runs = [record for record in records if record.get('backend') == backend]
+        if not runs:
+            continue
+        memory_ratios, time_ratios, lu_ratios = [], [], []
+        for record in runs:
+            estimate = estimate_resources(record['Nx'], record['NoModes'], backend, model)
+            if record.get('nnz_LU'):
+                lu_ratios.append(record['nnz_LU'] / estimate['nnz_LU'])
+            if record.get('peak_rss_mb'):
+                memory_ratios.append((record['peak_rss_mb'] - params['base_rss_mb']) / (estimate['peak_rss_mb'] - params['base_rss_mb']))
+            if record.get('wall_s'):
+                time_ratios.append(record['wall_s'] / estimate['wall_s'])
+        if lu_ratios:
+            params['lu_coefficient'] *= float(np.median(lu_ratios))
+        if memory_ratios:
+            params['memory_scale'] *= max(float(np.median(memory_ratios)), 0.1)
+        if time_ratios:
+            params['time_scale'] *= float(np.median(time_ratios))
+        print(f"Calibrated '{backend}' from {len(runs)} benchmark records.")
+    if key is not None:
+        calibrated_models[key] = model
+    return model
+
+def available_memory_mb():
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 2**20
+    except ImportError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def plan_run(Nx, NoModes, backend='ModeSolverFD', memory_budget_mb=None, on_exceed='downscale', min_Nx=20, history_path=HISTORY_PATH):
+    model = calibrate_model(history_path)
+    if memory_budget_mb is None:
+        available_mb = available_memory_mb()
+        memory_budget_mb = 0.8 * available_mb if available_mb is not None else np.inf
+    estimate = estimate_resources(Nx, NoModes, backend, model)
+    print(f"Estimated {backend} run at Nx = {Nx}: {estimate['unknowns']} unknowns, nnz(Q) = {estimate['nnz_Q']:.3g}, "
+          f"nnz(LU) = {estimate['nnz_LU']:.3g}, peak RSS = {estimate['peak_rss_mb']:.0f} MB, wall time = {estimate['wall_s']:.1f} s")
+    plan = {'requested_Nx': Nx, 'Nx': Nx, 'memory_budget_mb': memory_budget_mb, 'downscaled': False, 'estimate': estimate}
+    if estimate['peak_rss_mb'] <= memory_budget_mb:
+        return plan
+    if on_exceed == 'refuse':
+        raise MemoryError(f"Nx = {Nx} needs about {estimate['peak_rss_mb']:.0f} MB, budget is {memory_budget_mb:.0f} MB")
+    low, high = min_Nx, Nx
+    if estimate_resources(low, NoModes, backend, model)['peak_rss_mb'] > memory_budget_mb:
+        raise MemoryError(f"Even Nx = {min_Nx} exceeds the memory budget of {memory_budget_mb:.0f} MB")
+    while high - low > 1:
+        middle = (low + high) // 2
+        if estimate_resources(middle, NoModes, backend, model)['peak_rss_mb'] <= memory_budget_mb:
+            low = middle
+        else:
+            high = middle
+    plan.update({'Nx': low, 'downscaled': True, 'estimate': estimate_resources(low, NoModes, backend, model)})
+    print(f"Downscaled Nx from {Nx} to {low} to fit {memory_budget_mb:.0f} MB "
+          f"(dx grows by {Nx / low:.2f}x for the same domain; check lam/dx).")
+    return plan
+
+def main():
+    for Nx in (100, 200, 400, 600):
+        plan_run(Nx, 2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import sys
+import time
+import scipy.sparse.linalg as sla
+
+PHASE_MESSAGES = {
+    'assembly': 'Calculating Ux, Uy, Vx, Vy...',
+    'Q_construction': 'Calculating Qs...',
+    'factorization': 'Factorizing Q - sigma*I...',
+    'eigensolve': 'Taking Eigenvalues and Eigenvectors...',
+    'field_reconstruction': 'Calculating Ex, Ey, Ez, Hx, Hy, Hz...',
+}
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 2**20
+        except (ImportError, AttributeError):
+            return None
+
+def print_progress(event):
+    if event['event'] == 'phase_start':
+        print(PHASE_MESSAGES.get(event['phase'], event['phase'] + '...') + '\n')
+    elif event['event'] == 'phase_end':
+        details = "".join(f", {name} = {value}" for name, value in event.items()
+                          if name not in ('event', 'phase', 'wall_s', 'cpu_s', 'peak_rss_mb'))
+        peak = f"{event['peak_rss_mb']:.0f} MB" if event['peak_rss_mb'] is not None else "n/a"
+        print(f"  {event['phase']}: {event['wall_s']:.2f} s wall, {event['cpu_s']:.2f} s CPU, peak RSS {peak}{details}\n")
+    elif event['event'] == 'solve_end':
+        print(f"Solved Nx = {event['Nx']}, {event['NoModes']} modes in {event['wall_s']:.2f} s "
+              f"({event['cpu_s']:.2f} s CPU)\n")
+
+def emit(progress, event):
+    if progress is not None:
+        progress(event)
+    return event
+
+def start_phase(progress, phase, **details):
+    emit(progress, dict({'event': 'phase_start', 'phase': phase}, **details))
+    return phase, time.perf_counter(), time.process_time()
+
+def end_phase(progress, started, **details):
+    phase, wall_start, cpu_start = started
+    event = {
+        'event': 'phase_end',
+        'phase': phase,
+        'wall_s': time.perf_counter() - wall_start,
+        'cpu_s': time.process_time() - cpu_start,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    event.update(details)
+    return emit(progress, event)
+
+def count_matvecs(operator):
+    # ARPACK applies OPinv once per Arnoldi step, so this is its OP*x count (iparam NUMOPX)
+    counter = {'matvecs': 0}
+    matvec = operator.matvec
+
+    def counted_matvec(vector):
+        counter['matvecs'] += 1
+        return matvec(vector)
+
+    counted = sla.LinearOperator(operator.shape, matvec=counted_matvec, dtype=operator.dtype)
+    return counted, counter
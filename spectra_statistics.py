@@ -0,0 +1,133 @@
+import numpy as np
+
+class RunningSpectrumStats:
+    # Per-pixel mean, variance (Welford), min/max and an optional exponentially weighted
+    # mean, updated as spectra arrive, so averages and SNR are ready at any point of a run
+    # without keeping the spectra or making a second pass over them.
+    def __init__(self, number_of_pixels=None, ewm_alpha=None):
+        self.ewm_alpha = ewm_alpha
+        self.count = 0
+        self.number_of_pixels = None
+        if number_of_pixels is not None:
+            self.allocate(number_of_pixels)
+
+    def allocate(self, number_of_pixels):
+        self.number_of_pixels = number_of_pixels
+        self.running_mean = np.zeros(number_of_pixels)
+        self.sum_squares = np.zeros(number_of_pixels)
+        self.minimum = np.full(number_of_pixels, np.inf)
+        self.maximum = np.full(number_of_pixels, -np.inf)
+        self.ewm = np.zeros(number_of_pixels)
+        self.delta = np.empty(number_of_pixels)
+
+    def update(self, spectrum):
+        spectrum = np.asarray(spectrum, dtype=np.float64)
+        if self.number_of_pixels is None:
+            self.allocate(len(spectrum))
+        self.count += 1
+        # Welford: the delta buffer is reused so each update allocates little
+        np.subtract(spectrum, self.running_mean, out=self.delta)
+        self.running_mean += self.delta / self.count
+        self.sum_squares += self.delta * (spectrum - self.running_mean)
+        np.minimum(self.minimum, spectrum, out=self.minimum)
+        np.maximum(self.maximum, spectrum, out=self.maximum)
+        if self.ewm_alpha is not None:
+            if self.count == 1:
+                self.ewm[:] = spectrum
+            else:
+                self.ewm += self.ewm_alpha * (spectrum - self.ewm)
+
+    def update_many(self, spectra):
+        # A block of spectra is reduced with numpy and merged in (Chan et al.), which is
+        # what a pipeline stage handing over hundreds of rows at a time wants
+        spectra = np.asarray(spectra, dtype=np.float64)
+        if len(spectra) == 0:
+            return
+        if self.number_of_pixels is None:
+            self.allocate(spectra.shape[1])
+        block_count = len(spectra)
+        block_mean = spectra.mean(axis=0)
+        block_squares = ((spectra - block_mean)**2).sum(axis=0)
+        total = self.count + block_count
+        delta = block_mean - self.running_mean
+        self.running_mean += delta * block_count / total
+        self.sum_squares += block_squares + delta**2 * self.count * block_count / total
+        self.count = total
+        np.minimum(self.minimum, spectra.min(axis=0), out=self.minimum)
+        np.maximum(self.maximum, spectra.max(axis=0), out=self.maximum)
+        if self.ewm_alpha is not None:
+            start = 0
+            if self.count == block_count:
+                self.ewm[:] = spectra[0]
+                start = 1
+            # ewm_n = (1-a)^k ewm_0 + sum_j a (1-a)^(k-1-j) x_j
+            weights = self.ewm_alpha * (1 - self.ewm_alpha)**np.arange(block_count - start - 1, -1, -1)
+            self.ewm *= (1 - self.ewm_alpha)**(block_count - start)
+            self.ewm += weights @ spectra[start:]
+
+    @property
+    def mean(self):
+        return self.running_mean.copy() if self.count else None
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return np.full(self.number_of_pixels, np.nan) if self.number_of_pixels else None
+        return self.sum_squares / (self.count - 1)
+
+    @property
+    def std(self):
+        variance = self.variance
+        return None if variance is None else np.sqrt(variance)
+
+    @property
+    def standard_error(self):
+        std = self.std
+        return None if std is None else std / np.sqrt(self.count)
+
+    @property
+    def snr(self):
+        # Single-spectrum SNR per pixel; the SNR of the running mean is sqrt(count) times this
+        std = self.std
+        if std is None:
+            return None
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(std > 0, self.running_mean / std, np.nan)
+
+    def summary(self):
+        snr = self.snr
+        return {
+            'count': self.count,
+            'median_snr': float(np.nanmedian(snr)) if snr is not None and np.any(np.isfinite(snr)) else np.nan,
+            'max_intensity': float(np.max(self.maximum)) if self.count else np.nan,
+        }
+
+    def to_dict(self):
+        # For save_data_to_hdf5 next to the averaged spectrum
+        return {"averaged_intensities": self.mean, "std_intensities": self.std, "min_intensities": self.minimum,
+                "max_intensities": self.maximum, "number_of_spectra": self.count}
+
+def intensity_rows(spectra_list):
+    # Callers pass (wavelengths, intensities) pairs or bare arrays, and the intensities may
+    # be seabreeze spectrum() output: the wavelengths in row 0, the intensities in row 1
+    rows = []
+    for spectrum in spectra_list:
+        if isinstance(spectrum, tuple):
+            spectrum = spectrum[1]
+        spectrum = np.asarray(spectrum)
+        rows.append(spectrum[1] if spectrum.ndim == 2 else spectrum)
+    return rows
+
+def stats_from_spectra(spectra_list, ewm_alpha=None):
+    rows = intensity_rows(spectra_list)
+    if not rows:
+        return None
+    stats = RunningSpectrumStats(ewm_alpha=ewm_alpha)
+    stats.update_many(np.asarray(rows))
+    return stats
+
+def statistics_stage(stats):
+    # AcquisitionPipeline stage
+    def process(spectra, timestamps, first_index):
+        stats.update_many(spectra)
+    return process
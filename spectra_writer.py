@@ -0,0 +1,133 @@
+import time
+import h5py
+import numpy as np
+
+class SpectraWriter:
+    # Appends spectra as rows of one chunked, compressed dataset, with the wavelengths
+    # stored once and a timestamp and saturation flag per row. Rows are buffered and written
+    # a block at a time, at least every flush_seconds, so a crash loses only the last block.
+    def __init__(self, target, wavelengths, chunk_spectra=64, compression="gzip", compression_opts=4,
+                 dtype=np.float64, flush_every=None, flush_seconds=1.0, attributes=None):
+        self.owns_file = isinstance(target, str)
+        self.group = h5py.File(target, "a") if self.owns_file else target
+        self.number_of_pixels = len(wavelengths)
+        self.flush_every = chunk_spectra if flush_every is None else flush_every
+        self.flush_seconds = flush_seconds
+        if "intensities" in self.group:
+            # Reopened after an interruption: continue after the rows already written
+            self.intensities = self.group["intensities"]
+            self.timestamps = self.group["timestamps"]
+            if not np.array_equal(self.group["wavelengths"][:], wavelengths):
+                raise ValueError("Wavelength calibration differs from the one already stored in this file")
+            if "saturated" not in self.group:
+                # Written before rows were flagged: nothing was marked saturated
+                self.create_saturated(np.zeros(self.intensities.shape[0], dtype=bool), chunk_spectra)
+            self.saturated = self.group["saturated"]
+        else:
+            self.group.create_dataset("wavelengths", data=np.asarray(wavelengths))
+            self.intensities = self.group.create_dataset(
+                "intensities", shape=(0, self.number_of_pixels), maxshape=(None, self.number_of_pixels),
+                dtype=dtype, chunks=(chunk_spectra, self.number_of_pixels),
+                compression=compression, compression_opts=compression_opts, shuffle=True)
+            self.timestamps = self.group.create_dataset(
+                "timestamps", shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(max(chunk_spectra, 1024),))
+            self.saturated = self.create_saturated(np.zeros(0, dtype=bool), chunk_spectra)
+            self.group.attrs["created"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        for key, value in (attributes or {}).items():
+            self.group.attrs[key] = value
+        self.count = self.intensities.shape[0]
+        self.pending_intensities = []
+        self.pending_timestamps = []
+        self.pending_saturated = []
+        self.last_flush = time.monotonic()
+
+    def create_saturated(self, flags, chunk_spectra):
+        return self.group.create_dataset("saturated", data=flags, maxshape=(None,), chunks=(max(chunk_spectra, 1024),))
+
+    def __len__(self):
+        return self.count + len(self.pending_timestamps)
+
+    def append(self, intensities, timestamp=None, saturated=False):
+        intensities = np.asarray(intensities)
+        if intensities.shape != (self.number_of_pixels,):
+            raise ValueError(f"Expected spectra with {self.number_of_pixels} pixels, got {intensities.shape}")
+        self.pending_intensities.append(intensities)
+        self.pending_timestamps.append(time.time() if timestamp is None else timestamp)
+        self.pending_saturated.append(bool(saturated))
+        if len(self.pending_timestamps) >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def append_many(self, intensities, timestamps, saturated=None):
+        self.flush()
+        saturated = np.zeros(len(timestamps), dtype=bool) if saturated is None else np.asarray(saturated, dtype=bool)
+        self.write_block(np.asarray(intensities), np.asarray(timestamps), saturated)
+        self.group.file.flush()
+
+    def write_block(self, intensities, timestamps, saturated):
+        if intensities.ndim != 2 or intensities.shape[1] != self.number_of_pixels:
+            raise ValueError(f"Expected spectra with {self.number_of_pixels} pixels, got {intensities.shape}")
+        start, stop = self.count, self.count + len(intensities)
+        self.intensities.resize(stop, axis=0)
+        self.timestamps.resize(stop, axis=0)
+        self.saturated.resize(stop, axis=0)
+        self.intensities[start:stop] = intensities
+        self.timestamps[start:stop] = timestamps
+        self.saturated[start:stop] = saturated
+        self.count = stop
+
+    def flush(self):
+        if self.pending_timestamps:
+            self.write_block(np.array(self.pending_intensities), np.array(self.pending_timestamps),
+                             np.array(self.pending_saturated))
+            self.pending_intensities = []
+            self.pending_timestamps = []
+            self.pending_saturated = []
+        self.group.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if self.group is None:
+            return
+        self.flush()
+        if self.owns_file:
+            self.group.close()
+        self.group = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def read_spectra(source, start=0, stop=None):
+    file = h5py.File(source, "r") if isinstance(source, str) else None
+    group = file if file is not None else source
+    try:
+        return group["wavelengths"][:], group["intensities"][start:stop], group["timestamps"][start:stop]
+    finally:
+        if file is not None:
+            file.close()
+
+def read_saturated(source, start=0, stop=None):
+    # Per-row saturation flags; files written before rows were flagged have none set
+    file = h5py.File(source, "r") if isinstance(source, str) else None
+    group = file if file is not None else source
+    try:
+        if "saturated" in group:
+            return group["saturated"][start:stop]
+        return np.zeros(len(group["timestamps"][start:stop]), dtype=bool)
+    finally:
+        if file is not None:
+            file.close()
+
+def convert_legacy_file(legacy_path, output_path, **writer_options):
+    # Files written by save_data_to_files: one "Spectrum_%03d" group per spectrum
+    with h5py.File(legacy_path, "r") as legacy:
+        names = sorted(name for name in legacy if name.startswith("Spectrum_"))
+        wavelengths = legacy[names[0]]["wavelengths"][:]
+        intensities = np.array([legacy[name]["intensities"][:] for name in names])
+        timestamps = np.array([legacy[name]["timestamp"][()] for name in names])
+    with SpectraWriter(output_path, wavelengths, **writer_options) as writer:
+        writer.append_many(intensities, timestamps)
+    print(f"Converted {len(names)} spectra from {legacy_path} to {output_path}")
+    return output_path
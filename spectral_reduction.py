@@ -0,0 +1,166 @@
+import h5py
+import numpy as np
+import scipy.sparse as sp
+from spectra_writer import SpectraWriter, read_spectra
+
+# What the analysis scripts actually read: SpectrometerTimelapse_DataExtraction.py plots a
+# window of wavelengths and spectrum_collection*.py a single trace at the 650 nm laser line
+WINDOW_NM = (500.0, 750.0)
+BIN_WIDTH_NM = 1.0
+BANDS_NM = ((650.0, 5.0),)
+RAW_EVERY = 100
+
+def pixel_window(wavelengths, start_nm=None, end_nm=None):
+    # Contiguous slice of pixels inside [start_nm, end_nm]; wavelengths increase along the detector
+    wavelengths = np.asarray(wavelengths)
+    start = 0 if start_nm is None else int(np.searchsorted(wavelengths, start_nm, side='left'))
+    stop = len(wavelengths) if end_nm is None else int(np.searchsorted(wavelengths, end_nm, side='right'))
+    if stop <= start:
+        raise ValueError(f"No pixels between {start_nm} and {end_nm} nm")
+    return slice(start, stop)
+
+def binning_matrix(wavelengths, bin_width_nm):
+    # Sparse (pixels x bins) matrix averaging the pixels whose centres fall in each bin;
+    # empty bins (pixels wider than the bin) are dropped
+    wavelengths = np.asarray(wavelengths)
+    edges = np.arange(wavelengths[0], wavelengths[-1] + bin_width_nm, bin_width_nm)
+    bin_index = np.clip(np.searchsorted(edges, wavelengths, side='right') - 1, 0, len(edges) - 2)
+    used, bin_index = np.unique(bin_index, return_inverse=True)
+    counts = np.bincount(bin_index)
+    weights = sp.csr_matrix((1.0 / counts[bin_index], (np.arange(len(wavelengths)), bin_index)),
+                            shape=(len(wavelengths), len(used)))
+    centres = np.bincount(bin_index, weights=wavelengths) / counts
+    return weights, centres
+
+def band_matrix(wavelengths, bands):
+    # Sparse (pixels x bands) matrix integrating counts x nm over each (centre, width) band
+    wavelengths = np.asarray(wavelengths)
+    pixel_widths = np.gradient(wavelengths)
+    rows, columns, values = [], [], []
+    for column, (centre, width) in enumerate(bands):
+        inside = np.flatnonzero(np.abs(wavelengths - centre) <= width / 2)
+        if len(inside) == 0:
+            # Narrower than a pixel: the nearest pixel alone
+            inside = np.array([np.argmin(np.abs(wavelengths - centre))])
+        rows.extend(inside)
+        columns.extend([column] * len(inside))
+        values.extend(pixel_widths[inside])
+    return sp.csr_matrix((values, (rows, columns)), shape=(len(wavelengths), len(bands)))
+
+class SpectralReducer:
+    # Window -> bins -> bands, precomputed once so each block of spectra costs one slice
+    # and one sparse product. Without a bin width the windowed pixels are kept as they are.
+    def __init__(self, wavelengths, window_nm=WINDOW_NM, bin_width_nm=None, bands_nm=()):
+        self.raw_wavelengths = np.asarray(wavelengths)
+        self.window = pixel_window(self.raw_wavelengths, *(window_nm or (None, None)))
+        windowed = self.raw_wavelengths[self.window]
+        self.window_nm = window_nm
+        self.bin_width_nm = bin_width_nm
+        if bin_width_nm:
+            self.weights, self.wavelengths = binning_matrix(windowed, bin_width_nm)
+            # spectra @ weights as (weights.T @ spectra.T).T keeps the sparse operand on the left
+            self.weights_t = self.weights.T.tocsr()
+        else:
+            self.weights, self.wavelengths, self.weights_t = None, windowed, None
+        self.bands_nm = [tuple(band) for band in bands_nm]
+        self.band_centres = np.array([centre for centre, width in self.bands_nm])
+        # Bands integrate the full-resolution spectrum, not the bins
+        self.band_weights_t = band_matrix(self.raw_wavelengths, self.bands_nm).T.tocsr() if self.bands_nm else None
+
+    def reduce(self, spectra):
+        spectra = np.atleast_2d(spectra)
+        windowed = spectra[:, self.window]
+        if self.weights_t is None:
+            # A copy: pipeline batches are views of the ring buffer, reused once consumed
+            return np.array(windowed)
+        return np.asarray(self.weights_t @ windowed.T).T
+
+    def integrate_bands(self, spectra):
+        spectra = np.atleast_2d(spectra)
+        return np.asarray(self.band_weights_t @ spectra.T).T
+
+    def attributes(self):
+        # Stored with the reduced data so the analysis knows what was kept
+        attributes = {
+            "raw_pixels": len(self.raw_wavelengths),
+            "window_pixels": f"{self.window.start}:{self.window.stop}",
+            "reduced_pixels": len(self.wavelengths),
+        }
+        if self.window_nm:
+            attributes["window_nm"] = np.asarray(self.window_nm, dtype=float)
+        if self.bin_width_nm:
+            attributes["bin_width_nm"] = self.bin_width_nm
+        return attributes
+
+    def reduction_factor(self, raw_every=None):
+        stored = len(self.wavelengths) + len(self.bands_nm)
+        if raw_every:
+            stored += len(self.raw_wavelengths) / raw_every
+        return len(self.raw_wavelengths) / stored
+
+def open_reduced_writers(file, reducer, raw_every=RAW_EVERY, attributes=None, **writer_options):
+    # One SpectraWriter per stream in an open h5py file: "reduced" with the reducer's
+    # wavelengths, "bands" with the band centres as its wavelength axis, "raw" decimated
+    attributes = dict(attributes or {})
+    writers = {"reduced": SpectraWriter(file.require_group("reduced"), reducer.wavelengths,
+                                        attributes={**attributes, **reducer.attributes()}, **writer_options)}
+    if reducer.bands_nm:
+        writers["bands"] = SpectraWriter(file.require_group("bands"), reducer.band_centres, attributes={
+            **attributes, "band_widths_nm": np.array([width for centre, width in reducer.bands_nm]),
+            "units": "counts x nm"}, **writer_options)
+    if raw_every:
+        writers["raw"] = SpectraWriter(file.require_group("raw"), reducer.raw_wavelengths,
+                                       attributes={**attributes, "raw_every": raw_every}, **writer_options)
+    return writers
+
+def reduction_stage(reducer, writers, raw_every=RAW_EVERY):
+    # AcquisitionPipeline stage in place of writer_stage. Rows go through append(), which
+    # buffers them into whole chunks; append_many() would resize and flush on every small
+    # batch. first_index keeps the raw decimation on a fixed grid of spectrum indices.
+    def append_rows(writer, rows, timestamps):
+        for row, timestamp in zip(rows, timestamps):
+            writer.append(row, timestamp)
+
+    def process(spectra, timestamps, first_index):
+        timestamps = np.asarray(timestamps)
+        append_rows(writers["reduced"], reducer.reduce(spectra), timestamps)
+        if "bands" in writers:
+            append_rows(writers["bands"], reducer.integrate_bands(spectra), timestamps)
+        if "raw" in writers and raw_every:
+            keep = np.flatnonzero((first_index + np.arange(len(timestamps))) % raw_every == 0)
+            append_rows(writers["raw"], spectra[keep], timestamps[keep])
+    return process
+
+def band_trace(path, band=0):
+    # Time trace of one band from a file written through open_reduced_writers
+    with h5py.File(path, "r") as file:
+        centres, integrals, timestamps = read_spectra(file["bands"])
+    return centres[band], integrals[:, band], timestamps
+
+def main():
+    import os
+    from acquisition_pipeline import AcquisitionPipeline, background_stage, print_report
+    from spectrometer_session import SpectrometerSession
+    from spectrometer_simulator import SimulatedSpectrometer
+    session = SpectrometerSession(SimulatedSpectrometer(seed=0))
+    session.integration_time_ms(3)
+    background = np.mean([session.intensities() for _ in range(10)], axis=0)
+    reducer = SpectralReducer(session.wavelengths(), WINDOW_NM, BIN_WIDTH_NM, BANDS_NM)
+    print(f"{session.pixels} pixels -> {len(reducer.wavelengths)} bins + {len(reducer.bands_nm)} band(s), "
+          f"raw every {RAW_EVERY}: {reducer.reduction_factor(RAW_EVERY):.1f}x less data")
+    output_path = "spectral_reduction_demo.h5"
+    with h5py.File(output_path, "w") as file:
+        writers = open_reduced_writers(file, reducer, RAW_EVERY, attributes={"integration_time_ms": 3})
+        pipeline = AcquisitionPipeline(session.read_into, session.pixels)
+        pipeline.add_stage("background", background_stage(background))
+        pipeline.add_stage("reduction", reduction_stage(reducer, writers, RAW_EVERY), after="background")
+        print_report(pipeline.start(total_duration_seconds=2).join())
+        for writer in writers.values():
+            writer.close()
+    with h5py.File(output_path, "r") as file:
+        for name in file:
+            print(f"{name}: {file[name]['intensities'].shape}")
+    print(f"Saved to {output_path} ({os.path.getsize(output_path) / 1e6:.2f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import os
 import time
 import h5py
 from seabreeze.spectrometers import list_devices, Spectrometer
+from spectra_statistics import stats_from_spectra
 import matplotlib.pyplot as plt
 
 def create_directory_if_not_exists(directory_path):
@@ -94,15 +95,10 @@ def record_spectra(spectrometer, time_interval_seconds, integration_time_ms, tot
     return spectra, timestamps, time_per_spectrum
 
 def calculate_average_spectra(spectra_list):
-    num_spectra = len(spectra_list)
-    if num_spectra == 0:
+    stats = stats_from_spectra(spectra_list)
+    if stats is None:
         return None
-    sum_intensities = [0] * len(spectra_list[0][1])
-    for wavelengths, intensities in spectra_list:
-        for i, intensity in enumerate(intensities):
-            sum_intensities[i] += intensity
-    avg_intensities = [intensity_sum / num_spectra for intensity_sum in sum_intensities]
-    return avg_intensities
+    return stats.mean
 
 def check_and_handle_background_spectrum(background_file_path, spectrometer, time_interval_seconds, integration_time_ms, time_background):
     if not file_exists(background_file_path):
@@ -0,0 +1,102 @@
+import numpy as np
+
+class SpectrometerSession:
+    # Wraps a seabreeze Spectrometer with the same method names, reading the calibration
+    # and device limits once and remembering the integration time and trigger mode, so
+    # repeated settings cost no USB round trip and wavelengths() never goes to the device.
+    def __init__(self, spectrometer, correct_dark_counts=True, correct_nonlinearity=False):
+        self.device = spectrometer
+        self.correct_dark_counts = correct_dark_counts
+        self.correct_nonlinearity = correct_nonlinearity
+        self.cached_wavelengths = np.asarray(spectrometer.wavelengths(), dtype=np.float64)
+        self.cached_wavelengths.setflags(write=False)
+        self.pixels = len(self.cached_wavelengths)
+        self.model = spectrometer.model
+        self.serial_number = spectrometer.serial_number
+        self.integration_time_micros_limits = tuple(spectrometer.integration_time_micros_limits)
+        self.max_intensity = spectrometer.max_intensity
+        self.current_integration_time_micros = None
+        self.current_trigger_mode = None
+        self.current_scans_to_average = None
+        self.commands_sent = 0
+        self.commands_skipped = 0
+
+    def wavelengths(self):
+        return self.cached_wavelengths
+
+    def integration_time_micros(self, integration_time_micros):
+        integration_time_micros = int(integration_time_micros)
+        minimum, maximum = self.integration_time_micros_limits
+        if not minimum <= integration_time_micros <= maximum:
+            raise ValueError(f"Integration time {integration_time_micros} us is outside the {self.model} limits {minimum}-{maximum} us")
+        if integration_time_micros == self.current_integration_time_micros:
+            self.commands_skipped += 1
+            return
+        self.device.integration_time_micros(integration_time_micros)
+        self.current_integration_time_micros = integration_time_micros
+        self.commands_sent += 1
+
+    def integration_time_ms(self, integration_time_ms):
+        self.integration_time_micros(round(integration_time_ms * 1000))
+
+    def trigger_mode(self, mode):
+        if mode == self.current_trigger_mode:
+            self.commands_skipped += 1
+            return
+        self.device.trigger_mode(mode)
+        self.current_trigger_mode = mode
+        self.commands_sent += 1
+
+    def scans_to_average(self, scans):
+        # On-device averaging where the model has the spectrum processing feature; returns
+        # False when it does not, and the caller has to average in software
+        if scans == self.current_scans_to_average:
+            self.commands_skipped += 1
+            return True
+        processing = getattr(getattr(self.device, "f", None), "spectrum_processing", None)
+        if processing is None:
+            return scans == 1
+        processing.set_scans_to_average(scans)
+        self.current_scans_to_average = scans
+        self.commands_sent += 1
+        return True
+
+    def intensities(self, correct_dark_counts=None, correct_nonlinearity=None):
+        return self.device.intensities(
+            correct_dark_counts=self.correct_dark_counts if correct_dark_counts is None else correct_dark_counts,
+            correct_nonlinearity=self.correct_nonlinearity if correct_nonlinearity is None else correct_nonlinearity)
+
+    def spectrum(self, correct_dark_counts=None, correct_nonlinearity=None):
+        return np.vstack([self.cached_wavelengths, self.intensities(correct_dark_counts, correct_nonlinearity)])
+
+    def read_into(self, buffer):
+        # Hot loop: one intensities() call and a copy into a caller-owned row
+        buffer[:] = self.device.intensities(correct_dark_counts=self.correct_dark_counts,
+                                            correct_nonlinearity=self.correct_nonlinearity)
+        return buffer
+
+    def saturated(self, intensities, fraction=0.98):
+        return np.max(intensities) >= fraction * self.max_intensity
+
+    def close(self):
+        self.device.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def open_session(serial_number=None, **session_options):
+    from seabreeze.spectrometers import list_devices, Spectrometer
+    if serial_number is not None:
+        spectrometer = Spectrometer.from_serial_number(serial_number)
+    else:
+        devices = list_devices()
+        if not devices:
+            print("No spectrometer device found.")
+            return None
+        spectrometer = Spectrometer(devices[0])
+    session = SpectrometerSession(spectrometer, **session_options)
+    print(f"Spectrometer session opened: {session.model} {session.serial_number}, {session.pixels} pixels")
+    return session
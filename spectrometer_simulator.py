@@ -0,0 +1,153 @@
+import time
+from types import SimpleNamespace
+import numpy as np
+
+# Calibration, limits and timing roughly those of an Ocean Insight FLAME-S
+WAVELENGTH_COEFFICIENTS = (339.4, 0.3798, -1.58e-5, -2.1e-9)
+NUMBER_OF_PIXELS = 2048
+INTEGRATION_TIME_MICROS_LIMITS = (1000, 65000000)
+MAX_INTENSITY = 65535.0
+DARK_OFFSET_COUNTS = 1500.0
+DARK_CURRENT_COUNTS_PER_S = 300.0
+READ_NOISE_COUNTS = 8.0
+ELECTRONS_PER_COUNT = 1.0
+USB_OVERHEAD_SECONDS = 0.0005
+USB_BYTES_PER_SECOND = 20e6
+# FLAME / USB4000 numbering: 0 free running, 1 software, 2 external level, 3 external synchronisation, 4 external edge
+EXTERNAL_TRIGGER_MODES = (2, 3, 4)
+
+def supercontinuum_rate(wavelengths_nm, peak_counts_per_ms=2000.0, centre_nm=650.0, width_nm=180.0):
+    # Smooth broadband source seen through the fibre, in counts per ms of integration
+    return peak_counts_per_ms * np.exp(-0.5 * ((wavelengths_nm - centre_nm) / width_nm)**2)
+
+def dip_transmission(wavelengths_nm, dips):
+    # dips: (centre_nm, full width at half maximum in nm, depth 0..1) per resonance
+    transmission = np.ones_like(wavelengths_nm)
+    for centre_nm, fwhm_nm, depth in dips:
+        transmission *= 1 - depth / (1 + (2 * (wavelengths_nm - centre_nm) / fwhm_nm)**2)
+    return transmission
+
+def arrow_dips(d_nm, n_glass, n_solvent, orders=range(1, 6), fwhm_nm=15.0, depth=0.8):
+    # Resonances of an antiresonant fibre wall (the loss peaks between the guidance windows)
+    from arrow import lambda_antires
+    centres_nm = lambda_antires(d_nm, n_glass, n_solvent, np.asarray(orders, dtype=float) - 0.5)
+    return [(float(centre_nm), fwhm_nm, depth) for centre_nm in np.atleast_1d(centres_nm) if np.isfinite(centre_nm)]
+
+class SimulatedSpectrometer:
+    # Stands in for a seabreeze Spectrometer: intensities() blocks for the integration time
+    # plus the USB transfer and returns dark offset + signal with shot, dark and read noise,
+    # clipped at the ADC limit. With trigger_period_seconds set, the external trigger
+    # modes wait for the next edge of that pulse train before integrating, and triggers
+    # that arrive while the device is busy are missed, as on the real hardware.
+    def __init__(self, number_of_pixels=NUMBER_OF_PIXELS, wavelength_coefficients=WAVELENGTH_COEFFICIENTS,
+                 source_rate=None, dips=(), serial_number="SIM00001", model="SIMULATED",
+                 dark_offset_counts=DARK_OFFSET_COUNTS, dark_current_counts_per_s=DARK_CURRENT_COUNTS_PER_S,
+                 read_noise_counts=READ_NOISE_COUNTS, electrons_per_count=ELECTRONS_PER_COUNT,
+                 usb_overhead_seconds=USB_OVERHEAD_SECONDS, usb_bytes_per_second=USB_BYTES_PER_SECOND,
+                 trigger_period_seconds=None, realtime=True, seed=None):
+        pixels = np.arange(number_of_pixels)
+        self.wavelengths_nm = np.polyval(wavelength_coefficients[::-1], pixels)
+        self.pixels = number_of_pixels
+        self.serial_number = serial_number
+        self.model = model
+        self.integration_time_micros_limits = INTEGRATION_TIME_MICROS_LIMITS
+        self.max_intensity = MAX_INTENSITY
+        rate = supercontinuum_rate(self.wavelengths_nm) if source_rate is None else source_rate(self.wavelengths_nm)
+        self.signal_rate = rate * dip_transmission(self.wavelengths_nm, dips)
+        self.light_on = True
+        self.dark_offset_counts = dark_offset_counts
+        self.dark_current_counts_per_s = dark_current_counts_per_s
+        self.read_noise_counts = read_noise_counts
+        self.electrons_per_count = electrons_per_count
+        self.transfer_seconds = usb_overhead_seconds + 2 * number_of_pixels / usb_bytes_per_second
+        self.realtime = realtime
+        self.rng = np.random.default_rng(seed)
+        self.integration_micros = 10000
+        self.mode = 0
+        self.trigger_period_seconds = trigger_period_seconds
+        self.trigger_start = time.perf_counter()
+        self.last_trigger_index = None
+        self.scans = 1
+        self.f = SimpleNamespace(spectrum_processing=SimpleNamespace(set_scans_to_average=self.set_scans_to_average))
+        self.reads = 0
+        self.closed = False
+
+    def wavelengths(self):
+        return self.wavelengths_nm.copy()
+
+    def integration_time_micros(self, integration_time_micros):
+        minimum, maximum = self.integration_time_micros_limits
+        if not minimum <= integration_time_micros <= maximum:
+            raise ValueError(f"Integration time {integration_time_micros} us is outside {minimum}-{maximum} us")
+        self.integration_micros = int(integration_time_micros)
+
+    def trigger_mode(self, mode):
+        self.mode = mode
+
+    def set_scans_to_average(self, scans):
+        self.scans = int(scans)
+
+    def wait_for_trigger(self):
+        # Returns the perf_counter time the exposure starts
+        now = time.perf_counter()
+        if self.mode not in EXTERNAL_TRIGGER_MODES or self.trigger_period_seconds is None:
+            return now
+        index = int(np.ceil((now - self.trigger_start) / self.trigger_period_seconds))
+        self.last_trigger_index = index
+        return self.trigger_start + index * self.trigger_period_seconds
+
+    def expected_counts(self):
+        seconds = self.integration_micros / 1e6
+        signal = self.signal_rate * seconds * 1000 if self.light_on else np.zeros(self.pixels)
+        return signal, self.dark_current_counts_per_s * seconds
+
+    def intensities(self, correct_dark_counts=False, correct_nonlinearity=False):
+        if self.closed:
+            raise RuntimeError("Device is closed")
+        signal, dark = self.expected_counts()
+        total = np.zeros(self.pixels)
+        for scan in range(self.scans):
+            started = self.wait_for_trigger()
+            electrons = self.rng.poisson((signal + dark) * self.electrons_per_count)
+            counts = electrons / self.electrons_per_count + self.dark_offset_counts
+            counts += self.rng.normal(0, self.read_noise_counts, self.pixels)
+            total += np.clip(np.round(counts), 0, self.max_intensity)
+            if self.realtime and scan < self.scans - 1:
+                self.sleep_until(started + self.integration_micros / 1e6)
+        counts = total / self.scans
+        if correct_dark_counts:
+            # The electric dark pixels estimate the offset; saturated pixels stay at the limit
+            counts = np.where(counts >= self.max_intensity, counts, counts - self.dark_offset_counts)
+        self.reads += 1
+        if self.realtime:
+            self.sleep_until(started + self.integration_micros / 1e6 + self.transfer_seconds)
+        return counts
+
+    def sleep_until(self, deadline):
+        # A plain sleep: a real read blocks in the USB driver without using the CPU
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def spectrum(self, correct_dark_counts=False, correct_nonlinearity=False):
+        return np.vstack([self.wavelengths_nm, self.intensities(correct_dark_counts, correct_nonlinearity)])
+
+    def close(self):
+        self.closed = True
+
+def main():
+    from spectra_statistics import RunningSpectrumStats
+    spectrometer = SimulatedSpectrometer(dips=[(540.0, 12.0, 0.7), (760.0, 20.0, 0.9)], seed=0)
+    for integration_time_ms in (1, 3, 10, 20, 40):
+        spectrometer.integration_time_micros(integration_time_ms * 1000)
+        stats = RunningSpectrumStats()
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < 0.5:
+            stats.update(spectrometer.intensities(correct_dark_counts=True))
+        elapsed = time.perf_counter() - start_time
+        saturated = np.mean(stats.maximum >= spectrometer.max_intensity)
+        print(f"{integration_time_ms} ms: {stats.count / elapsed:.0f} spectra/s, median SNR {stats.summary()['median_snr']:.0f}, "
+              f"{saturated:.1%} of pixels saturated")
+
+if __name__ == "__main__":
+    main()
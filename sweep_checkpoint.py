@@ -0,0 +1,171 @@
+import json
+import os
+import time
+import numpy as np
+from ModeSolverFD import ModeSolverFD
+from resource_planner import plan_run
+from fdfd_geometries import arpcf_index, um
+from material_dispersion import refractive_index
+
+INDEX_FILENAME = "index.jsonl"
+
+def point_key(point):
+    return "_".join(f"{name}={point[name]:.9g}" for name in sorted(point))
+
+def load_index(store_directory):
+    index_path = os.path.join(store_directory, INDEX_FILENAME)
+    records = {}
+    if not os.path.exists(index_path):
+        return records
+    with open(index_path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line cut short by a crash; that point is simply recomputed
+                continue
+            if os.path.exists(os.path.join(store_directory, record['filename'])):
+                records[record['key']] = record
+    return records
+
+def load_point(store_directory, record):
+    with np.load(os.path.join(store_directory, record['filename'])) as data:
+        return {name: data[name] for name in data.files}
+
+def save_point(store_directory, key, point, RetVal, elapsed_seconds):
+    os.makedirs(store_directory, exist_ok=True)
+    filename = f"{key}.npz"
+    temporary_path = os.path.join(store_directory, filename + ".tmp")
+    with open(temporary_path, "wb") as file:
+        np.savez(file, eigvalues=RetVal['eigvalues'], eigvectors=RetVal['eigvectors'], beta=np.diag(RetVal['beta']),
+                 tracked_mode=tracked_mode(RetVal))
+    os.replace(temporary_path, os.path.join(store_directory, filename))
+    record = {
+        'key': key,
+        'filename': filename,
+        'point': point,
+        'Nx': int(RetVal['Nx']),
+        'dx': float(RetVal['dx']),
+        'lam': float(RetVal['lam']),
+        'neff_real': [float(value) for value in np.real(np.diag(RetVal['beta']) / RetVal['k0'])],
+        'neff_imag': [float(value) for value in np.imag(np.diag(RetVal['beta']) / RetVal['k0'])],
+        'PML_Depth': int(RetVal['PML_Depth']),
+        'PML_TargetLoss': float(RetVal['PML_TargetLoss']),
+        'PML_PolyDegree': int(RetVal['PML_PolyDegree']),
+        'tracked_mode': tracked_mode(RetVal),
+        'elapsed_seconds': elapsed_seconds,
+        'saved_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(os.path.join(store_directory, INDEX_FILENAME), "a") as file:
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    return record
+
+def run_sweep(points, solve_point, store_directory):
+    completed = load_index(store_directory)
+    previous = None
+    if completed:
+        last_record = list(completed.values())[-1]
+        previous = dict(load_point(store_directory, last_record), point=last_record['point'])
+        previous['tracked_mode'] = tracked_mode(previous)
+        print(f"Resuming: {len(completed)} of {len(points)} points already stored in {store_directory}")
+    for point_number, point in enumerate(points, start=1):
+        key = point_key(point)
+        if key in completed:
+            continue
+        print(f"Point {point_number}/{len(points)}: {point}")
+        start_time = time.time()
+        RetVal = solve_point(point, previous)
+        elapsed_seconds = time.time() - start_time
+        completed[key] = save_point(store_directory, key, point, RetVal, elapsed_seconds)
+        previous = {'point': point, 'eigvectors': RetVal['eigvectors'], 'eigvalues': RetVal['eigvalues'], 'beta': np.diag(RetVal['beta']),
+                    'tracked_mode': tracked_mode(RetVal)}
+        print(f"Stored point {point_number} in {elapsed_seconds:.1f} s")
+    return [completed[point_key(point)] for point in points]
+
+def tracked_mode(result):
+    # Index of the followed mode among the eigenvectors: set by follow_mode() during a
+    # sweep, otherwise (first point, older stores) the highest real beta, the fundamental
+    if 'tracked_mode' in result:
+        return int(result['tracked_mode'])
+    beta = result['beta']
+    return int(np.argmax(np.real(np.diag(beta) if np.ndim(beta) == 2 else beta)))
+
+def resample_field(vector, Nx_old, Nx_new):
+    # eigvectors stack Hx and Hy, each an Nx x Nx grid in C order. Both grids span the same
+    # window, so the field is interpolated bilinearly on normalised coordinates.
+    old = np.linspace(0, 1, Nx_old)
+    new = np.linspace(0, 1, Nx_new)
+    components = []
+    for component in np.reshape(vector, (2, Nx_old, Nx_old)):
+        rows = np.array([np.interp(new, old, row.real) + 1j * np.interp(new, old, row.imag) for row in component])
+        columns = np.array([np.interp(new, old, column.real) + 1j * np.interp(new, old, column.imag) for column in rows.T]).T
+        components.append(columns.ravel())
+    return np.concatenate(components)
+
+def warm_start_vector(previous, Nx):
+    # The tracked mode's field, carried onto the new grid when Nx changed
+    if previous is None:
+        return None
+    vector = previous['eigvectors'][:, previous['tracked_mode']]
+    Nx_old = int(round(np.sqrt(len(vector) / 2)))
+    if Nx_old != Nx:
+        vector = resample_field(vector, Nx_old, Nx)
+    return vector
+
+def follow_mode(RetVal, reference_vector):
+    # ARPACK returns the modes in no particular order, so the mode followed from the
+    # previous point is the one whose field overlaps most with the previous field
+    if reference_vector is not None:
+        eigvectors = RetVal['eigvectors']
+        overlaps = np.abs(reference_vector.conj() @ eigvectors) / np.linalg.norm(eigvectors, axis=0)
+        RetVal['tracked_mode'] = int(np.argmax(overlaps))
+    else:
+        RetVal['tracked_mode'] = tracked_mode(RetVal)
+    return RetVal
+
+def wavelength_sweep(build_index, x, lams, NoModes, store_directory, neff_guess=1.0, **PML_settings):
+    Nx = len(x)
+    dx = x[1] - x[0]
+    x_mesh, y_mesh = np.meshgrid(x, x)
+    plan_run(Nx, NoModes, on_exceed='refuse')
+
+    def solve_point(point, previous):
+        lam = point['lam']
+        k0 = 2 * np.pi / lam
+        n = build_index(x_mesh, y_mesh, lam)
+        beta = neff_guess * k0
+        if previous is not None:
+            # Follow the mode: keep the previous effective index as the shift
+            beta = np.real(previous['beta'][previous['tracked_mode']]) * previous['point']['lam'] / lam
+        v0 = warm_start_vector(previous, Nx)
+        return follow_mode(ModeSolverFD(dx, n, lam, beta, NoModes, v0=v0, **PML_settings)[0], v0)
+
+    return run_sweep([{'lam': float(lam)} for lam in lams], solve_point, store_directory)
+
+def nx_ladder(build_index, half_width, lam, Nxs, NoModes, store_directory, neff_guess=1.0, **PML_settings):
+    plan_run(max(Nxs), NoModes, on_exceed='refuse')
+    k0 = 2 * np.pi / lam
+
+    def solve_point(point, previous):
+        Nx = point['Nx']
+        x = np.linspace(-half_width, half_width, Nx)
+        x_mesh, y_mesh = np.meshgrid(x, x)
+        beta = neff_guess * k0 if previous is None else np.real(previous['beta'][previous['tracked_mode']])
+        # The previous rung's field, interpolated onto this grid, seeds the eigensolver
+        v0 = warm_start_vector(previous, Nx)
+        return follow_mode(ModeSolverFD(x[1] - x[0], build_index(x_mesh, y_mesh), lam, beta, NoModes, v0=v0, **PML_settings)[0], v0)
+
+    return run_sweep([{'Nx': int(Nx)} for Nx in Nxs], solve_point, store_directory)
+
+def main():
+    x = np.linspace(-81 * um, 81 * um, 200)
+    lams = np.linspace(450e-9, 750e-9, 300)
+    records = wavelength_sweep(lambda x_mesh, y_mesh, lam: arpcf_index(x_mesh, y_mesh, n_silica=refractive_index('Silica', lam * 1e9)), x, lams, 2, "./sweeps/arpcf_wavelength")
+    for record in records:
+        mode = record['tracked_mode']
+        print(f"{record['lam']*1e9:.1f} nm: neff = {record['neff_real'][mode]:.6f}{record['neff_imag'][mode]:+.3e}j")
+
+if __name__ == "__main__":
+    main()
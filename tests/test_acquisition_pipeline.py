@@ -0,0 +1,49 @@
+import time
+import numpy as np
+import pytest
+from acquisition_pipeline import AcquisitionPipeline, background_stage
+
+def counting_reader(number_of_pixels, read_seconds=0.0):
+    # Every pixel of spectrum k holds k, filled slowly so a concurrent refill would tear the row
+    counter = [0]
+    def acquire_into(buffer):
+        for start in range(0, number_of_pixels, 64):
+            buffer[start:start + 64] = counter[0]
+            if read_seconds:
+                time.sleep(read_seconds / (number_of_pixels / 64))
+        counter[0] += 1
+    return acquire_into
+
+@pytest.mark.parametrize("on_full", ["block", "overwrite"])
+def test_in_place_stage_never_sees_torn_rows(on_full):
+    number_of_pixels = 512
+    pipeline = AcquisitionPipeline(counting_reader(number_of_pixels, 0.0005), number_of_pixels, capacity=8, on_full=on_full)
+    seen = []
+    def slow_background(spectra, timestamps, first_index):
+        background_stage(np.full(number_of_pixels, 0.5))(spectra, timestamps, first_index)
+        time.sleep(0.003)
+    def check(spectra, timestamps, first_index):
+        for offset, row in enumerate(spectra):
+            assert np.all(row == first_index + offset - 0.5)
+            seen.append(first_index + offset)
+    pipeline.add_stage("background", slow_background, max_batch=4)
+    pipeline.add_stage("check", check, after="background")
+    report = pipeline.start(number_of_spectra=200).join()
+    assert report['acquired'] == 200
+    assert seen == sorted(seen)
+    if on_full == 'block':
+        assert seen == list(range(200))
+    else:
+        assert len(seen) + report['stages']['check']['dropped'] == 200
+
+def test_timestamps_mark_end_of_read():
+    pipeline = AcquisitionPipeline(counting_reader(64, 0.01), 64)
+    stamps = []
+    def record(spectra, timestamps, first_index):
+        stamps.extend(timestamps)
+    pipeline.add_stage("record", record)
+    before = time.time()
+    pipeline.start(number_of_spectra=3).join()
+    # The first spectrum takes 10 ms to read and is stamped once it is complete
+    assert stamps[0] - before >= 0.009
+    assert np.all(np.diff(stamps) >= 0.009)
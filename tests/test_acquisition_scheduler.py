@@ -0,0 +1,44 @@
+import time
+import numpy as np
+import pytest
+from acquisition_scheduler import run_schedule
+
+def test_fires_on_fixed_grid():
+    schedule = run_schedule(lambda index: None, 0.01, number_of_acquisitions=10, verbose=False)
+    assert len(schedule['slot']) == 10
+    np.testing.assert_array_equal(schedule['slot'], np.arange(10))
+    np.testing.assert_allclose(np.diff(schedule['planned']), 0.01, atol=1e-6)
+    # Deadlines are absolute, so lateness does not grow along the run
+    assert np.all(schedule['lateness'] >= 0)
+    assert np.max(schedule['lateness']) < 0.005
+
+def test_duration_limit():
+    schedule = run_schedule(lambda index: None, 0.01, total_duration_seconds=0.05, verbose=False)
+    np.testing.assert_array_equal(schedule['slot'], np.arange(6))
+
+def test_overrun_skips_missed_slots():
+    def acquire(index):
+        if index == 1:
+            time.sleep(0.035)
+    schedule = run_schedule(acquire, 0.01, number_of_acquisitions=4, verbose=False)
+    assert schedule['overrun'][1]
+    assert schedule['skipped_slots'] == 3
+    np.testing.assert_array_equal(schedule['slot'], [0, 1, 5, 6])
+
+def test_overrun_catch_up_keeps_every_slot():
+    def acquire(index):
+        if index == 1:
+            time.sleep(0.035)
+    schedule = run_schedule(acquire, 0.01, number_of_acquisitions=5, on_overrun='catch_up', verbose=False)
+    np.testing.assert_array_equal(schedule['slot'], np.arange(5))
+    assert schedule['skipped_slots'] == 0
+
+def test_should_stop_and_argument_checks():
+    calls = []
+    schedule = run_schedule(calls.append, 0.005, should_stop=lambda: len(calls) >= 3, verbose=False)
+    assert calls == [0, 1, 2]
+    assert len(schedule['slot']) == 3
+    with pytest.raises(ValueError):
+        run_schedule(calls.append, 0.01)
+    with pytest.raises(ValueError):
+        run_schedule(calls.append, 0.01, number_of_acquisitions=1, on_overrun='queue')
@@ -0,0 +1,73 @@
+import h5py
+import numpy as np
+from auto_exposure import HIGH_FRACTION, HOLD_SPECTRA, LOW_FRACTION, AutoExposure, converge_integration_time
+from spectrometer_session import SpectrometerSession
+from spectrometer_simulator import SimulatedSpectrometer
+
+def simulated_session(seed=0):
+    # Peak of about 2000 counts per ms, so the band is reached near 25 ms
+    device = SimulatedSpectrometer(realtime=False, seed=seed)
+    return device, SpectrometerSession(device)
+
+def test_converges_from_short_and_long_starts():
+    for initial_integration_time_ms in (None, 200):
+        device, session = simulated_session()
+        result = converge_integration_time(session, initial_integration_time_ms)
+        assert result['converged']
+        assert LOW_FRACTION <= result['peak_fraction'] <= HIGH_FRACTION
+        assert 15 <= result['integration_time_ms'] <= 40
+        assert device.integration_micros == round(result['integration_time_ms'] * 1000)
+
+def test_stops_at_the_longest_allowed_time():
+    device, session = simulated_session()
+    device.signal_rate = device.signal_rate / 100
+    result = converge_integration_time(session, max_integration_time_ms=50)
+    assert not result['converged']
+    assert result['integration_time_ms'] == 50
+
+def test_holds_inside_the_band():
+    device, session = simulated_session()
+    controller = AutoExposure(session, 25)
+    bright = device.signal_rate.copy()
+    for index in range(3 * HOLD_SPECTRA):
+        # Brightness wandering by +-10% stays inside the band
+        device.signal_rate = bright * (1.1 if index % 2 else 0.9)
+        assert not controller.update(session.intensities(), timestamp=float(index))
+    assert controller.changes == []
+    assert controller.integration_time_ms == 25
+
+def test_follows_a_fading_source_after_the_hold():
+    device, session = simulated_session()
+    controller = AutoExposure(session, 25)
+    device.signal_rate = device.signal_rate / 3
+    changed = [controller.update(session.intensities()) for _ in range(HOLD_SPECTRA)]
+    assert changed == [False] * (HOLD_SPECTRA - 1) + [True]
+    assert 60 <= controller.integration_time_ms <= 90
+    assert device.integration_micros == controller.integration_time_micros
+    np.testing.assert_allclose(controller.scale_to_nominal(), 25 / controller.integration_time_ms)
+
+def test_saturated_spectrum_halves_at_once():
+    device, session = simulated_session()
+    controller = AutoExposure(session, 25)
+    device.signal_rate = device.signal_rate * 10
+    assert controller.update(session.intensities(), timestamp=5.0)
+    assert controller.integration_time_ms == 12.5
+    timestamp, spectrum_number, old_ms, new_ms, peak_fraction = controller.changes[0]
+    assert (timestamp, spectrum_number, old_ms, new_ms) == (5.0, 1, 25, 12.5)
+    assert peak_fraction >= 0.98
+
+def test_save_changes(tmp_path):
+    device, session = simulated_session()
+    controller = AutoExposure(session, 25)
+    device.signal_rate = device.signal_rate * 10
+    controller.update(session.intensities(), timestamp=1.0)
+    controller.update(session.intensities(), timestamp=2.0)
+    with h5py.File(tmp_path / "run.h5", "w") as file:
+        controller.save_changes(file)
+        # Saving again replaces the table rather than failing
+        controller.save_changes(file)
+        changes = file["exposure_changes"][:]
+        assert changes.shape == (2, 5)
+        np.testing.assert_array_equal(changes[:, 3], [12.5, 6.25])
+        assert file.attrs["nominal_integration_time_ms"] == 25
+        assert file.attrs["final_integration_time_ms"] == 6.25
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from dmd_demux import DISCARDED, MaskDemultiplexer, switching_timeline
+
+INTEGRATION_TIME_SECONDS = 0.003
+
+def demultiplexer(**options):
+    # Masks 0 and 1 alternate every 20 ms from t = 0; the last one goes off at 0.22 s
+    switch_times, states, end_time = switching_timeline(0.0, number_of_switches=10, display_period_seconds=0.020)
+    return MaskDemultiplexer(switch_times, states, INTEGRATION_TIME_SECONDS, end_time=end_time, **options)
+
+def test_end_stamped_windows():
+    # Stamped at 0.021 the exposure ran from 0.018 and saw the switch at 0.020
+    states = demultiplexer().classify([0.010, 0.021, 0.025, 0.039])
+    np.testing.assert_array_equal(states, [0, DISCARDED, 1, 1])
+
+def test_start_and_middle_stamped_windows():
+    states = demultiplexer(timestamp_position='start').classify([0.010, 0.018, 0.020, 0.0165])
+    np.testing.assert_array_equal(states, [0, DISCARDED, 1, 0])
+    states = demultiplexer(timestamp_position='middle').classify([0.010, 0.0195, 0.0225])
+    np.testing.assert_array_equal(states, [0, DISCARDED, 1])
+
+def test_guard_discards_exposures_while_the_mirrors_settle():
+    timestamps = [0.024, 0.026]
+    np.testing.assert_array_equal(demultiplexer().classify(timestamps), [1, 1])
+    # A 2 ms guard after the switch at 0.020 reaches into the exposure from 0.021
+    np.testing.assert_array_equal(demultiplexer(guard_seconds=0.002).classify(timestamps), [DISCARDED, 1])
+
+def test_exposures_outside_the_timeline_are_discarded():
+    states = demultiplexer().classify([0.002, 0.219, 0.221, 0.300])
+    np.testing.assert_array_equal(states, [DISCARDED, 0, DISCARDED, DISCARDED])
+
+def test_process_keeps_statistics_per_mask():
+    demux = demultiplexer()
+    timestamps = np.array([0.010, 0.015, 0.021, 0.030, 0.035, 0.050])
+    spectra = np.where(demux.classify(timestamps)[:, np.newaxis] == 1, 1500.0, 1000.0) + np.arange(4)
+    states = demux.process(spectra, timestamps)
+    np.testing.assert_array_equal(states, [0, 0, DISCARDED, 1, 1, 0])
+    assert demux.counts() == {0: 3, 1: 2, 'discarded': 1}
+    np.testing.assert_allclose(demux.averages()[0], 1000.0 + np.arange(4))
+    np.testing.assert_allclose(demux.averages()[1], 1500.0 + np.arange(4))
+
+def test_unknown_timestamp_position():
+    with pytest.raises(ValueError):
+        demultiplexer(timestamp_position='centre')
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from lockin_demodulation import StreamingLockIn, demodulate, sinusoidal_references
+
+def modulated_series(count=400, pixels=6, frequency_hz=3.3, seed=0):
+    # 2.6 periods over uneven timestamps, so the references are far from orthogonal
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(rng.uniform(0, 0.8, count))
+    in_phase, quadrature = sinusoidal_references(timestamps, frequency_hz)
+    amplitude_i = np.linspace(5, 30, pixels)
+    amplitude_q = np.linspace(-10, 10, pixels)
+    spectra = 1000 + np.outer(in_phase, amplitude_i) + np.outer(quadrature, amplitude_q) + rng.normal(0, 2, (count, pixels))
+    return timestamps, spectra, in_phase, quadrature, amplitude_i, amplitude_q
+
+def test_joint_fit_matches_lstsq():
+    timestamps, spectra, in_phase, quadrature, amplitude_i, amplitude_q = modulated_series()
+    # Frames dropped by the demultiplexer
+    in_phase = in_phase.copy()
+    in_phase[::7] = np.nan
+    result = demodulate(spectra, in_phase, quadrature)
+    keep = np.isfinite(in_phase)
+    design = np.column_stack([np.ones(keep.sum()), in_phase[keep], quadrature[keep]])
+    coefficients, residuals = np.linalg.lstsq(design, spectra[keep], rcond=None)[:2]
+    np.testing.assert_allclose(result['in_phase'], coefficients[1], rtol=1e-9)
+    np.testing.assert_allclose(result['quadrature'], coefficients[2], rtol=1e-9)
+    covariance = np.linalg.inv(design.T @ design)
+    errors = np.sqrt(np.outer(np.diag(covariance), residuals / (keep.sum() - 3)))
+    np.testing.assert_allclose(result['in_phase_error'], errors[1], rtol=1e-6)
+    np.testing.assert_allclose(result['quadrature_error'], errors[2], rtol=1e-6)
+    np.testing.assert_allclose(result['in_phase'], amplitude_i, atol=1)
+    np.testing.assert_allclose(result['quadrature'], amplitude_q, atol=1)
+    np.testing.assert_allclose(result['phase'], np.arctan2(result['quadrature'], result['in_phase']))
+
+def test_streaming_blocks_reproduce_the_batch_fit():
+    timestamps, spectra, in_phase, quadrature, amplitude_i, amplitude_q = modulated_series()
+    in_phase = in_phase.copy()
+    in_phase[::7] = np.nan
+    batch = demodulate(spectra, in_phase, quadrature)
+    lockin = StreamingLockIn(spectra.shape[1])
+    for start in range(0, len(timestamps), 37):
+        block = slice(start, start + 37)
+        lockin.update(spectra[block], in_phase[block], quadrature[block])
+    streamed = lockin.result()
+    assert streamed['count'] == batch['count']
+    for name in ('in_phase', 'quadrature', 'in_phase_error', 'quadrature_error', 'amplitude', 'phase'):
+        np.testing.assert_allclose(streamed[name], batch[name], rtol=1e-6)
+    np.testing.assert_allclose(streamed['mean'], np.mean(spectra[np.isfinite(in_phase)], axis=0))
+
+def test_streaming_stage_and_in_phase_only():
+    timestamps, spectra, in_phase, quadrature, amplitude_i, amplitude_q = modulated_series()
+    lockin = StreamingLockIn(spectra.shape[1])
+    process = lockin.stage(lambda t: sinusoidal_references(t, 3.3, start_time=timestamps[0]))
+    for start in range(0, len(timestamps), 50):
+        process(spectra[start:start + 50], timestamps[start:start + 50], start)
+    np.testing.assert_allclose(lockin.result()['quadrature'], demodulate(spectra, in_phase, quadrature)['quadrature'], rtol=1e-6)
+    in_phase_only = StreamingLockIn(spectra.shape[1])
+    in_phase_only.update(spectra, in_phase)
+    result = in_phase_only.result()
+    np.testing.assert_allclose(result['in_phase'], demodulate(spectra, in_phase)['in_phase'], rtol=1e-6)
+    assert 'quadrature' not in result
+    with pytest.raises(ValueError):
+        in_phase_only.update(spectra, in_phase, quadrature)
+
+def test_square_reference_gives_half_the_difference():
+    rng = np.random.default_rng(1)
+    reference = np.where(np.arange(300) % 10 < 5, 1.0, -1.0)
+    spectra = np.where(reference[:, np.newaxis] > 0, 120.0, 100.0) + rng.normal(0, 1, (300, 4))
+    result = demodulate(spectra, reference)
+    np.testing.assert_allclose(result['in_phase'], 10, atol=0.3)
+    assert 'quadrature' not in result
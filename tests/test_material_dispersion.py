@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from material_dispersion import load_material, refractive_index
+
+class FakeMaterial:
+    # The parts of a refractivesqlite Material that sample_material uses; range in um
+    def __init__(self, fail_at_nm=None):
+        self.pageinfo = {'hasrefractive': 1, 'hasextinction': 0, 'rangeMin': 0.4, 'rangeMax': 0.8}
+        self.fail_at_nm = fail_at_nm
+
+    def get_refractiveindex(self, wavelength_nm):
+        if not 0.4 <= wavelength_nm / 1000 <= 0.8:
+            raise Exception("Wavelength out of bounds")
+        if wavelength_nm == self.fail_at_nm:
+            raise OSError("database read failed")
+        return 1.5 - 1e-4 * (wavelength_nm - 400)
+
+class FakeDatabase:
+    def __init__(self, material):
+        self.material = material
+        self.requested = []
+
+    def get_material(self, material_id):
+        self.requested.append(material_id)
+        return self.material
+
+def test_samples_only_inside_the_page_range(tmp_path):
+    database = FakeDatabase(FakeMaterial())
+    data = load_material(90001, database, str(tmp_path), np.arange(300.0, 901.0, 50.0))
+    inside = (data['wavelengths_nm'] >= 400) & (data['wavelengths_nm'] <= 800)
+    assert np.all(np.isfinite(data['n'][inside])) and np.all(np.isnan(data['n'][~inside]))
+    np.testing.assert_array_equal(data['k'][inside], 0.0)
+    assert np.isnan(refractive_index(90001, 350.0, database=database, cache_directory=str(tmp_path),
+                                     wavelengths_nm=np.arange(300.0, 901.0, 50.0)))
+
+def test_lookup_errors_propagate_and_are_not_cached(tmp_path):
+    with pytest.raises(OSError):
+        load_material(90002, FakeDatabase(FakeMaterial(fail_at_nm=600.0)), str(tmp_path), np.arange(400.0, 801.0, 50.0))
+    assert not (tmp_path / "material_90002.npz").exists()
+
+def test_memo_is_keyed_on_cache_and_grid(tmp_path):
+    database = FakeDatabase(FakeMaterial())
+    coarse = load_material(90003, database, str(tmp_path / "a"), np.arange(400.0, 801.0, 100.0))
+    fine = load_material(90003, database, str(tmp_path / "a"), np.arange(400.0, 801.0, 10.0))
+    other_cache = load_material(90003, database, str(tmp_path / "b"), np.arange(400.0, 801.0, 100.0))
+    assert len(coarse['n']) == 5 and len(fine['n']) == 41 and len(other_cache['n']) == 5
+    assert database.requested == [90003] * 3
+    assert load_material(90003, database, str(tmp_path / "a"), np.arange(400.0, 801.0, 100.0)) is coarse
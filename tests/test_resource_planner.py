@@ -0,0 +1,15 @@
+import json
+import os
+from resource_planner import calibrate_model
+
+def test_calibration_is_cached_until_the_history_changes(tmp_path, capsys):
+    path = str(tmp_path / "solver_history.jsonl")
+    with open(path, "w") as file:
+        file.write(json.dumps({'backend': 'ModeSolverFD', 'Nx': 60, 'NoModes': 4, 'wall_s': 3.0}) + "\n")
+    first = calibrate_model(path)
+    assert calibrate_model(path) is first
+    assert capsys.readouterr().out.count("Calibrated") == 1
+    modified = os.path.getmtime(path) + 10
+    os.utime(path, (modified, modified))
+    assert calibrate_model(path) is not first
+    assert capsys.readouterr().out.count("Calibrated") == 1
@@ -0,0 +1,43 @@
+import numpy as np
+from spectra_statistics import RunningSpectrumStats, intensity_rows, stats_from_spectra
+
+def seabreeze_spectra(number_of_spectra=6, number_of_pixels=32, seed=0):
+    # What Spectrometer.spectrum() returns: np.vstack([wavelengths, intensities])
+    rng = np.random.default_rng(seed)
+    wavelengths = np.linspace(340, 1030, number_of_pixels)
+    intensities = rng.normal(1000, 20, (number_of_spectra, number_of_pixels))
+    return wavelengths, intensities, [np.vstack([wavelengths, row]) for row in intensities]
+
+def test_stats_from_bare_spectrum_arrays():
+    wavelengths, intensities, spectra = seabreeze_spectra()
+    stats = stats_from_spectra(spectra)
+    np.testing.assert_allclose(stats.mean, intensities.mean(axis=0))
+
+def test_stats_from_wavelength_spectrum_pairs():
+    wavelengths, intensities, spectra = seabreeze_spectra()
+    stats = stats_from_spectra([(wavelengths, spectrum) for spectrum in spectra])
+    np.testing.assert_allclose(stats.mean, intensities.mean(axis=0))
+    np.testing.assert_allclose(stats.std, intensities.std(axis=0, ddof=1))
+
+def test_stats_from_intensity_rows():
+    wavelengths, intensities, spectra = seabreeze_spectra()
+    for source in (list(intensities), [(wavelengths, row) for row in intensities]):
+        np.testing.assert_allclose(stats_from_spectra(source).mean, intensities.mean(axis=0))
+    assert stats_from_spectra([]) is None
+    assert len(intensity_rows(spectra)) == len(spectra)
+
+def test_single_and_block_updates_agree():
+    wavelengths, intensities, spectra = seabreeze_spectra(number_of_spectra=50)
+    single = RunningSpectrumStats(ewm_alpha=0.2)
+    for row in intensities:
+        single.update(row)
+    blocks = RunningSpectrumStats(ewm_alpha=0.2)
+    for start in range(0, 50, 7):
+        blocks.update_many(intensities[start:start + 7])
+    for stats in (single, blocks):
+        assert stats.count == 50
+        np.testing.assert_allclose(stats.mean, intensities.mean(axis=0))
+        np.testing.assert_allclose(stats.variance, intensities.var(axis=0, ddof=1))
+        np.testing.assert_array_equal(stats.minimum, intensities.min(axis=0))
+        np.testing.assert_array_equal(stats.maximum, intensities.max(axis=0))
+    np.testing.assert_allclose(blocks.ewm, single.ewm)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+import h5py
+from spectra_writer import SpectraWriter, read_saturated, read_spectra
+
+def test_append_round_trip(tmp_path):
+    path = str(tmp_path / "spectra.h5")
+    wavelengths = np.linspace(400, 900, 16)
+    spectra = np.arange(5 * 16, dtype=float).reshape(5, 16)
+    with SpectraWriter(path, wavelengths, chunk_spectra=2) as writer:
+        for i, intensities in enumerate(spectra):
+            writer.append(intensities, 100.0 + i)
+        assert len(writer) == 5
+    stored_wavelengths, stored_spectra, timestamps = read_spectra(path)
+    np.testing.assert_array_equal(stored_wavelengths, wavelengths)
+    np.testing.assert_array_equal(stored_spectra, spectra)
+    np.testing.assert_array_equal(timestamps, 100.0 + np.arange(5))
+
+def test_append_rejects_seabreeze_spectrum(tmp_path):
+    # spectrum() returns wavelengths and intensities stacked; only intensities() rows fit
+    wavelengths = np.linspace(400, 900, 16)
+    with SpectraWriter(str(tmp_path / "spectra.h5"), wavelengths) as writer:
+        with pytest.raises(ValueError):
+            writer.append(np.vstack([wavelengths, np.ones(16)]))
+
+def test_reopen_continues_after_stored_rows(tmp_path):
+    path = str(tmp_path / "spectra.h5")
+    wavelengths = np.linspace(400, 900, 8)
+    with SpectraWriter(path, wavelengths) as writer:
+        writer.append_many(np.zeros((3, 8)), np.arange(3.0))
+    with SpectraWriter(path, wavelengths) as writer:
+        writer.append(np.ones(8), 3.0)
+    stored_spectra, timestamps = read_spectra(path)[1:]
+    assert stored_spectra.shape == (4, 8)
+    np.testing.assert_array_equal(timestamps, np.arange(4.0))
+
+def test_saturated_flags_follow_their_rows(tmp_path):
+    path = str(tmp_path / "spectra.h5")
+    wavelengths = np.linspace(400, 900, 8)
+    with SpectraWriter(path, wavelengths, chunk_spectra=2) as writer:
+        for i in range(5):
+            writer.append(np.full(8, float(i)), float(i), saturated=i == 3)
+        writer.append_many(np.zeros((2, 8)), [5.0, 6.0], [True, False])
+    np.testing.assert_array_equal(read_saturated(path), [False, False, False, True, False, True, False])
+    np.testing.assert_array_equal(read_saturated(path, 3, 5), [True, False])
+
+def test_reopen_file_without_saturated_flags(tmp_path):
+    # Files streamed before rows were flagged have no saturated dataset
+    path = str(tmp_path / "spectra.h5")
+    wavelengths = np.linspace(400, 900, 8)
+    with SpectraWriter(path, wavelengths) as writer:
+        writer.append_many(np.zeros((3, 8)), np.arange(3.0))
+    with h5py.File(path, "a") as file:
+        del file["saturated"]
+    np.testing.assert_array_equal(read_saturated(path), [False] * 3)
+    with SpectraWriter(path, wavelengths) as writer:
+        writer.append(np.ones(8), 3.0, saturated=True)
+    np.testing.assert_array_equal(read_saturated(path), [False, False, False, True])
+
+def test_record_spectra_streams_intensities(tmp_path):
+    pytest.importorskip("seabreeze")
+    import SpectrometerTimelapse_NoGUI as timelapse
+    from spectrometer_session import SpectrometerSession
+    from spectrometer_simulator import SimulatedSpectrometer
+    session = SpectrometerSession(SimulatedSpectrometer(seed=0))
+    path = str(tmp_path / "run.h5")
+    with SpectraWriter(path, session.wavelengths()) as writer:
+        timelapse.record_spectra(session, 0.02, 5000, 0.1, np.zeros(session.pixels), writer)
+    stored_spectra = read_spectra(path)[1]
+    assert stored_spectra.shape[1] == session.pixels
+    assert len(stored_spectra) >= 4
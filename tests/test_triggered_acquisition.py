@@ -0,0 +1,39 @@
+import h5py
+import numpy as np
+import pytest
+from spectrometer_session import SpectrometerSession
+from spectrometer_simulator import SimulatedSpectrometer
+from triggered_acquisition import TRIGGER_MODES, acquire_burst, save_burst
+
+def test_burst_restores_free_running_mode():
+    device = SimulatedSpectrometer(number_of_pixels=64, trigger_period_seconds=0.005, realtime=False, seed=0)
+    session = SpectrometerSession(device)
+    burst = acquire_burst(session, 4, 1, 'external_edge', scans_to_average=2)
+    assert burst['count'] == 4
+    assert device.mode == TRIGGER_MODES['normal']
+    assert device.scans == 1
+    assert burst['restored_trigger_mode'] == TRIGGER_MODES['normal']
+
+def test_burst_restores_mode_after_error():
+    device = SimulatedSpectrometer(number_of_pixels=64, trigger_period_seconds=0.005, realtime=False, seed=0)
+    session = SpectrometerSession(device)
+    session.trigger_mode(TRIGGER_MODES['software'])
+    with pytest.raises(ValueError):
+        # Rows of the wrong width make the first read fail
+        acquire_burst(session, 2, 1, burst={'intensities': np.zeros((2, 3)), 'trigger_index': np.zeros(2, dtype=np.int64),
+                                            'timestamps': np.zeros(2), 'count': 0})
+    assert device.mode == TRIGGER_MODES['software']
+
+def test_burst_without_trigger_period_is_marked_unreliable(tmp_path, capsys):
+    device = SimulatedSpectrometer(number_of_pixels=64, trigger_period_seconds=0.005, realtime=False, seed=0)
+    session = SpectrometerSession(device)
+    burst = acquire_burst(session, 3, 1, 'external_edge')
+    assert not burst['trigger_index_reliable']
+    assert "missed triggers cannot be detected" in capsys.readouterr().out
+    assert acquire_burst(session, 3, 1, 'external_edge', trigger_period_seconds=0.005)['trigger_index_reliable']
+    # Software triggers come from the reads themselves, so none can be missed
+    assert acquire_burst(session, 3, 1, 'software')['trigger_index_reliable']
+    path = str(tmp_path / "bursts.h5")
+    name = save_burst(path, burst)
+    with h5py.File(path, "r") as file:
+        assert not file[name].attrs["trigger_index_reliable"]
@@ -0,0 +1,121 @@
+import time
+import h5py
+import numpy as np
+from spectrometer_session import SpectrometerSession
+
+# seabreeze trigger mode numbers for the FLAME / USB4000 family; other models number them differently
+TRIGGER_MODES = {
+    'normal': 0,
+    'software': 1,
+    'external_level': 2,
+    'external_synchronization': 3,
+    'external_edge': 4,
+}
+EXTERNAL_TRIGGER_MODES = ('external_level', 'external_synchronization', 'external_edge')
+DMD_FRAME_PERIOD_SECONDS = 0.020
+
+def allocate_burst(number_of_spectra, number_of_pixels):
+    return {
+        'intensities': np.zeros((number_of_spectra, number_of_pixels)),
+        'trigger_index': np.zeros(number_of_spectra, dtype=np.int64),
+        'timestamps': np.zeros(number_of_spectra),
+        'count': 0,
+    }
+
+def acquire_burst(session, number_of_spectra, integration_time_ms, trigger_mode='external_edge', scans_to_average=1,
+                  trigger_period_seconds=None, burst=None, first_trigger_index=0):
+    # Each read blocks until the device has integrated on the next trigger edge(s), so the
+    # loop only copies into preallocated rows. With scans_to_average > 1 one spectrum spans
+    # that many triggers; it is averaged on the device when the model supports it.
+    # Spectra are tagged with the index of their first trigger; given the trigger period,
+    # gaps between deliveries reveal triggers that arrived while the device was busy.
+    # Without the period a missed external trigger goes unnoticed and shifts every later
+    # index, so such bursts are marked trigger_index_reliable = False.
+    # The trigger mode and averaging in force before the burst are restored afterwards,
+    # even on error, or the next free-running read would wait for a trigger.
+    mode = TRIGGER_MODES.get(trigger_mode, trigger_mode)
+    trigger_index_reliable = bool(trigger_period_seconds) or mode not in [TRIGGER_MODES[name] for name in EXTERNAL_TRIGGER_MODES]
+    if not trigger_index_reliable:
+        print(f"Warning: no trigger_period_seconds for {trigger_mode} triggering; missed triggers cannot be detected "
+              f"and trigger indices after one would be shifted")
+    restore_trigger_mode = TRIGGER_MODES['normal'] if session.current_trigger_mode is None else session.current_trigger_mode
+    restore_scans_to_average = session.current_scans_to_average or 1
+    if burst is None:
+        burst = allocate_burst(number_of_spectra, session.pixels)
+    try:
+        session.integration_time_ms(integration_time_ms)
+        session.trigger_mode(mode)
+        on_device = session.scans_to_average(scans_to_average)
+        reads = 1 if on_device else scans_to_average
+        scratch = np.empty(session.pixels)
+        epoch_offset = time.time() - time.perf_counter()
+        trigger_index = first_trigger_index
+        previous = None
+        for i in range(number_of_spectra):
+            row = burst['intensities'][i]
+            session.read_into(row)
+            for scan in range(1, reads):
+                row += session.read_into(scratch)
+            if reads > 1:
+                row /= reads
+            delivered = time.perf_counter()
+            if previous is not None:
+                triggers_per_spectrum = scans_to_average
+                if trigger_period_seconds:
+                    triggers_per_spectrum = max(int(round((delivered - previous) / trigger_period_seconds)), 1)
+                trigger_index += triggers_per_spectrum
+            previous = delivered
+            burst['trigger_index'][i] = trigger_index
+            burst['timestamps'][i] = delivered + epoch_offset
+            burst['count'] = i + 1
+    finally:
+        session.trigger_mode(restore_trigger_mode)
+        session.scans_to_average(restore_scans_to_average)
+    burst['restored_trigger_mode'] = restore_trigger_mode
+    burst['scans_to_average'] = scans_to_average
+    burst['on_device_averaging'] = on_device
+    burst['trigger_mode'] = trigger_mode
+    burst['trigger_index_reliable'] = trigger_index_reliable
+    expected = first_trigger_index + (number_of_spectra - 1) * scans_to_average
+    missed = int(burst['trigger_index'][burst['count'] - 1] - expected) if burst['count'] else 0
+    if missed > 0:
+        print(f"Burst skipped {missed} trigger(s): the device was still reading when they arrived")
+    return burst
+
+def save_burst(path, burst, name=None, attributes=None):
+    with h5py.File(path, "a") as file:
+        if name is None:
+            name = f"burst_{len([key for key in file if key.startswith('burst_')]) + 1:03d}"
+        group = file.create_group(name)
+        count = burst['count']
+        group.create_dataset("intensities", data=burst['intensities'][:count], compression="gzip", shuffle=True)
+        group.create_dataset("trigger_index", data=burst['trigger_index'][:count])
+        group.create_dataset("timestamps", data=burst['timestamps'][:count])
+        group.attrs["scans_to_average"] = burst['scans_to_average']
+        group.attrs["on_device_averaging"] = burst['on_device_averaging']
+        group.attrs["trigger_mode"] = str(burst['trigger_mode'])
+        group.attrs["restored_trigger_mode"] = burst['restored_trigger_mode']
+        group.attrs["trigger_index_reliable"] = burst['trigger_index_reliable']
+        for key, value in (attributes or {}).items():
+            group.attrs[key] = value
+    print(f"Saved {count} triggered spectra to {path}/{name}")
+    return name
+
+def frame_states(trigger_index, number_of_masks=2, frames_per_mask=1, first_mask=0):
+    # DMD mask shown on each trigger when the masks cycle every frames_per_mask frames
+    # (once per frame in switching.py); averaged spectra need frames_per_mask = scans_to_average
+    return (np.asarray(trigger_index) // frames_per_mask + first_mask) % number_of_masks
+
+def main():
+    from spectrometer_simulator import SimulatedSpectrometer
+    device = SimulatedSpectrometer(trigger_period_seconds=DMD_FRAME_PERIOD_SECONDS, seed=0)
+    session = SpectrometerSession(device)
+    for integration_time_ms, scans_to_average in ((15, 1), (15, 4), (19.9, 1)):
+        burst = acquire_burst(session, 50, integration_time_ms, 'external_edge', scans_to_average,
+                              trigger_period_seconds=DMD_FRAME_PERIOD_SECONDS)
+        states = frame_states(burst['trigger_index'], frames_per_mask=scans_to_average)
+        print(f"{integration_time_ms} ms x{scans_to_average}: triggers {burst['trigger_index'][0]}-{burst['trigger_index'][-1]}, "
+              f"{np.sum(states == 0)} spectra on mask 0, {np.sum(states == 1)} on mask 1")
+
+if __name__ == "__main__":
+    main()